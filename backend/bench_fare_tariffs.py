@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Benchmark for the compiled tariff engine
+
+Compares the per-quote cost of the compiled integer (paisa) tariffs with
+the Decimal pricing FareCalculationService used before tariffs moved to
+the database, on the same trips. Runs offline against the default rates:
+
+    python bench_fare_tariffs.py [quotes]
+"""
+
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
+
+import django
+
+django.setup()
+
+from rides.services import FareCalculationService
+from rides.tariffs import compile_tariffs
+
+RIDE_TYPES = ['standard', 'premium', 'luxury', 'shared']
+
+
+def decimal_quote(distance_km, ride_type, hour, surge_multiplier):
+    """The previous hardcoded Decimal pricing, kept here as the baseline"""
+    service = FareCalculationService
+    base_fare = service.BASE_FARE
+    distance_fare = distance_km * service.RATE_PER_KM
+    estimated_minutes = distance_km * 3
+    time_fare = estimated_minutes * service.RATE_PER_MINUTE
+    subtotal = base_fare + distance_fare + time_fare
+    ride_multiplier = service.RIDE_TYPE_MULTIPLIERS.get(ride_type, Decimal('1.0'))
+    subtotal *= ride_multiplier
+    if surge_multiplier > 1.0:
+        subtotal *= Decimal(str(surge_multiplier))
+    if hour is not None:
+        if (7 <= hour <= 9) or (17 <= hour <= 20):
+            subtotal *= Decimal('1.3')
+        elif hour >= 22 or hour <= 5:
+            subtotal *= Decimal('1.2')
+    return {
+        'base_fare': float(base_fare),
+        'distance_fare': float(distance_fare),
+        'time_fare': float(time_fare),
+        'distance_km': float(distance_km),
+        'estimated_minutes': float(estimated_minutes),
+        'ride_type_multiplier': float(ride_multiplier),
+        'surge_multiplier': surge_multiplier,
+        'total_fare': float(subtotal)
+    }
+
+
+def synthetic_trips(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (
+            Decimal(f"{rng.uniform(0.5, 40):.2f}"),
+            rng.choice(RIDE_TYPES),
+            rng.randrange(24),
+            rng.choice([1.0, 1.0, 1.0, 1.2, 1.5, 2.0]),
+        )
+        for _ in range(count)
+    ]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    quotes = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    trips = synthetic_trips(quotes)
+    tariffs = compile_tariffs()
+    city = tariffs.city_for(27.7172, 85.3240)
+
+    baseline, decimal_time = timed(lambda: [decimal_quote(*trip) for trip in trips], 3)
+    compiled, compiled_time = timed(
+        lambda: [
+            tariffs.quote(distance, ride_type, city, hour, surge)
+            for distance, ride_type, hour, surge in trips
+        ],
+        3
+    )
+    batches = {}
+    for distance, ride_type, hour, surge in trips:
+        batches.setdefault(hour, []).append((distance, ride_type, surge))
+    _, vector_time = timed(
+        lambda: [
+            tariffs.quote_many(
+                [trip[0] for trip in batch], [trip[1] for trip in batch], [city] * len(batch),
+                hour=hour, surge_multipliers=[trip[2] for trip in batch]
+            )
+            for hour, batch in batches.items()
+        ],
+        3
+    )
+    _, compile_time = timed(compile_tariffs, 20)
+
+    worst = max(abs(old['total_fare'] - new['total_fare']) for old, new in zip(baseline, compiled))
+    assert worst <= 0.02, f"Compiled tariffs drifted from the Decimal fares by {worst:.4f}"
+
+    print("Fare Tariff Benchmark")
+    print("=" * 50)
+    print(f"Quotes: {quotes:,}")
+    print(f"Decimal pricing:   {decimal_time * 1e6 / quotes:8.2f} µs/quote")
+    print(f"Compiled tariffs:  {compiled_time * 1e6 / quotes:8.2f} µs/quote "
+          f"({decimal_time / compiled_time:.1f}x)")
+    print(f"Compiled, batched: {vector_time * 1e6 / quotes:8.2f} µs/quote "
+          f"({decimal_time / vector_time:.1f}x)")
+    print(f"Compile default tariffs: {compile_time * 1000:.3f} ms")
+    print(f"✅ Largest difference from the Decimal fares: {worst:.4f} NPR (rounding to the paisa)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Benchmark for the JSON codec (rideshare/json_codec.py)
+
+Serializes pages of rides with RideSerializer, then times rendering them
+with DRF's JSONRenderer against FastJSONRenderer, parsing them back with
+DRF's JSONParser against FastJSONParser, and encoding WebSocket events.
+Creates its rides in a throwaway in-memory database:
+
+    python bench_json_codec.py [rides]
+"""
+
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
+
+import django
+
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from rideshare import json_codec
+from rideshare.json_codec import FastJSONParser, FastJSONRenderer
+
+
+def create_rides(count, seed=0):
+    from accounts.models import User
+    from drivers.models import Driver, Vehicle
+    from rides.models import Ride
+
+    rng = random.Random(seed)
+    riders = [
+        User.objects.create_user(
+            username=f'+9779700{i:06d}', phone_number=f'+9779700{i:06d}', email=f'rider{i}@example.com',
+            password='x', first_name='Rider', last_name=str(i), user_type='rider'
+        )
+        for i in range(20)
+    ]
+    drivers = []
+    for i in range(20):
+        user = User.objects.create_user(
+            username=f'+9779800{i:06d}', phone_number=f'+9779800{i:06d}', email=f'driver{i}@example.com',
+            password='x', first_name='Driver', last_name=str(i), user_type='driver'
+        )
+        driver = Driver.objects.create(
+            user=user, license_number=f'L{i}', license_expiry=date(2030, 1, 1), is_verified=True,
+            current_latitude=Decimal('27.7'), current_longitude=Decimal('85.3')
+        )
+        Vehicle.objects.create(
+            driver=driver, make='Toyota', model='Corolla', year=2020, color='White', license_plate=f'BA-{i}',
+            vehicle_type='sedan', registration_number=f'R{i}', insurance_expiry=date(2030, 1, 1)
+        )
+        drivers.append(driver)
+
+    now = timezone.now()
+    Ride.objects.bulk_create([
+        Ride(
+            rider=rng.choice(riders), driver=rng.choice(drivers),
+            pickup_latitude=Decimal(f'{27.6 + rng.random() * 0.2:.6f}'),
+            pickup_longitude=Decimal(f'{85.2 + rng.random() * 0.2:.6f}'),
+            pickup_address='Thamel, Kathmandu',
+            destination_latitude=Decimal(f'{27.6 + rng.random() * 0.2:.6f}'),
+            destination_longitude=Decimal(f'{85.2 + rng.random() * 0.2:.6f}'),
+            destination_address='Patan Durbar Square, Lalitpur',
+            fare=Decimal(f'{rng.uniform(100, 900):.2f}'), distance=Decimal(f'{rng.uniform(1, 20):.2f}'),
+            status='completed', started_at=now, completed_at=now + timedelta(minutes=rng.randint(5, 60)),
+            rating_by_rider=rng.randint(1, 5),
+        )
+        for _ in range(count)
+    ])
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+    from rides.models import Ride
+    from rides.serializers import RideSerializer
+
+    create_rides(count)
+    rides = Ride.objects.select_related('rider', 'driver__user', 'ride_request').prefetch_related('driver__vehicles')
+    payloads = {
+        'page of 20': RideSerializer(rides[:20], many=True).data,
+        f'list of {count}': RideSerializer(rides, many=True).data,
+    }
+    event = {
+        'type': 'notification', 'notification_type': 'status_update', 'timestamp': timezone.now(),
+        'data': {'ride_id': Ride.objects.values_list('id', flat=True).first(), 'fare': Decimal('412.50')},
+    }
+
+    drf_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+    drf_parser, fast_parser = JSONParser(), FastJSONParser()
+
+    print("JSON Codec Benchmark")
+    print("=" * 70)
+    print(f"Backend: {json_codec.BACKEND}")
+    for label, data in payloads.items():
+        repeat = max(5, 20000 // len(data))
+        body, drf_render = timed(lambda: drf_renderer.render(data), repeat)
+        fast_body, fast_render = timed(lambda: fast_renderer.render(data), repeat)
+        assert body == fast_body, "Renderers disagree"
+        _, drf_parse = timed(lambda: drf_parser.parse(io.BytesIO(body)), repeat)
+        _, fast_parse = timed(lambda: fast_parser.parse(io.BytesIO(body)), repeat)
+        print(f"RideSerializer {label} ({len(body) / 1024:.1f} KiB)")
+        print(f"  render  DRF {drf_render * 1e3:8.3f} ms  fast {fast_render * 1e3:8.3f} ms  "
+              f"{drf_render / fast_render:5.1f}x")
+        print(f"  parse   DRF {drf_parse * 1e3:8.3f} ms  fast {fast_parse * 1e3:8.3f} ms  "
+              f"{drf_parse / fast_parse:5.1f}x")
+
+    import json
+    from rest_framework.utils.encoders import JSONEncoder
+    _, stdlib_event = timed(lambda: json.dumps(event, cls=JSONEncoder), 20000)
+    _, fast_event = timed(lambda: json_codec.dumps_text(event), 20000)
+    print(f"WebSocket event  stdlib {stdlib_event * 1e6:6.2f} µs  fast {fast_event * 1e6:6.2f} µs  "
+          f"{stdlib_event / fast_event:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark for compact ride track storage
+
+Compares the encoded RideTrack blob against per-point RideLocation rows
+and measures encode/decode speed. Runs offline on synthetic GPS tracks:
+
+    python bench_track_storage.py [points_per_ride] [rides]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
+
+import django
+
+django.setup()
+
+from django.utils import timezone
+
+from rides.services import RideTrackService
+from rides.track_encoding import decode_track, encode_track
+
+# Rough on-disk size of one RideLocation row in SQLite/PostgreSQL: row header,
+# id, ride uuid, two numeric(9,6), timestamp, numeric(5,2) and index entries
+ROW_BYTES_ESTIMATE = 90
+
+
+def synthetic_track(points, seed=0):
+    """A drive through Kathmandu with a ping every ~2 seconds"""
+    rng = random.Random(seed)
+    latitude, longitude = 27.7172, 85.3240
+    heading_lat, heading_lng = 0.00008, 0.00006
+    timestamp = timezone.now()
+    track = []
+    for _ in range(points):
+        heading_lat += rng.uniform(-0.00002, 0.00002)
+        heading_lng += rng.uniform(-0.00002, 0.00002)
+        latitude += heading_lat
+        longitude += heading_lng
+        timestamp += timedelta(milliseconds=rng.randint(1800, 2500))
+        speed = round(rng.uniform(0, 60), 2) if rng.random() > 0.05 else None
+        track.append((
+            Decimal(f"{latitude:.6f}"),
+            Decimal(f"{longitude:.6f}"),
+            timestamp,
+            Decimal(f"{speed:.2f}") if speed is not None else None,
+        ))
+    return track
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    rides = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    tracks = [synthetic_track(points, seed) for seed in range(rides)]
+
+    blobs, encode_time = timed(lambda: [encode_track(track) for track in tracks], 3)
+    decoded, decode_time = timed(lambda: [decode_track(blob) for blob in blobs], 3)
+    _, serialize_time = timed(lambda: [RideTrackService.serialize_points(track) for track in decoded], 3)
+
+    for original, result in zip(tracks, decoded):
+        for before, after in zip(original, result):
+            assert before[:2] == after[:2] and before[3] == after[3], "Track did not round-trip"
+            assert abs((before[2] - after[2]).total_seconds()) < 0.001, "Timestamp did not round-trip"
+
+    total_points = points * rides
+    blob_bytes = sum(len(blob) for blob in blobs)
+    json_bytes = sum(len(json.dumps(RideTrackService.serialize_points(track))) for track in decoded)
+
+    print("Ride Track Storage Benchmark")
+    print("=" * 50)
+    print(f"Rides: {rides}, points per ride: {points}")
+    print(f"RideLocation rows (est.): {total_points * ROW_BYTES_ESTIMATE / 1024:10.1f} KiB")
+    print(f"JSON API payload:         {json_bytes / 1024:10.1f} KiB")
+    print(f"Encoded tracks:           {blob_bytes / 1024:10.1f} KiB "
+          f"({blob_bytes / total_points:.2f} bytes/point)")
+    print(f"Encode: {encode_time * 1000:8.2f} ms total, {total_points / encode_time:12,.0f} points/s")
+    print(f"Decode: {decode_time * 1000:8.2f} ms total, {total_points / decode_time:12,.0f} points/s")
+    print(f"Decode + serialize: {(decode_time + serialize_time) * 1000:8.2f} ms total")
+    print("✅ All tracks round-tripped exactly")
+
+
+if __name__ == '__main__':
+    main()
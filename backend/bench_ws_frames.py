@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark for WebSocket frame formats
+
+Compares JSON text frames (rideshare/json_codec.py) with the binary
+subprotocol (rides/ws_protocol.py) for location_update and status_update
+messages: bytes per frame, decoding client frames (ingest) and encoding
+server frames (fan-out). Runs offline:
+
+    python bench_ws_frames.py [frames]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
+
+import django
+
+django.setup()
+
+from django.utils import timezone
+
+from rides import ws_protocol
+from rideshare import json_codec
+
+
+def sample_positions(count, seed=0):
+    rng = random.Random(seed)
+    now = timezone.now()
+    return [
+        (round(27.6 + rng.random() * 0.2, 6), round(85.2 + rng.random() * 0.2, 6), round(rng.random() * 60, 1), now)
+        for _ in range(count)
+    ]
+
+
+def timed(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    positions = sample_positions(count)
+    statuses = [(random.choice(ws_protocol.STATUSES), timezone.now()) for _ in range(count)]
+
+    def location_json(position):
+        latitude, longitude, speed, timestamp = position
+        return json_codec.dumps_text({
+            'type': 'location_update', 'latitude': latitude, 'longitude': longitude,
+            'speed': speed, 'timestamp': timestamp.isoformat()
+        })
+
+    def status_json(status):
+        return json_codec.dumps_text({'type': 'status_update', 'status': status[0], 'timestamp': status[1].isoformat()})
+
+    formats = {
+        'location_update': (
+            positions, location_json, lambda position: ws_protocol.encode_location(*position)
+        ),
+        'status_update': (
+            statuses, status_json, lambda status: ws_protocol.encode_status(*status)
+        ),
+    }
+
+    print("WebSocket Frame Benchmark")
+    print("=" * 70)
+    print(f"{'':16} {'format':7} {'bytes':>7} {'encode µs':>10} {'decode µs':>10}")
+    for message, (items, encode_json, encode_binary) in formats.items():
+        text_frames = [encode_json(item) for item in items]
+        binary_frames = [encode_binary(item) for item in items]
+        results = {
+            'json': (
+                sum(len(frame.encode()) for frame in text_frames) / count,
+                timed(encode_json, items),
+                timed(json_codec.loads, text_frames),
+            ),
+            'binary': (
+                sum(len(frame) for frame in binary_frames) / count,
+                timed(encode_binary, items),
+                timed(ws_protocol.decode, binary_frames),
+            ),
+        }
+        for name, (size, encode_seconds, decode_seconds) in results.items():
+            print(f"{message:16} {name:7} {size:7.1f} {encode_seconds * 1e6:10.2f} {decode_seconds * 1e6:10.2f}")
+        (json_size, json_encode, json_decode), (binary_size, binary_encode, binary_decode) = results.values()
+        print(
+            f"{'':16} {'saved':7} {1 - binary_size / json_size:7.0%} "
+            f"{1 - binary_encode / json_encode:10.0%} {1 - binary_decode / json_decode:10.0%}"
+        )
+    print("Fan-out encodes each broadcast once per format, not once per subscriber")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,67 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from rides.models import RideRequest
+from rides.testing import RideshareTestCase, make_driver, make_user
+
+NEARBY_REQUESTS_URL = '/api/drivers/drivers/nearby_requests/'
+
+
+def make_ride_request(rider, latitude, longitude, status='pending', expires_in=timedelta(minutes=10)):
+    return RideRequest.objects.create(
+        rider=rider, status=status, expires_at=timezone.now() + expires_in,
+        pickup_address='Pickup', pickup_latitude=Decimal(latitude), pickup_longitude=Decimal(longitude),
+        destination_address='Patan', destination_latitude=Decimal('27.673'), destination_longitude=Decimal('85.325'),
+    )
+
+
+class NearbyRequestsTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver(1, '27.717', '85.324')
+        self.rider = make_user(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.driver.user)
+
+    def test_lists_pending_requests_nearest_first(self):
+        farther = make_ride_request(self.rider, '27.700', '85.300')
+        nearer = make_ride_request(self.rider, '27.715', '85.312')
+        make_ride_request(self.rider, '27.716', '85.320', status='accepted')
+        make_ride_request(self.rider, '27.716', '85.320', expires_in=timedelta(minutes=-1))
+        make_ride_request(self.rider, '28.209', '83.985')  # Pokhara
+
+        response = self.client.get(NEARBY_REQUESTS_URL, {'radius': 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data], [str(nearer.id), str(farther.id)])
+        self.assertLess(response.data[0]['pickup_distance_km'], response.data[1]['pickup_distance_km'])
+        self.assertLessEqual(response.data[1]['pickup_distance_km'], 5)
+
+    def test_radius_limits_results(self):
+        make_ride_request(self.rider, '27.700', '85.300')
+
+        response = self.client.get(NEARBY_REQUESTS_URL, {'radius': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_rejects_invalid_radius(self):
+        for radius in ('far', '0', '-3', '50.5'):
+            response = self.client.get(NEARBY_REQUESTS_URL, {'radius': radius})
+            self.assertEqual(response.status_code, 400, radius)
+
+    def test_requires_driver_location(self):
+        self.driver.current_latitude = self.driver.current_longitude = None
+        self.driver.save()
+
+        response = self.client.get(NEARBY_REQUESTS_URL)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_drivers(self):
+        self.client.force_authenticate(self.rider)
+
+        self.assertEqual(self.client.get(NEARBY_REQUESTS_URL).status_code, 403)
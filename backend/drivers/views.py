@@ -56,16 +56,35 @@ class DriverViewSet(viewsets.ModelViewSet):
         
         serializer = DriverLocationUpdateSerializer(data=request.data)
         if serializer.is_valid():
+            from rides.location_buffer import driver_location_buffer
+            from rides.presence import DRIVER, presence
+            from rides.services import LocationService
+            
             driver = request.user.driver_profile
             driver.current_latitude = serializer.validated_data['latitude']
             driver.current_longitude = serializer.validated_data['longitude']
             driver.last_location_update = timezone.now()
             
+            # Positions are written behind in bulk; only availability is saved right away
+            driver_location_buffer.record(
+                driver.id, driver.current_latitude, driver.current_longitude,
+                driver.last_location_update
+            )
+            
+            # A location ping doubles as a presence heartbeat
+            came_online = presence.touch(DRIVER, driver.id)
+            
             # Update availability if provided
             if 'is_available' in serializer.validated_data:
                 driver.is_available = serializer.validated_data['is_available']
-            
-            driver.save()
+                driver.save(update_fields=['is_available', 'updated_at'])
+                LocationService.driver_changed(driver)
+            elif came_online:
+                LocationService.driver_changed(driver)
+            else:
+                LocationService.driver_moved(
+                    driver.id, driver.current_latitude, driver.current_longitude
+                )
             return Response({'message': 'Location updated successfully'})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -84,6 +103,11 @@ class DriverViewSet(viewsets.ModelViewSet):
             driver.is_available = serializer.validated_data['is_available']
             driver.save()
             
+            from rides.presence import DRIVER, presence
+            from rides.services import LocationService
+            presence.touch(DRIVER, driver.id)
+            LocationService.driver_changed(driver)
+            
             return Response({
                 'message': f"Driver availability set to {'available' if driver.is_available else 'unavailable'}",
                 'is_available': driver.is_available
@@ -138,19 +162,41 @@ class DriverViewSet(viewsets.ModelViewSet):
         if not driver.is_available:
             return Response({'message': 'Driver is not available'})
         
-        # Get ride requests within 10km radius (simplified)
-        from rides.models import RideRequest
-        ride_requests = RideRequest.objects.filter(
-            status='pending',
-            expires_at__gt=timezone.now()
-        )
+        try:
+            radius_km = float(request.query_params.get('radius', 10))
+        except ValueError:
+            return Response(
+                {'error': 'radius must be a number of kilometers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < radius_km <= 50:
+            return Response(
+                {'error': 'radius must be between 0 and 50 km'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        from rides.location_buffer import driver_location_buffer
+        from rides.services import LocationService
         
-        # TODO: Add distance calculation and filtering
-        # For now, return all pending requests
+        # The buffered position is fresher than the stored row
+        latitude, longitude = driver.current_latitude, driver.current_longitude
+        pending = driver_location_buffer.latest(driver.id)
+        if pending is not None:
+            latitude, longitude = pending[0], pending[1]
+        if latitude is None or longitude is None:
+            return Response(
+                {'error': 'Update your location to see nearby ride requests'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        nearby = LocationService.find_nearby_requests(latitude, longitude, radius_km)
         
         from rides.serializers import RideRequestSerializer
-        serializer = RideRequestSerializer(ride_requests, many=True)
-        return Response(serializer.data)
+        serializer = RideRequestSerializer([ride_request for _, ride_request in nearby], many=True)
+        results = serializer.data
+        for item, (distance, _) in zip(results, nearby):
+            item['pickup_distance_km'] = distance
+        return Response(results)
 
 class DriverRegistrationView(generics.CreateAPIView):
     serializer_class = DriverRegistrationSerializer
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
-from .models import Ride, RideRequest, RideLocation, FavoriteLocation, RideTemplate, ScheduledRide, SmartSuggestion
+from .models import Ride, RideRequest, RideLocation, RideTrack, FavoriteLocation, RideTemplate, ScheduledRide, SmartSuggestion
 
 @admin.register(RideRequest)
 class RideRequestAdmin(admin.ModelAdmin):
@@ -115,6 +115,10 @@ class RideAdmin(admin.ModelAdmin):
     view_driver_profile.short_description = 'Driver Profile'
     
     def view_locations(self, obj):
+        track = RideTrack.objects.filter(ride=obj).only('id', 'point_count').first()
+        if track:
+            url = reverse('admin:rides_ridetrack_change', args=[track.id])
+            return format_html('<a href="{}" target="_blank">{} locations (compacted)</a>', url, track.point_count)
         count = obj.locations.count()
         if count > 0:
             url = reverse('admin:rides_ridelocation_changelist') + f'?ride__id__exact={obj.id}'
@@ -160,8 +164,30 @@ class RideLocationAdmin(admin.ModelAdmin):
     view_on_map.short_description = 'Map View'
 
 
+@admin.register(RideTrack)
+class RideTrackAdmin(admin.ModelAdmin):
+    list_display = ('ride', 'point_count', 'size_bytes', 'started_at', 'ended_at')
+    search_fields = ('ride__id',)
+    readonly_fields = (
+        'ride', 'point_count', 'size_bytes', 'zoom_levels', 'started_at', 'ended_at', 'created_at', 'updated_at'
+    )
+    exclude = ('data', 'levels')
+    ordering = ('-ended_at',)
+    
+    def size_bytes(self, obj):
+        return len(obj.data or b'')
+    size_bytes.short_description = 'Size (bytes)'
+    
+    def zoom_levels(self, obj):
+        """Points kept per precomputed map zoom level"""
+        levels = sorted((obj.levels or {}).items(), key=lambda item: int(item[0]))
+        return ', '.join(f'z{zoom}: {len(indices)}' for zoom, indices in levels) or '-'
+    zoom_levels.short_description = 'Simplified points per zoom'
+
+
 # Smart Ride Features Admin
-from .models import FavoriteLocation, RideTemplate, ScheduledRide, SmartSuggestion
+from .models import FavoriteLocation, RideTemplate, ScheduledRide, ScheduledRideOccurrence, SmartSuggestion
+from .models import PricingCity, Tariff, TariffTimeRule
 
 @admin.register(FavoriteLocation)
 class FavoriteLocationAdmin(admin.ModelAdmin):
@@ -177,12 +203,23 @@ class RideTemplateAdmin(admin.ModelAdmin):
     search_fields = ('name', 'user__username', 'pickup_address', 'destination_address')
     readonly_fields = ('use_count', 'last_used', 'created_at')
 
+class ScheduledRideOccurrenceInline(admin.TabularInline):
+    model = ScheduledRideOccurrence
+    fields = ('occurrence_datetime', 'status', 'ride_request', 'reminder_sent')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(occurrence_datetime__gte=timezone.now())
+
 @admin.register(ScheduledRide)
 class ScheduledRideAdmin(admin.ModelAdmin):
     list_display = ('user', 'scheduled_datetime', 'status', 'recurring_pattern', 'ride_type', 'created_at')
     list_filter = ('status', 'recurring_pattern', 'ride_type', 'scheduled_datetime')
     search_fields = ('user__username', 'pickup_address', 'destination_address')
     readonly_fields = ('created_at', 'updated_at')
+    inlines = [ScheduledRideOccurrenceInline]
 
 @admin.register(SmartSuggestion)
 class SmartSuggestionAdmin(admin.ModelAdmin):
@@ -191,6 +228,37 @@ class SmartSuggestionAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'title', 'description')
     readonly_fields = ('confidence_score', 'created_at')
 
+class TariffInline(admin.TabularInline):
+    model = Tariff
+    extra = 0
+
+class TariffTimeRuleInline(admin.TabularInline):
+    model = TariffTimeRule
+    extra = 0
+
+@admin.register(PricingCity)
+class PricingCityAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'priority', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    search_fields = ('code', 'name')
+    readonly_fields = ('created_at', 'updated_at')
+    inlines = [TariffInline, TariffTimeRuleInline]
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = (
+        'city', 'ride_type', 'base_fare', 'rate_per_km', 'rate_per_minute',
+        'ride_type_multiplier', 'minimum_fare', 'is_active', 'updated_at'
+    )
+    list_filter = ('ride_type', 'is_active', 'city')
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(TariffTimeRule)
+class TariffTimeRuleAdmin(admin.ModelAdmin):
+    list_display = ('city', 'name', 'start_hour', 'end_hour', 'multiplier', 'priority', 'is_active')
+    list_filter = ('is_active', 'city')
+    readonly_fields = ('created_at', 'updated_at')
+
 
 # Custom admin views for analytics
 class RideAnalyticsAdmin(admin.ModelAdmin):
@@ -10,6 +10,10 @@ import json
 from datetime import timedelta
 
 from .models import Ride, RideRequest
+from .caching import eta_matrix_cache, fare_quote_cache, reverse_geocode_cache, route_cache, user_places_cache
+from .surge import surge_engine
+from .broadcast import ride_location_broadcaster
+from .presence import presence
 from accounts.models import User
 from drivers.models import Driver
 
@@ -206,10 +210,14 @@ class SystemHealthView(APIView):
             # Recent activity
             now = timezone.now()
             last_hour = now - timedelta(hours=1)
+            presence_stats = presence.stats()
             recent_activity = {
                 'new_users': User.objects.filter(date_joined__gte=last_hour).count(),
                 'new_rides': Ride.objects.filter(created_at__gte=last_hour).count(),
-                'active_sessions': 15  # Mock data - would come from session tracking
+                'active_sessions': (
+                    None if presence_stats['users_online'] is None or presence_stats['drivers_online'] is None
+                    else presence_stats['users_online'] + presence_stats['drivers_online']
+                )
             }
             
             # Error rates (mock data)
@@ -226,6 +234,16 @@ class SystemHealthView(APIView):
                 'total_requests_last_hour': 1247
             }
             
+            # Realtime surge state per pricing zone
+            surge_zones = surge_engine.snapshot()
+            surge = {
+                'active_zones': len(surge_zones),
+                'surging_zones': {
+                    zone: stats for zone, stats in surge_zones.items()
+                    if stats['multiplier'] > 1.0
+                }
+            }
+            
             health_data = {
                 'status': 'healthy' if db_healthy else 'unhealthy',
                 'database': 'connected' if db_healthy else 'error',
@@ -233,7 +251,17 @@ class SystemHealthView(APIView):
                 'metrics': {
                     'recent_activity': recent_activity,
                     'error_rates': error_rates,
-                    'performance': performance
+                    'performance': performance,
+                    'surge': surge,
+                    'caches': {
+                        'fare_quotes': fare_quote_cache.stats(),
+                        'eta_matrix': eta_matrix_cache.stats(),
+                        'routes': route_cache.stats(),
+                        'user_places': user_places_cache.stats(),
+                        'reverse_geocode': reverse_geocode_cache.stats()
+                    },
+                    'location_broadcasts': ride_location_broadcaster.stats(),
+                    'presence': presence_stats
                 }
             }
             
@@ -11,8 +11,9 @@ from .services import (
     NotificationService
 )
 from .models import Ride, RideRequest
-from .serializers import RideSerializer
+from .serializers import RideSerializer, FareBatchEstimateSerializer
 import json
+import time
 
 class FareEstimateView(APIView):
     """API endpoint for fare estimation"""
@@ -26,6 +27,7 @@ class FareEstimateView(APIView):
             dest_lat = request.data.get('destination_latitude')
             dest_lng = request.data.get('destination_longitude')
             ride_type = request.data.get('ride_type', 'standard')
+            route_format = request.data.get('route_format', 'polyline')
             
             if not all([pickup_lat, pickup_lng, dest_lat, dest_lng]):
                 return Response(
@@ -33,19 +35,20 @@ class FareEstimateView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Calculate fare
-            fare_info = FareCalculationService.calculate_fare(
-                pickup_lat, pickup_lng, dest_lat, dest_lng,
-                ride_type=ride_type,
-                time_of_day=timezone.now(),
-                surge_multiplier=FareCalculationService.get_surge_multiplier(
-                    'default', timezone.now()
+            if route_format not in ('polyline', 'points'):
+                return Response(
+                    {'error': "route_format must be 'polyline' or 'points'"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            # Calculate fare; repeated quotes for the same trip are served from cache
+            fare_info, _ = FareCalculationService.get_fare_quote(
+                pickup_lat, pickup_lng, dest_lat, dest_lng, ride_type=ride_type
             )
             
-            # Get route information
+            # Get route information; the fare quote above already cached the route
             route_info = RouteOptimizationService.get_optimized_route(
-                pickup_lat, pickup_lng, dest_lat, dest_lng
+                pickup_lat, pickup_lng, dest_lat, dest_lng, route_format=route_format
             )
             
             response_data = {
@@ -63,6 +66,87 @@ class FareEstimateView(APIView):
             )
 
 
+class FareBatchEstimateView(APIView):
+    """API endpoint for pricing many origin/destination pairs in one call"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """Calculate fare estimates for a list of routes"""
+        serializer = FareBatchEstimateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            started = time.perf_counter()
+            now = timezone.now()
+            routes = serializer.validated_data['routes']
+            ride_types = serializer.validated_data.get('ride_types')
+            
+            # One quote per route, or one per route and requested ride type
+            quotes = [
+                (index, route, ride_type)
+                for index, route in enumerate(routes)
+                for ride_type in (ride_types or [route['ride_type']])
+            ]
+            
+            # Snapped to the same cells and served from the same cache as single fare estimates
+            priced = FareCalculationService.get_fare_quotes(
+                [
+                    (
+                        route['pickup_latitude'], route['pickup_longitude'],
+                        route['destination_latitude'], route['destination_longitude'],
+                        ride_type
+                    )
+                    for _, route, ride_type in quotes
+                ],
+                now=now
+            )
+            zones = [
+                FareCalculationService.get_area_code(route['pickup_latitude'], route['pickup_longitude'])
+                for _, route, _ in quotes
+            ]
+            
+            # Durations come from the route cache, once per route rather than per ride type
+            durations = [
+                RouteOptimizationService.get_route(
+                    route['pickup_latitude'], route['pickup_longitude'],
+                    route['destination_latitude'], route['destination_longitude'],
+                    now=now
+                )[0]['duration_minutes']
+                for route in routes
+            ]
+            
+            results = [
+                {
+                    'route_index': index,
+                    'ride_type': ride_type,
+                    'zone': zone,
+                    **fare,
+                    'estimated_duration_minutes': durations[index]
+                }
+                for (index, _, ride_type), zone, (fare, _) in zip(quotes, zones, priced)
+            ]
+            
+            elapsed = time.perf_counter() - started
+            
+            return Response({
+                'quotes': results,
+                'total_quotes': len(results),
+                'currency': 'NPR',
+                'benchmark': {
+                    'elapsed_ms': round(elapsed * 1000, 3),
+                    'quotes_per_second': round(len(results) / elapsed) if elapsed > 0 else None,
+                    'cache_hits': sum(hit for _, hit in priced)
+                }
+            }, status=status.HTTP_200_OK)
+            
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
 class NearbyDriversView(APIView):
     """API endpoint to find nearby drivers"""
     permission_classes = [IsAuthenticated]
@@ -79,7 +163,20 @@ class NearbyDriversView(APIView):
                     {'error': 'Latitude and longitude are required'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
+
+            try:
+                radius_km = float(radius_km)
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': 'radius_km must be a number of kilometers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not 0 < radius_km <= 50:
+                return Response(
+                    {'error': 'radius_km must be between 0 and 50 km'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             # Find nearby drivers
             nearby_drivers = LocationService.find_nearby_drivers(
                 latitude, longitude, radius_km
@@ -154,14 +251,15 @@ class RideMatchingView(APIView):
                 **ride_request_data
             )
             
-            # Find nearby drivers
+            # Find nearby drivers, ranked by road ETA to the pickup
             nearby_drivers = LocationService.find_nearby_drivers(
                 ride_request_data['pickup_latitude'],
                 ride_request_data['pickup_longitude']
             )
+            nearby_drivers.sort(key=lambda driver: (driver['eta_minutes'], driver['distance_km']))
             
             # Send notifications to nearby drivers
-            for driver_info in nearby_drivers[:5]:  # Notify top 5 closest drivers
+            for driver_info in nearby_drivers[:5]:  # Notify the 5 drivers who can arrive soonest
                 # Would send push notification in production
                 print(f"Notifying driver {driver_info['driver_id']} about ride request {ride_request.id}")
             
@@ -171,6 +269,7 @@ class RideMatchingView(APIView):
                 'estimated_duration': fare_info['estimated_minutes'],
                 'distance_km': fare_info['distance_km'],
                 'nearby_drivers_count': len(nearby_drivers),
+                'nearest_driver_eta_minutes': nearby_drivers[0]['eta_minutes'] if nearby_drivers else None,
                 'expires_at': ride_request.expires_at.isoformat(),
                 'status': 'searching_for_driver'
             }, status=status.HTTP_201_CREATED)
@@ -187,9 +286,9 @@ class GeocodeView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        """Convert address to coordinates or coordinates to address"""
+        """Convert address to coordinates, coordinates to address, or suggest addresses as the user types"""
         try:
-            operation = request.data.get('operation')  # 'geocode' or 'reverse_geocode'
+            operation = request.data.get('operation')  # 'geocode', 'reverse_geocode' or 'autocomplete'
             
             if operation == 'geocode':
                 address = request.data.get('address')
@@ -199,7 +298,7 @@ class GeocodeView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                coordinates = LocationService.get_coordinates_from_address(address)
+                coordinates = LocationService.get_coordinates_from_address(address, user=request.user)
                 return Response(coordinates, status=status.HTTP_200_OK)
                 
             elif operation == 'reverse_geocode':
@@ -212,12 +311,39 @@ class GeocodeView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                address_info = LocationService.get_address_from_coordinates(latitude, longitude)
+                try:
+                    latitude, longitude = float(latitude), float(longitude)
+                except (TypeError, ValueError):
+                    return Response(
+                        {'error': 'Latitude and longitude must be numbers'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                address_info = LocationService.get_address_from_coordinates(latitude, longitude, user=request.user)
                 return Response(address_info, status=status.HTTP_200_OK)
                 
+            elif operation == 'autocomplete':
+                query = request.data.get('query') or request.data.get('address')
+                if not query:
+                    return Response(
+                        {'error': 'Query is required for autocomplete'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                try:
+                    limit = min(max(int(request.data.get('limit', 5)), 1), 20)
+                except (TypeError, ValueError):
+                    limit = 5
+                
+                suggestions = LocationService.autocomplete_address(query, user=request.user, limit=limit)
+                return Response({
+                    'suggestions': suggestions,
+                    'count': len(suggestions)
+                }, status=status.HTTP_200_OK)
+                
             else:
                 return Response(
-                    {'error': 'Operation must be either "geocode" or "reverse_geocode"'},
+                    {'error': 'Operation must be "geocode", "reverse_geocode" or "autocomplete"'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
@@ -0,0 +1,126 @@
+import heapq
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """Runs a function every `interval` seconds on a daemon thread"""
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        if self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Run the function as soon as possible instead of waiting for the interval"""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    def run_once(self):
+        try:
+            self.func()
+        except Exception:
+            logger.exception("Background worker %s failed", self.name)
+        finally:
+            # Worker threads live outside the request cycle, so release their DB connections here
+            close_old_connections()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+
+def start_background_workers():
+    """Start the workers that must run even before any request uses them; called at server startup"""
+    from .expiry import request_expiry
+    from .geocoding import geocoder
+    from .scheduling import scheduled_ride_dispatcher
+
+    request_expiry.start()
+    scheduled_ride_dispatcher.start()
+    geocoder.start()
+
+
+class DeadlineQueue:
+    """Thread-safe min-heap of keys ordered by a deadline timestamp
+
+    Rescheduling or discarding a key leaves its old heap entry in place;
+    such stale entries are skipped when popped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []  # (deadline, key)
+        self._deadlines = {}  # key -> current deadline
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def push(self, key, deadline):
+        """Schedule a key, replacing any earlier deadline it had"""
+        with self._lock:
+            if self._deadlines.get(key) != deadline:
+                self._deadlines[key] = deadline
+                heapq.heappush(self._heap, (deadline, key))
+
+    def discard(self, key):
+        with self._lock:
+            self._deadlines.pop(key, None)
+
+    def pop_due(self, now):
+        """Remove and return the keys whose deadline is at or before `now`, earliest first"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == deadline:
+                    del self._deadlines[key]
+                    due.append(key)
+        return due
+
+    def reset(self, deadlines):
+        """Replace the contents with a freshly loaded {key: deadline}, keeping keys scheduled meanwhile"""
+        deadlines = dict(deadlines)
+        with self._lock:
+            for key, deadline in self._deadlines.items():
+                deadlines.setdefault(key, deadline)
+            self._heap = [(deadline, key) for key, deadline in deadlines.items()]
+            heapq.heapify(self._heap)
+            self._deadlines = deadlines
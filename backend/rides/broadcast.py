@@ -0,0 +1,222 @@
+"""Coalesced ride location broadcasts
+
+Driver apps may report positions several times a second. Instead of
+fanning every frame out to the ride group, the broadcaster keeps the
+latest position per ride and sends at most `rate` frames per second, with
+the rate chosen by the ride's status. The first frame after a quiet
+interval goes out at once. Frames arriving within the interval replace
+each other, and the newest is sent when the interval ends.
+
+A broadcast carries its payload encoded once per wire format (JSON text
+and the binary frame of ws_protocol) and the time it was sent. Frames
+dropped by coalescing are never encoded. Each subscriber relays only the newest frame it has seen
+(LatestFrameRelay), so a slow connection skips stale positions instead of
+working through a backlog.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+
+from rideshare import json_codec
+
+from .ws_protocol import encode_location
+
+
+class _RideChannel:
+    """Throttle state of one ride group"""
+
+    __slots__ = ('pending', 'sent_at', 'task', 'loop', 'active_at')
+
+    def __init__(self):
+        self.pending = None  # newest (latitude, longitude, speed, timestamp) not yet broadcast
+        self.sent_at = float('-inf')  # monotonic time of the last broadcast
+        self.task = None  # delayed send of `pending`
+        self.loop = None
+        self.active_at = time.monotonic()
+
+
+class RideLocationBroadcaster:
+    """Per-ride rate limiting of location broadcasts within one worker process
+
+    Only the process holding the driver's connection publishes for a ride,
+    so process-local state is enough. All methods run on that process's
+    event loop. The publishing consumer passes the ride's current status
+    (see RideConsumer's cached ride).
+    """
+
+    def __init__(self, rates, default_rate=1.0, idle_seconds=300):
+        self.rates = dict(rates)  # ride status -> max broadcasts per second, 0 disables
+        self.default_rate = default_rate
+        self.idle_seconds = idle_seconds
+        self._rides = {}  # group name -> _RideChannel
+        self._swept_at = time.monotonic()
+        self.received = 0
+        self.broadcast = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.skipped = 0  # frames subscribers dropped because a newer one was waiting
+
+    def interval(self, status):
+        """Seconds between broadcasts for rides in `status`, None when they are not broadcast"""
+        rate = self.rates.get(status, self.default_rate)
+        return 1.0 / rate if rate > 0 else None
+
+    async def publish(self, channel_layer, group, status, latitude, longitude, speed, timestamp):
+        """Broadcast the position to the ride group now, or as the ride's next frame if one was sent recently
+
+        A status without broadcasts also drops the frame still waiting to be sent.
+        """
+        self.received += 1
+        channel = self._channel(group)
+        channel.active_at = now = time.monotonic()
+        self._sweep(now)
+
+        interval = self.interval(status)
+        if interval is None:
+            self.suppressed += 1
+            self._cancel(channel)
+            channel.pending = None
+            return
+
+        loop = asyncio.get_running_loop()
+        if channel.loop is not loop:
+            self._cancel(channel)
+            channel.loop = loop
+
+        if channel.pending is not None:
+            self.coalesced += 1
+        channel.pending = (latitude, longitude, speed, timestamp)
+        if channel.task is not None:
+            return  # the scheduled send picks up this frame
+
+        wait = channel.sent_at + interval - now
+        if wait <= 0:
+            await self._send(channel_layer, group, channel)
+        else:
+            channel.task = loop.create_task(self._send_later(channel_layer, group, channel, wait))
+
+    async def _send_later(self, channel_layer, group, channel, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            if channel.task is asyncio.current_task():
+                channel.task = None
+        if channel.pending is not None:
+            await self._send(channel_layer, group, channel)
+
+    async def _send(self, channel_layer, group, channel):
+        (latitude, longitude, speed, timestamp), channel.pending = channel.pending, None
+        channel.sent_at = time.monotonic()
+        self.broadcast += 1
+        try:
+            data = encode_location(latitude, longitude, speed, timestamp)
+        except ValueError:
+            data = None  # binary subscribers get the JSON frame
+        await channel_layer.group_send(group, {
+            'type': 'location_update',
+            'sent_at': time.time(),
+            'text': json_codec.dumps_text({
+                'type': 'location_update',
+                'latitude': latitude,
+                'longitude': longitude,
+                'speed': speed,
+                'timestamp': timestamp.isoformat()
+            }),
+            'bytes': data,
+        })
+
+    def relay(self, send):
+        """LatestFrameRelay for one subscriber; `send` is an async callable taking the broadcast event"""
+        return LatestFrameRelay(send, self)
+
+    def forget(self, group):
+        """Drop the ride's state, e.g. when the driver disconnects"""
+        channel = self._rides.pop(group, None)
+        if channel is not None:
+            self._cancel(channel)
+
+    def stats(self):
+        return {
+            'rides': len(self._rides),
+            'frames_received': self.received,
+            'broadcasts': self.broadcast,
+            'coalesced': self.coalesced,
+            'suppressed': self.suppressed,
+            'skipped_by_subscribers': self.skipped,
+        }
+
+    def _channel(self, group):
+        channel = self._rides.get(group)
+        if channel is None:
+            channel = self._rides[group] = _RideChannel()
+        return channel
+
+    @staticmethod
+    def _cancel(channel):
+        if channel.task is not None:
+            channel.task.cancel()
+            channel.task = None
+
+    def _sweep(self, now):
+        """Forget rides that have not published for `idle_seconds`"""
+        if now - self._swept_at < self.idle_seconds:
+            return
+        self._swept_at = now
+        for group, channel in list(self._rides.items()):
+            if now - channel.active_at > self.idle_seconds and channel.task is None:
+                del self._rides[group]
+
+
+class LatestFrameRelay:
+    """Forwards broadcast frames to one connection, newest first
+
+    Frames are handed over without waiting for the socket. While a send is
+    in flight, later frames replace each other, and frames older than the
+    last one sent are dropped, so a subscriber that falls behind jumps to
+    the current position.
+    """
+
+    def __init__(self, send, broadcaster=None):
+        self._send = send
+        self._broadcaster = broadcaster
+        self._latest = None
+        self._last_sent_at = float('-inf')
+        self._task = None
+
+    def offer(self, event):
+        newest = self._latest
+        if event['sent_at'] <= self._last_sent_at or (newest is not None and event['sent_at'] <= newest['sent_at']):
+            self._skipped()
+            return
+        if newest is not None:
+            self._skipped()
+        self._latest = event
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        while self._latest is not None:
+            event, self._latest = self._latest, None
+            self._last_sent_at = event['sent_at']
+            try:
+                await self._send(event)
+            except Exception:
+                self._latest = None  # the connection is gone
+                return
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._latest = None
+
+    def _skipped(self):
+        if self._broadcaster is not None:
+            self._broadcaster.skipped += 1
+
+
+ride_location_broadcaster = RideLocationBroadcaster(
+    rates=getattr(settings, 'RIDE_LOCATION_BROADCAST_RATES', {}),
+    default_rate=getattr(settings, 'RIDE_LOCATION_BROADCAST_DEFAULT_RATE', 1.0),
+)
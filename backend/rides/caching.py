@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TTLCache:
+    """Process-local LRU cache whose entries also expire after `ttl_seconds`
+
+    Keeps hit/miss/eviction counters and the time spent serving hits and
+    computing misses, so the cache can be sized from its stats(). Callers
+    filling misses themselves pass the cost to set().
+    """
+
+    _MISSING = object()
+
+    def __init__(self, name, maxsize=1024, ttl_seconds=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, value), least recently used first
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Cached value for key, or default; counted as a hit or a miss"""
+        start = time.perf_counter()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._hit_seconds += time.perf_counter() - start
+            return entry[1]
+
+    def set(self, key, value, compute_seconds=0.0):
+        """Store a value; compute_seconds is what producing it cost after the miss"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self._miss_seconds += compute_seconds
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, computing and storing it on a miss; returns (value, hit)"""
+        value = self.get(key, self._MISSING)
+        if value is not self._MISSING:
+            return value, True
+
+        start = time.perf_counter()
+        value = compute()
+        self.set(key, value, time.perf_counter() - start)
+        return value, False
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches the predicate"""
+        with self._lock:
+            if predicate is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key in self._entries if predicate(key)]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self.invalidations += dropped
+        return dropped
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'avg_hit_ms': round(self._hit_seconds * 1000 / self.hits, 4) if self.hits else None,
+            'avg_miss_ms': round(self._miss_seconds * 1000 / self.misses, 4) if self.misses else None,
+        }
+
+
+fare_quote_cache = TTLCache(
+    'fare_quotes',
+    maxsize=getattr(settings, 'FARE_QUOTE_CACHE_SIZE', 10000),
+    ttl_seconds=getattr(settings, 'FARE_QUOTE_CACHE_TTL_SECONDS', 60),
+)
+
+eta_matrix_cache = TTLCache(
+    'eta_matrix',
+    maxsize=getattr(settings, 'ETA_MATRIX_CACHE_SIZE', 50000),
+    ttl_seconds=getattr(settings, 'ETA_MATRIX_CACHE_TTL_SECONDS', 900),
+)
+
+route_cache = TTLCache(
+    'routes',
+    maxsize=getattr(settings, 'ROUTE_CACHE_SIZE', 20000),
+    ttl_seconds=getattr(settings, 'ROUTE_CACHE_TTL_SECONDS', 3600),
+)
+
+user_places_cache = TTLCache(
+    'user_places',
+    maxsize=getattr(settings, 'GEOCODER_USER_CACHE_SIZE', 5000),
+    ttl_seconds=getattr(settings, 'GEOCODER_USER_CACHE_TTL_SECONDS', 600),
+)
+
+reverse_geocode_cache = TTLCache(
+    'reverse_geocode',
+    maxsize=getattr(settings, 'REVERSE_GEOCODE_CACHE_SIZE', 50000),
+    ttl_seconds=getattr(settings, 'REVERSE_GEOCODE_CACHE_TTL_SECONDS', 86400),
+)
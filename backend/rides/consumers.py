@@ -1,21 +1,145 @@
-import json
 import asyncio
+from datetime import datetime
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from .models import Ride, RideLocation
 from drivers.models import Driver
 from django.utils import timezone
 from decimal import Decimal
+from .services import LocationService
+from .location_buffer import driver_location_buffer, ride_location_buffer
+from rideshare import json_codec
+from .broadcast import ride_location_broadcaster
+from .presence import DRIVER, USER, presence
+from . import ws_protocol
 
 User = get_user_model()
 
-class RideConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for real-time ride tracking"""
+# Close codes for connections refused at connect()
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+
+
+def ride_changed_event(ride):
+    """Channel layer event refreshing the ride cached by each RideConsumer of the ride"""
+    return {
+        'type': 'ride_changed',
+        'status': ride.status,
+        'driver_id': ride.driver_id,
+        'started_at': ride.started_at.isoformat() if ride.started_at else None,
+        'completed_at': ride.completed_at.isoformat() if ride.completed_at else None,
+    }
+
+
+def driver_changed_event(driver):
+    """Channel layer event refreshing the driver cached by the driver's DriverConsumer"""
+    return {
+        'type': 'driver_changed',
+        'is_available': driver.is_available,
+        'is_verified': driver.is_verified,
+    }
+
+
+class BinaryFramesMixin:
+    """Opt-in binary location/status frames, negotiated as a WebSocket subprotocol (see ws_protocol)"""
+    
+    binary_frames = False
+    
+    async def accept_negotiated(self):
+        self.binary_frames = ws_protocol.BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=ws_protocol.BINARY_SUBPROTOCOL if self.binary_frames else None)
+    
+    def parse_message(self, text_data=None, bytes_data=None):
+        """Incoming message as a dict; binary frames decode to the same shape as JSON ones
+        
+        Returns None for malformed frames, which callers drop without closing the connection.
+        """
+        try:
+            if bytes_data is not None:
+                message = ws_protocol.decode(bytes_data)
+            else:
+                message = json_codec.loads(text_data)
+        except (TypeError, ValueError):
+            return None
+        return message if isinstance(message, dict) else None
+    
+    async def send_error(self, message):
+        """Tell the client a message was rejected; errors are always JSON text frames"""
+        await self.send(text_data=json_codec.dumps_text({'type': 'error', 'message': message}))
+    
+    def binary_status_frame(self, event):
+        """Binary frame for a status_update event, None if this connection or status needs JSON"""
+        if not self.binary_frames:
+            return None
+        try:
+            return ws_protocol.encode_status(event['status'], datetime.fromisoformat(event['timestamp']))
+        except ValueError:
+            return None
+
+
+class PresenceMixin:
+    """Keeps the connection's members online in the presence registry (see presence.py)
+    
+    Every incoming message, including {"type": "heartbeat"}, counts as a
+    heartbeat; clients should send one at least every PRESENCE_TTL_SECONDS / 2.
+    """
+    
+    presence_members = ()  # (role, member id) pairs kept online by this connection
+    
+    async def presence_heartbeat(self):
+        for role, member in self.presence_members:
+            if not presence.due(role, member, self.channel_name):
+                continue
+            if presence.blocking:
+                came_online = await sync_to_async(presence.touch, thread_sensitive=False)(
+                    role, member, self.channel_name
+                )
+            else:
+                came_online = presence.touch(role, member, self.channel_name)
+            if came_online and role == DRIVER and presence.require_for_dispatch:
+                await database_sync_to_async(LocationService.driver_online)(member)
+    
+    async def presence_leave(self):
+        for role, member in self.presence_members:
+            if presence.blocking:
+                went_offline = await sync_to_async(presence.leave, thread_sensitive=False)(
+                    role, member, self.channel_name
+                )
+            else:
+                went_offline = presence.leave(role, member, self.channel_name)
+            if went_offline and role == DRIVER and presence.require_for_dispatch:
+                LocationService.driver_offline(member)
+        self.presence_members = ()
+
+
+class RideConsumer(PresenceMixin, BinaryFramesMixin, AsyncWebsocketConsumer):
+    """WebSocket consumer for real-time ride tracking
+    
+    The ride is loaded and authorized once at connect() and kept on the
+    connection; ride_changed events from the Ride post_save signal keep the
+    cached copy current, so realtime messages never re-read it.
+    """
     
     async def connect(self):
         self.ride_id = self.scope['url_route']['kwargs']['ride_id']
         self.ride_group_name = f'ride_{self.ride_id}'
+        self.location_relay = ride_location_broadcaster.relay(self.send_location_frame)
+        
+        self.ride, self.user_driver_id = await self.load_ride()
+        if self.ride is None:
+            await self.close(code=CLOSE_NOT_FOUND)
+            return
+        if not self.may_join():
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.presence_members = [(USER, user.id)]
+            if self.user_driver_id is not None and self.user_driver_id == self.ride.driver_id:
+                self.presence_members.append((DRIVER, self.user_driver_id))
         
         # Join ride group
         await self.channel_layer.group_add(
@@ -23,17 +147,24 @@ class RideConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept_negotiated()
+        await self.presence_heartbeat()
     
     async def disconnect(self, close_code):
+        self.location_relay.close()
+        await self.presence_leave()
+        
         # Leave ride group
         await self.channel_layer.group_discard(
             self.ride_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.presence_heartbeat()
+        text_data_json = self.parse_message(text_data, bytes_data)
+        if text_data_json is None:
+            return
         message_type = text_data_json.get('type', '')
         
         if message_type == 'location_update':
@@ -49,20 +180,25 @@ class RideConsumer(AsyncWebsocketConsumer):
         longitude = data.get('longitude')
         speed = data.get('speed', 0)
         
-        if latitude and longitude:
-            # Save location to database
-            await self.save_ride_location(latitude, longitude, speed)
+        if latitude and longitude and self.may_publish_location():
+            try:
+                latitude, longitude = ws_protocol.coordinates(latitude, longitude)
+            except ValueError as e:
+                await self.send_error(str(e))
+                return
             
-            # Broadcast to ride group
-            await self.channel_layer.group_send(
+            # Queue the point; it is written to the database in batches
+            self.save_ride_location(latitude, longitude, speed)
+            
+            # Broadcast to ride group, coalesced to the rate of the ride's status
+            await ride_location_broadcaster.publish(
+                self.channel_layer,
                 self.ride_group_name,
-                {
-                    'type': 'location_update',
-                    'latitude': latitude,
-                    'longitude': longitude,
-                    'speed': speed,
-                    'timestamp': timezone.now().isoformat()
-                }
+                self.ride.status,
+                latitude,
+                longitude,
+                speed,
+                timezone.now()
             )
     
     async def handle_status_update(self, data):
@@ -101,66 +237,131 @@ class RideConsumer(AsyncWebsocketConsumer):
     
     # Send methods for different message types
     async def location_update(self, event):
-        await self.send(text_data=json.dumps(event))
+        """Relay the newest position; frames queued behind a slow connection are skipped"""
+        self.location_relay.offer(event)
     
     async def status_update(self, event):
-        await self.send(text_data=json.dumps(event))
+        frame = self.binary_status_frame(event)
+        if frame is not None:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=json_codec.dumps_text(event))
+    
+    async def send_location_frame(self, event):
+        """Send a coalesced location broadcast, pre-encoded in this connection's format"""
+        if self.binary_frames and event.get('bytes'):
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
     
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send(text_data=json_codec.dumps_text(event))
+    
+    async def ride_changed(self, event):
+        """Refresh the cached ride after it was saved; not forwarded to the client"""
+        self.ride.status = event['status']
+        self.ride.driver_id = event['driver_id']
+        self.ride.started_at = datetime.fromisoformat(event['started_at']) if event['started_at'] else None
+        self.ride.completed_at = datetime.fromisoformat(event['completed_at']) if event['completed_at'] else None
+        if ride_location_broadcaster.interval(self.ride.status) is None:
+            ride_location_broadcaster.forget(self.ride_group_name)  # ride over: drop any delayed frame
+    
+    # Authorization
+    def may_join(self):
+        """Signed-in users must be the ride's rider, its driver or staff"""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return True  # token clients are not authenticated on sockets yet
+        return (
+            user.is_staff or user.id == self.ride.rider_id
+            or (self.user_driver_id is not None and self.user_driver_id == self.ride.driver_id)
+        )
+    
+    def may_publish_location(self):
+        """Only the ride's driver reports positions (and unauthenticated clients, as before)"""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return True
+        return self.user_driver_id is not None and self.user_driver_id == self.ride.driver_id
     
     # Database operations
-    @database_sync_to_async
     def save_ride_location(self, latitude, longitude, speed):
         try:
-            ride = Ride.objects.get(id=self.ride_id)
-            RideLocation.objects.create(
-                ride=ride,
-                latitude=Decimal(str(latitude)),
-                longitude=Decimal(str(longitude)),
-                speed=Decimal(str(speed)) if speed else None
-            )
-        except Ride.DoesNotExist:
+            ride_location_buffer.record(self.ride.id, latitude, longitude, speed or None)
+        except (ValueError, ArithmeticError):
             pass
     
     @database_sync_to_async
-    def update_ride_status(self, status):
+    def load_ride(self):
+        """The ride and the connecting user's driver id, (None, None) for unknown rides"""
+        from django.core.exceptions import ValidationError
+        
         try:
-            ride = Ride.objects.get(id=self.ride_id)
-            ride.status = status
-            if status == 'in_progress' and not ride.started_at:
-                ride.started_at = timezone.now()
-            elif status == 'completed' and not ride.completed_at:
-                ride.completed_at = timezone.now()
-            ride.save()
-        except Ride.DoesNotExist:
-            pass
+            ride = Ride.objects.filter(id=self.ride_id).first()
+        except ValidationError:
+            return None, None
+        
+        user = self.scope.get('user')
+        user_driver_id = None
+        if ride is not None and user is not None and user.is_authenticated:
+            user_driver_id = Driver.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+        return ride, user_driver_id
+    
+    @database_sync_to_async
+    def update_ride_status(self, status):
+        ride = self.ride
+        ride.status = status
+        if status == 'in_progress' and not ride.started_at:
+            ride.started_at = timezone.now()
+        elif status == 'completed' and not ride.completed_at:
+            ride.completed_at = timezone.now()
+        ride.save(update_fields=['status', 'started_at', 'completed_at', 'updated_at'])
 
 
-class DriverConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for driver location updates and ride requests"""
+class DriverConsumer(PresenceMixin, BinaryFramesMixin, AsyncWebsocketConsumer):
+    """WebSocket consumer for driver location updates and ride requests
+    
+    Like RideConsumer, the driver is loaded and authorized once at connect()
+    and refreshed by driver_changed events.
+    """
     
     async def connect(self):
         self.driver_id = self.scope['url_route']['kwargs']['driver_id']
         self.driver_group_name = f'driver_{self.driver_id}'
         
+        self.driver = await self.load_driver()
+        if self.driver is None:
+            await self.close(code=CLOSE_NOT_FOUND)
+            return
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated and not (user.is_staff or user.id == self.driver.user_id):
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        self.presence_members = [(DRIVER, self.driver.id)]
+        
         # Join driver group
         await self.channel_layer.group_add(
             self.driver_group_name,
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept_negotiated()
+        await self.presence_heartbeat()
     
     async def disconnect(self, close_code):
+        await self.presence_leave()
+        
         # Leave driver group
         await self.channel_layer.group_discard(
             self.driver_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.presence_heartbeat()
+        text_data_json = self.parse_message(text_data, bytes_data)
+        if text_data_json is None:
+            return
         message_type = text_data_json.get('type', '')
         
         if message_type == 'location_update':
@@ -174,7 +375,10 @@ class DriverConsumer(AsyncWebsocketConsumer):
         longitude = data.get('longitude')
         
         if latitude and longitude:
-            await self.update_driver_location(latitude, longitude)
+            try:
+                self.update_driver_location(latitude, longitude)
+            except (ValueError, ArithmeticError) as e:
+                await self.send_error(str(e) or 'Invalid location')
     
     async def handle_availability_update(self, data):
         """Handle driver availability status updates"""
@@ -184,41 +388,56 @@ class DriverConsumer(AsyncWebsocketConsumer):
     # Send methods
     async def ride_request(self, event):
         """Send ride request to driver"""
-        await self.send(text_data=json.dumps(event))
+        await self.send(text_data=json_codec.dumps_text(event))
     
     async def ride_cancelled(self, event):
         """Notify driver that ride was cancelled"""
-        await self.send(text_data=json.dumps(event))
+        await self.send(text_data=json_codec.dumps_text(event))
+    
+    async def driver_changed(self, event):
+        """Refresh the cached driver after it was saved; not forwarded to the client"""
+        self.driver.is_available = event['is_available']
+        self.driver.is_verified = event['is_verified']
+    
+    def update_driver_location(self, latitude, longitude):
+        """Buffer the position; the write-behind flush persists it in bulk
+        
+        Raises ValueError for non-numeric, non-finite or out-of-range coordinates.
+        """
+        latitude, longitude = ws_protocol.coordinates(latitude, longitude)
+        driver_location_buffer.record(self.driver.id, latitude, longitude)
+        LocationService.driver_moved(self.driver.id, latitude, longitude)
     
     # Database operations
+    
     @database_sync_to_async
-    def update_driver_location(self, latitude, longitude):
+    def load_driver(self):
         try:
-            driver = Driver.objects.get(id=self.driver_id)
-            driver.current_latitude = Decimal(str(latitude))
-            driver.current_longitude = Decimal(str(longitude))
-            driver.last_location_update = timezone.now()
-            driver.save()
-        except Driver.DoesNotExist:
-            pass
+            return Driver.objects.select_related('user').filter(id=int(self.driver_id)).first()
+        except ValueError:
+            return None
     
     @database_sync_to_async
     def update_driver_availability(self, is_available):
-        try:
-            driver = Driver.objects.get(id=self.driver_id)
-            driver.is_available = is_available
-            driver.save()
-        except Driver.DoesNotExist:
-            pass
+        driver = self.driver
+        driver.is_available = is_available
+        driver.save(update_fields=['is_available', 'updated_at'])
+        LocationService.driver_changed(driver)
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(PresenceMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for general notifications"""
     
     async def connect(self):
         self.user_id = self.scope['url_route']['kwargs']['user_id']
         self.user_group_name = f'user_{self.user_id}'
         
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.presence_members = [(USER, user.id)]
+        elif self.user_id.isdigit():
+            self.presence_members = [(USER, int(self.user_id))]
+        
         # Join user group
         await self.channel_layer.group_add(
             self.user_group_name,
@@ -226,19 +445,22 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        await self.presence_heartbeat()
     
     async def disconnect(self, close_code):
+        await self.presence_leave()
+        
         # Leave user group
         await self.channel_layer.group_discard(
             self.user_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        # Handle incoming messages if needed
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
+        # Incoming messages only serve as presence heartbeats
+        await self.presence_heartbeat()
     
     # Send methods
     async def notification(self, event):
         """Send notification to user"""
-        await self.send(text_data=json.dumps(event))
+        await self.send(text_data=json_codec.dumps_text(event))
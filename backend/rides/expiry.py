@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import DeadlineQueue, PeriodicWorker
+
+
+class RequestExpiryScheduler:
+    """Moves pending ride requests to `expired` at their deadline
+
+    Deadlines are kept in a min-heap fed by ride request events. Each tick
+    pops the requests that are due and expires them with one bulk UPDATE,
+    evicts them from the pending-request index and notifies their riders.
+    The heap is reseeded from the database every `reseed_seconds`, which
+    also picks up requests created by other workers and any backlog left
+    while no scheduler was running. Every worker tracks every deadline, so
+    rows are locked while they are expired and only the worker that
+    expired a request notifies its rider.
+    """
+
+    def __init__(self, tick_seconds=1, reseed_seconds=60, batch_size=500):
+        self.tick_seconds = tick_seconds
+        self.reseed_seconds = reseed_seconds
+        self.batch_size = batch_size
+        self._queue = DeadlineQueue()  # request id -> deadline timestamp
+        self._seeded_at = None
+        self._worker = PeriodicWorker('ride-request-expiry', tick_seconds, self.tick)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def start(self):
+        self._worker.start()
+
+    def schedule(self, ride_request):
+        """Track the deadline of a pending request, or forget a request that is no longer pending"""
+        self._worker.start()
+        if ride_request.status == 'pending':
+            self._queue.push(ride_request.id, ride_request.expires_at.timestamp())
+        else:
+            self._queue.discard(ride_request.id)
+
+    def tick(self):
+        """Expire every request whose deadline has passed; returns the number expired"""
+        if self._seeded_at is None or time.monotonic() - self._seeded_at > self.reseed_seconds:
+            self.seed()
+
+        due = self._queue.pop_due(time.time())
+        expired = 0
+        for start in range(0, len(due), self.batch_size):
+            expired += self.expire(due[start:start + self.batch_size])
+        return expired
+
+    def expire(self, request_ids):
+        """Mark the given requests expired if they are still pending and past their deadline"""
+        from django.db import transaction
+        from .models import RideRequest
+        from .services import NotificationService
+        from .spatial_index import pending_request_index
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Rows another worker is expiring, or a driver is accepting, are skipped rather than waited for
+            due = list(
+                RideRequest.objects.select_for_update(skip_locked=True).filter(
+                    id__in=request_ids, status='pending', expires_at__lte=now
+                ).values_list('id', 'rider_id')
+            )
+            if not due:
+                return 0
+            RideRequest.objects.filter(id__in=[request_id for request_id, _ in due]).update(status='expired')
+
+        for request_id, rider_id in due:
+            pending_request_index.remove(request_id)
+            NotificationService.send_user_notification(
+                rider_id,
+                'ride_request_expired',
+                {
+                    'ride_request_id': str(request_id),
+                    'message': 'No driver accepted your ride request in time. Please try again.'
+                }
+            )
+        return len(due)
+
+    def seed(self):
+        """Rebuild the heap from the pending requests in the database"""
+        from .models import RideRequest
+
+        pending = RideRequest.objects.filter(status='pending').values_list('id', 'expires_at')
+        # Requests scheduled while the query ran are kept; expire() skips any that are no longer pending
+        self._queue.reset({request_id: expires_at.timestamp() for request_id, expires_at in pending})
+        self._seeded_at = time.monotonic()
+
+
+request_expiry = RequestExpiryScheduler(
+    tick_seconds=getattr(settings, 'RIDE_REQUEST_EXPIRY_TICK_SECONDS', 1),
+    reseed_seconds=getattr(settings, 'RIDE_REQUEST_EXPIRY_RESEED_SECONDS', 60),
+)
@@ -0,0 +1,657 @@
+"""Offline geocoding from a local gazetteer and users' saved places
+
+The gazetteer is a CSV of named places and streets (name, kind, latitude,
+longitude and optionally importance, postal_code), built from an OSM
+extract by `manage.py build_gazetteer` or maintained by hand. It is loaded
+into a PlaceIndex:
+
+- forward geocoding and autocomplete go through a sorted vocabulary of
+  normalized words, so a typed prefix is a bisect to a contiguous word
+  range whose postings lists are merged in importance order. Words that
+  match nothing fall back to a trigram index over the vocabulary, which
+  catches typos.
+- reverse geocoding goes through static point grids: the nearest street or
+  place, plus the nearest area (suburb, neighbourhood) and locality (city,
+  town, village) for the rest of the address.
+
+A user's FavoriteLocation and RideTemplate addresses form a small PlaceIndex
+of their own, cached per user and only ever searched for that user.
+"""
+import bisect
+import csv
+import gzip
+import heapq
+import itertools
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.conf import settings
+
+from .background import PeriodicWorker
+from .spatial_index import KM_PER_DEGREE, haversine_km
+
+DEFAULT_LOCALITY = 'Kathmandu'
+DEFAULT_COUNTRY = 'Nepal'
+
+AREA_KINDS = {'suburb', 'neighbourhood', 'quarter', 'hamlet'}
+LOCALITY_KINDS = {'city', 'town', 'village', 'municipality'}
+
+# Common abbreviations in typed and mapped addresses, expanded when indexing and querying
+ABBREVIATIONS = {
+    'rd': 'road', 'st': 'street', 'ave': 'avenue', 'hwy': 'highway', 'mg': 'marg', 'ch': 'chowk',
+}
+
+GAZETTEER_COLUMNS = ('name', 'kind', 'latitude', 'longitude', 'importance', 'postal_code')
+
+# Ranking of OSM features; results with the same words come out in this order
+PLACE_IMPORTANCE = {
+    'city': 100, 'town': 80, 'municipality': 80, 'suburb': 60, 'village': 50,
+    'quarter': 45, 'neighbourhood': 40, 'hamlet': 30, 'locality': 20,
+}
+STREET_IMPORTANCE = {
+    'trunk': 30, 'primary': 30, 'secondary': 25, 'tertiary': 20,
+    'unclassified': 10, 'residential': 10, 'living_street': 10, 'pedestrian': 10, 'service': 5,
+}
+POI_KEYS = ('amenity', 'aeroway', 'tourism', 'historic', 'shop', 'office', 'leisure')
+POI_IMPORTANCE = 15
+
+SHORT_PREFIX = 3  # prefixes up to this long keep a precomputed list of their best places
+TOP_PLACES = 100
+MERGE_MAX_WORDS = 16
+FUZZY_MIN_LENGTH = 4
+FUZZY_MIN_SIMILARITY = 0.4
+FUZZY_MAX_WORDS = 3
+FUZZY_MAX_LENGTH_DIFFERENCE = 2  # typos rarely add or drop more letters than this
+
+_SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def normalize(text):
+    """Lowercase ASCII words of text, accents stripped and abbreviations expanded"""
+    return [ABBREVIATIONS.get(word, word) for word in _SEPARATORS.split(_ascii(text)) if word]
+
+
+def query_terms(query):
+    """Distinct normalized query words, each as a tuple of the forms it may match
+
+    The last word is still being typed unless the query ends in a separator,
+    so an abbreviation there also matches as typed: "ch" finds "Chandni" as
+    well as "Chowk".
+    """
+    text = _ascii(query)
+    words = [word for word in _SEPARATORS.split(text) if word]
+    terms = [(ABBREVIATIONS.get(word, word),) for word in words]
+    if words and not _SEPARATORS.match(text[-1]) and words[-1] in ABBREVIATIONS:
+        terms[-1] = (words[-1], ABBREVIATIONS[words[-1]])
+    return list(dict.fromkeys(terms))
+
+
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PointGrid:
+    """Static lat/lng grid of point ids for nearest-point lookups
+
+    Unlike GridIndex it never changes after construction, so cells hold
+    numpy id arrays and a lookup measures all nearby points in one call.
+    """
+
+    def __init__(self, ids, latitudes, longitudes, cell_size_deg):
+        self.cell_size_deg = cell_size_deg
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self._cells = {}
+        if len(self.ids):
+            rows = np.floor(self.latitudes / cell_size_deg).astype(np.int64)
+            cols = np.floor(self.longitudes / cell_size_deg).astype(np.int64)
+            for position, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+                self._cells.setdefault(cell, []).append(position)
+            self._cells = {cell: np.array(positions) for cell, positions in self._cells.items()}
+
+    def nearest(self, latitude, longitude, max_km):
+        """(distance_km, id) of the closest point within max_km, or None"""
+        row = math.floor(latitude / self.cell_size_deg)
+        col = math.floor(longitude / self.cell_size_deg)
+        cell_km = self.cell_size_deg * KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+        reach = max(1, math.ceil(max_km / cell_km))
+        found = [
+            positions
+            for positions in (
+                self._cells.get((r, c)) for r in range(row - reach, row + reach + 1)
+                for c in range(col - reach, col + reach + 1)
+            )
+            if positions is not None
+        ]
+        if not found:
+            return None
+        positions = np.concatenate(found) if len(found) > 1 else found[0]
+        distances = haversine_km(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        best = int(np.argmin(distances))
+        if distances[best] > max_km:
+            return None
+        return float(distances[best]), int(self.ids[positions[best]])
+
+
+class PlaceIndex:
+    """Prefix, fuzzy and nearest-point lookups over a fixed list of place dicts
+
+    Each place needs name, kind, latitude and longitude; importance
+    (higher first) orders results, and every other key is passed through.
+    Place ids are positions in importance order, so every postings list is
+    sorted best first.
+    """
+
+    def __init__(self, places, cell_size_deg=0.005):
+        self.places = sorted(places, key=lambda place: (-place.get('importance', 0), place['name']))
+        self._texts = []  # ' word word ' per place: a prefix match is a substring search for ' term'
+        postings = {}
+        top = {}  # short prefix -> best TOP_PLACES ids with a word starting with it
+        for i, place in enumerate(self.places):
+            tokens = tuple(dict.fromkeys(normalize(f"{place['name']} {place.get('search_text', '')}")))
+            self._texts.append(f" {' '.join(tokens)} ")
+            for token in tokens:
+                postings.setdefault(token, []).append(i)
+                for length in range(1, min(len(token), SHORT_PREFIX) + 1):
+                    ids = top.setdefault(token[:length], [])
+                    if len(ids) < TOP_PLACES and (not ids or ids[-1] != i):
+                        ids.append(i)
+        self._top = top
+
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+        # Postings in a word range [lo, hi) number _sizes[hi] - _sizes[lo]
+        self._sizes = [0]
+        for ids in self.postings:
+            self._sizes.append(self._sizes[-1] + len(ids))
+        trigram_words = {}
+        for word_id, word in enumerate(self.words):
+            if len(word) >= FUZZY_MIN_LENGTH - FUZZY_MAX_LENGTH_DIFFERENCE:
+                for trigram in _trigrams(word):
+                    trigram_words.setdefault((len(word), trigram), []).append(word_id)
+        self._trigram_words = {key: np.array(ids, dtype=np.int32) for key, ids in trigram_words.items()}
+        self._word_trigrams = np.array([len(word) + 1 for word in self.words], dtype=np.float64)
+
+        def grid(kinds, cell_size):
+            ids = [i for i, place in enumerate(self.places) if kinds is None or place['kind'] in kinds]
+            return PointGrid(
+                ids,
+                [self.places[i]['latitude'] for i in ids],
+                [self.places[i]['longitude'] for i in ids],
+                cell_size
+            )
+
+        self.points = grid(None, cell_size_deg)
+        self.areas = grid(AREA_KINDS, cell_size_deg * 4)
+        self.localities = grid(LOCALITY_KINDS, cell_size_deg * 10)
+
+    def __len__(self):
+        return len(self.places)
+
+    def search(self, query, limit=5):
+        """Places whose words start with every query word, whole-word matches first, then by importance
+
+        Returns (place, exact) pairs; exact is True when every query word
+        matched a whole word.
+        """
+        terms = query_terms(query)
+        if not terms or not self.places:
+            return []
+
+        matchers = []  # (term forms, (form, word range) pairs, fuzzy word ids or None, postings count)
+        for forms in terms:
+            spans = []
+            for form in forms:
+                if any(form.startswith(other) for other, _, _ in spans):
+                    continue  # "st" already covers "street"
+                lo = bisect.bisect_left(self.words, form)
+                hi = bisect.bisect_left(self.words, form + '\x7f', lo)
+                if lo < hi:
+                    spans.append((form, lo, hi))
+            if spans:
+                matchers.append((forms, spans, None, sum(self._sizes[hi] - self._sizes[lo] for _, lo, hi in spans)))
+                continue
+            similar = self._similar_words(forms[-1])
+            if not similar:
+                return []
+            matchers.append((forms, (), similar, sum(len(self.postings[word_id]) for word_id in similar)))
+
+        # Walk the places of the most selective term best first and check the other terms per place
+        candidates = self._ranked_place_ids(min(matchers, key=lambda matcher: matcher[3]))
+
+        checks = [
+            (tuple(f' {form} ' for form in forms),
+             tuple(f' {form}' for form, _, _ in spans) if spans else None,
+             similar and tuple(f' {self.words[word_id]} ' for word_id in similar))
+            for forms, spans, similar, _ in matchers
+        ]
+        wanted = max(limit * 4, 20)
+        found = []
+        for place_id in candidates:
+            text = self._texts[place_id]
+            exact = True
+            for whole_words, prefixes, similar_words in checks:
+                if any(word in text for word in whole_words):
+                    continue
+                exact = False
+                if prefixes is not None:
+                    if not any(prefix in text for prefix in prefixes):
+                        break
+                elif not any(word in text for word in similar_words):
+                    break
+            else:
+                found.append((not exact, place_id))
+                if len(found) >= wanted:
+                    break
+
+        found.sort()
+        return [(self.places[place_id], not partial) for partial, place_id in found[:limit]]
+
+    def _place_ids(self, matcher):
+        _, spans, similar, _ = matcher
+        word_ids = itertools.chain.from_iterable(range(lo, hi) for _, lo, hi in spans) if spans else similar
+        return {place_id for word_id in word_ids for place_id in self.postings[word_id]}
+
+    def _ranked_place_ids(self, matcher):
+        """Ids of the places matching one term, best first"""
+        _, spans, similar, size = matcher
+        if not spans:
+            return sorted(self._place_ids(matcher))
+        if len(spans) == 1:
+            form, lo, hi = spans[0]
+            if hi - lo == 1:
+                return self.postings[lo]
+            if len(form) <= SHORT_PREFIX and size > TOP_PLACES:
+                # Only a letter or two typed: the best places for the prefix are precomputed
+                return self._top[form]
+        if sum(hi - lo for _, lo, hi in spans) <= MERGE_MAX_WORDS:
+            # Lazily, so the caller can stop after the first few matches
+            postings = [self.postings[word_id] for _, lo, hi in spans for word_id in range(lo, hi)]
+            return (place_id for place_id, _ in itertools.groupby(heapq.merge(*postings)))
+        return sorted(self._place_ids(matcher))
+
+    def _similar_words(self, term):
+        """Vocabulary word ids closest to a misspelled term by trigram overlap (Jaccard similarity)"""
+        if len(term) < FUZZY_MIN_LENGTH:
+            return []
+        trigrams = _trigrams(term)
+        lengths = range(len(term) - FUZZY_MAX_LENGTH_DIFFERENCE, len(term) + FUZZY_MAX_LENGTH_DIFFERENCE + 1)
+        lists = [
+            self._trigram_words[key]
+            for key in ((length, trigram) for length in lengths for trigram in trigrams)
+            if key in self._trigram_words
+        ]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.words))
+        similarity = shared / (len(trigrams) + self._word_trigrams - shared)
+        word_ids = np.flatnonzero(similarity >= FUZZY_MIN_SIMILARITY)
+        best = word_ids[np.argsort(-similarity[word_ids], kind='stable')[:FUZZY_MAX_WORDS]]
+        return best.tolist()
+
+    def nearest(self, latitude, longitude, max_km, index=None):
+        """(distance_km, place) closest to the point within max_km, or None"""
+        found = (self.points if index is None else index).nearest(float(latitude), float(longitude), max_km)
+        if found is None:
+            return None
+        distance, place_id = found
+        return distance, self.places[place_id]
+
+    def context(self, place):
+        """(area, locality) names around a place, looked up on first use and kept on the place"""
+        context = place.get('_context')
+        if context is None:
+            latitude, longitude = place['latitude'], place['longitude']
+            area = self.nearest(latitude, longitude, 3, self.areas)
+            locality = self.nearest(latitude, longitude, 20, self.localities)
+            context = place['_context'] = (area[1]['name'] if area else None, locality[1]['name'] if locality else None)
+        return context
+
+    def describe(self, place):
+        """'Name, area, locality' of a place"""
+        area, locality = self.context(place)
+        if place['kind'] in LOCALITY_KINDS:
+            parts = (place['name'],)
+        elif place['kind'] in AREA_KINDS:
+            parts = (place['name'], locality or DEFAULT_LOCALITY)
+        else:
+            parts = (place['name'], area, locality or DEFAULT_LOCALITY)
+        return ', '.join(dict.fromkeys(part for part in parts if part))
+
+
+def read_gazetteer(path):
+    """Place dicts from a gazetteer CSV (optionally .gz); rows without a name or coordinates are skipped"""
+    if path.endswith('.gz'):
+        stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+
+    places = []
+    with stream:
+        for row in csv.DictReader(stream):
+            try:
+                place = {
+                    'name': row['name'].strip(),
+                    'kind': (row.get('kind') or 'place').strip(),
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                    'importance': float(row.get('importance') or 0),
+                    'postal_code': (row.get('postal_code') or '').strip(),
+                }
+            except (KeyError, TypeError, ValueError):
+                continue
+            if place['name']:
+                places.append(place)
+    return places
+
+
+def read_osm_places(path):
+    """Named places, points of interest and streets of an OSM XML extract, as place dicts
+
+    Streets are split into many ways in OSM; one entry is kept per street
+    name and ~1 km cell, at the middle node of the first way seen.
+    """
+    import xml.etree.ElementTree as ET
+
+    from .road_network import RoadNetworkError, _open
+
+    coordinates = {}
+    places = []
+    streets = set()
+    refs, tags = [], {}
+    with _open(path) as stream:
+        try:
+            for _, element in ET.iterparse(stream, events=('end',)):
+                if element.tag == 'nd':
+                    refs.append(int(element.get('ref')))
+                    continue
+                if element.tag == 'tag':
+                    tags[element.get('k')] = element.get('v')
+                    continue
+                if element.tag == 'node':
+                    point = (float(element.get('lat')), float(element.get('lon')))
+                    coordinates[int(element.get('id'))] = point
+                    place = _osm_place(tags, point)
+                    if place:
+                        places.append(place)
+                elif element.tag == 'way' and refs:
+                    known = [coordinates[ref] for ref in refs if ref in coordinates]
+                    if known and tags.get('name'):
+                        if tags.get('highway') in STREET_IMPORTANCE:
+                            point = known[len(known) // 2]
+                            key = (tags['name'], round(point[0], 2), round(point[1], 2))
+                            if key not in streets:
+                                streets.add(key)
+                                places.append(_osm_place(tags, point, street=True))
+                        else:
+                            place = _osm_place(tags, known[0])
+                            if place:
+                                places.append(place)
+                if element.tag in ('node', 'way', 'relation'):
+                    refs, tags = [], {}
+                    element.clear()
+        except ET.ParseError as e:
+            raise RoadNetworkError(f'Invalid OSM XML in {path}: {e}')
+    return places
+
+
+def _osm_place(tags, point, street=False):
+    name = tags.get('name:en') or tags.get('name')
+    if not name:
+        return None
+    if street:
+        kind, importance = 'street', STREET_IMPORTANCE[tags['highway']]
+    elif tags.get('place') in PLACE_IMPORTANCE:
+        kind, importance = tags['place'], PLACE_IMPORTANCE[tags['place']]
+    else:
+        key = next((key for key in POI_KEYS if tags.get(key)), None)
+        if key is None:
+            return None
+        kind, importance = tags[key], POI_IMPORTANCE
+    return {
+        'name': name,
+        'kind': kind,
+        'latitude': round(point[0], 7),
+        'longitude': round(point[1], 7),
+        'importance': importance,
+        'postal_code': tags.get('addr:postcode', ''),
+    }
+
+
+def write_gazetteer(places, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8', newline='') as stream:
+        writer = csv.DictWriter(stream, GAZETTEER_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(places)
+    os.replace(temporary, path)  # readers never see a half-written file
+
+
+def user_places(user_id):
+    """Place dicts of a user's favorite locations and ride template endpoints"""
+    from .models import FavoriteLocation, RideTemplate
+
+    places = []
+    for favorite in FavoriteLocation.objects.filter(user_id=user_id):
+        places.append({
+            'name': favorite.name,
+            'kind': favorite.location_type,
+            'latitude': float(favorite.latitude),
+            'longitude': float(favorite.longitude),
+            'importance': favorite.use_count,
+            'address': favorite.address,
+            'search_text': favorite.address,
+            'source': 'favorite',
+        })
+    for template in RideTemplate.objects.filter(user_id=user_id, is_active=True):
+        for prefix in ('pickup', 'destination'):
+            places.append({
+                'name': getattr(template, f'{prefix}_name'),
+                'kind': 'template',
+                'latitude': float(getattr(template, f'{prefix}_latitude')),
+                'longitude': float(getattr(template, f'{prefix}_longitude')),
+                'importance': template.use_count,
+                'address': getattr(template, f'{prefix}_address'),
+                'search_text': getattr(template, f'{prefix}_address'),
+                'source': 'template',
+            })
+    return places
+
+
+def reverse_cache_key(latitude, longitude):
+    """REVERSE_GEOCODE_CELL_DEGREES cell of a point: the reverse geocode cache key"""
+    cell = getattr(settings, 'REVERSE_GEOCODE_CELL_DEGREES', 0.0002)
+    return round(float(latitude) / cell), round(float(longitude) / cell)
+
+
+def reverse_cache_center(key):
+    cell = getattr(settings, 'REVERSE_GEOCODE_CELL_DEGREES', 0.0002)
+    return round(key[0] * cell, 6), round(key[1] * cell, 6)
+
+
+def warm_reverse_cache(rides=2000):
+    """Reverse geocode the cells most used by the last `rides` rides' pickups and destinations
+
+    An address recorded on those rides names its cell only when at least
+    REVERSE_GEOCODE_WARMUP_MIN_RIDERS different riders used it there, so no
+    one's own address text is shown to others. Returns the cells cached.
+    """
+    from .caching import reverse_geocode_cache
+    from .models import Ride
+
+    min_riders = getattr(settings, 'REVERSE_GEOCODE_WARMUP_MIN_RIDERS', 3)
+    uses = {}  # cell -> ride endpoints in it
+    riders = {}  # (cell, address) -> riders who recorded it
+    endpoints = Ride.objects.order_by('-requested_at').values_list(
+        'rider_id', 'pickup_latitude', 'pickup_longitude', 'pickup_address',
+        'destination_latitude', 'destination_longitude', 'destination_address',
+    )[:rides]
+    for rider_id, *points in endpoints:
+        for latitude, longitude, address in (points[:3], points[3:]):
+            key = reverse_cache_key(latitude, longitude)
+            uses[key] = uses.get(key, 0) + 1
+            address = ' '.join(str(address).split())
+            if address:
+                riders.setdefault((key, address), set()).add(rider_id)
+
+    shared = {}
+    for (key, address), rider_ids in riders.items():
+        if len(rider_ids) >= min_riders and len(rider_ids) > len(shared.get(key, ('', ()))[1]):
+            shared[key] = (address, rider_ids)
+
+    cells = sorted(uses, key=uses.get, reverse=True)[:reverse_geocode_cache.maxsize // 2]
+    for key in cells:
+        start = time.perf_counter()
+        address = geocoder.reverse(*reverse_cache_center(key))
+        if key in shared:
+            address = dict(address or {
+                'name': '', 'locality': DEFAULT_LOCALITY, 'area': '', 'postal_code': '', 'country': DEFAULT_COUNTRY
+            })
+            address.update(formatted_address=shared[key][0], source='ride_history')
+        reverse_geocode_cache.set(key, address, time.perf_counter() - start)
+    return len(cells)
+
+
+class Geocoder:
+    """Gazetteer and per-user place indexes for LocationService
+
+    The gazetteer loads once per process and reloads when the file's mtime
+    changes (checked at most every `check_seconds`), clearing the reverse
+    geocode cache. Without a gazetteer only users' saved places can be found.
+    Once started, a background worker warms the reverse geocode cache for
+    every gazetteer it sees loaded.
+    """
+
+    def __init__(self, path='', check_seconds=300, reverse_max_km=0.5, favorite_radius_km=0.05):
+        self.path = path
+        self.check_seconds = check_seconds
+        self.reverse_max_km = reverse_max_km
+        self.favorite_radius_km = favorite_radius_km
+        self._lock = threading.Lock()
+        self._index = None
+        self._mtime = None
+        self._checked_at = None
+        self._warmed_index = None
+        self._worker = PeriodicWorker('reverse-geocode-warmup', check_seconds, self.warm)
+
+    def get(self):
+        """The gazetteer PlaceIndex, None when there is no gazetteer file"""
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at > self.check_seconds:
+            self.refresh()
+        return self._index
+
+    def refresh(self):
+        from .caching import reverse_geocode_cache
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path) if self.path else None
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                self._index = PlaceIndex(read_gazetteer(self.path)) if mtime is not None else None
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                print(f"Gazetteer unavailable: {e}")
+                self._index = None
+            reverse_geocode_cache.invalidate()
+
+    def user_index(self, user_id):
+        from .caching import user_places_cache
+
+        index, _ = user_places_cache.get_or_compute(user_id, lambda: PlaceIndex(user_places(user_id)))
+        return index
+
+    def search(self, query, user_id=None, limit=5):
+        """Best matches for a typed address: the user's saved places first, then the gazetteer"""
+        results = []
+        if user_id is not None:
+            results.extend(
+                self._result(place, 'high' if exact else 'medium')
+                for place, exact in self.user_index(user_id).search(query, limit)
+            )
+        index = self.get()
+        if index is not None and len(results) < limit:
+            results.extend(
+                self._result(place, 'high' if exact else 'medium', index)
+                for place, exact in index.search(query, limit - len(results))
+            )
+        return results
+
+    def reverse(self, latitude, longitude):
+        """Gazetteer address for a point, None when nothing named is within reverse_max_km"""
+        index = self.get()
+        nearest = index.nearest(latitude, longitude, self.reverse_max_km) if index is not None else None
+        if nearest is None:
+            return None
+        place = nearest[1]
+        # The area and locality of the nearest named place stand in for the point's own
+        area, locality = index.context(place)
+        return {
+            'formatted_address': f"{index.describe(place)}, {DEFAULT_COUNTRY}",
+            'name': place['name'],
+            'locality': locality or DEFAULT_LOCALITY,
+            'area': area or '',
+            'postal_code': place.get('postal_code', ''),
+            'country': DEFAULT_COUNTRY,
+            'source': 'gazetteer'
+        }
+
+    def saved_place(self, latitude, longitude, user_id):
+        """The user's saved place within favorite_radius_km of the point, or None"""
+        found = self.user_index(user_id).nearest(latitude, longitude, self.favorite_radius_km)
+        return found[1] if found else None
+
+    def start(self):
+        """Start the warm-up worker, warming right away rather than after the first interval"""
+        if not self._worker.running:
+            self._worker.start()
+            self._worker.wake()
+
+    def warm(self):
+        """Warm the reverse geocode cache once per loaded gazetteer, if REVERSE_GEOCODE_WARMUP_RIDES is set"""
+        index = self.get()
+        if index is None or self._warmed_index is index:
+            return  # without a gazetteer every lookup would miss anyway
+        self._warmed_index = index
+        rides = getattr(settings, 'REVERSE_GEOCODE_WARMUP_RIDES', 0)
+        if rides:
+            warm_reverse_cache(rides)
+
+    def _result(self, place, accuracy, index=None):
+        address = index.describe(place) if index is not None else place['address'] or place['name']
+        return {
+            'name': place['name'],
+            'formatted_address': address,
+            'kind': place['kind'],
+            'latitude': place['latitude'],
+            'longitude': place['longitude'],
+            'accuracy': accuracy,
+            'source': place.get('source', 'gazetteer')
+        }
+
+
+geocoder = Geocoder(
+    path=getattr(settings, 'GEOCODER_GAZETTEER_PATH', ''),
+    check_seconds=getattr(settings, 'GEOCODER_CHECK_SECONDS', 300),
+    reverse_max_km=getattr(settings, 'GEOCODER_REVERSE_MAX_KM', 0.5),
+    favorite_radius_km=getattr(settings, 'GEOCODER_FAVORITE_RADIUS_METERS', 50) / 1000,
+)
@@ -0,0 +1,212 @@
+import atexit
+import threading
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import PeriodicWorker
+from .spatial_index import haversine_km
+
+
+class DriverLocationBuffer:
+    """Write-behind buffer for driver positions
+
+    Location pings only replace the driver's latest position in memory. A
+    background flush writes the coalesced positions with one bulk UPDATE of
+    the location columns every `flush_seconds`, which bounds how stale the
+    database copy can be. Pending positions are also flushed at shutdown.
+    """
+
+    LOCATION_FIELDS = ['current_latitude', 'current_longitude', 'last_location_update']
+
+    def __init__(self, flush_seconds=5, batch_size=500):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = {}  # driver id -> (latitude, longitude, timestamp)
+        self._worker = PeriodicWorker('driver-location-flush', flush_seconds, self.flush)
+        atexit.register(self.shutdown)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, driver_id, latitude, longitude, timestamp=None):
+        """Remember the latest position of a driver; older pending positions are dropped"""
+        self._worker.start()
+        position = (
+            Decimal(str(latitude)),
+            Decimal(str(longitude)),
+            timestamp or timezone.now(),
+        )
+        with self._lock:
+            self._pending[driver_id] = position
+
+    def latest(self, driver_id):
+        """Pending (not yet flushed) position of a driver, if any"""
+        return self._pending.get(driver_id)
+
+    def flush(self):
+        """Write all pending positions to the database; returns the number of drivers written"""
+        from drivers.models import Driver
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        drivers = [
+            Driver(
+                id=driver_id,
+                current_latitude=latitude,
+                current_longitude=longitude,
+                last_location_update=timestamp,
+            )
+            for driver_id, (latitude, longitude, timestamp) in pending.items()
+        ]
+        try:
+            Driver.objects.bulk_update(drivers, self.LOCATION_FIELDS, batch_size=self.batch_size)
+        except Exception:
+            # Put the positions back unless a newer one arrived meanwhile
+            with self._lock:
+                for driver_id, position in pending.items():
+                    self._pending.setdefault(driver_id, position)
+            raise
+        return len(drivers)
+
+    def shutdown(self):
+        """Stop the periodic flush and write whatever is still pending"""
+        self._worker.stop(timeout=self.flush_seconds)
+        self._worker.run_once()
+
+
+class RideLocationBuffer:
+    """Append buffer of GPS points per active ride, persisted with bulk_create
+
+    Points that move the vehicle less than `min_distance_m` since the last
+    kept point are dropped, unless `max_gap_seconds` passed without a kept
+    point (so stops keep their timing). Kept points are inserted in bulk when
+    a ride accumulates `flush_size` of them or every `flush_seconds`. Rides
+    without a kept point for `idle_seconds` (finished by another worker,
+    or abandoned) are forgotten by the periodic flush.
+    """
+
+    def __init__(self, flush_seconds=5, flush_size=20, min_distance_m=10, max_gap_seconds=30, idle_seconds=600):
+        self.flush_seconds = flush_seconds
+        self.flush_size = flush_size
+        self.min_distance_m = min_distance_m
+        self.max_gap_seconds = max_gap_seconds
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._pending = {}  # ride id -> list of unsaved RideLocation
+        self._last_kept = {}  # ride id -> (latitude, longitude, timestamp)
+        self._worker = PeriodicWorker('ride-location-flush', flush_seconds, self.flush)
+        atexit.register(self.shutdown)
+
+    def record(self, ride_id, latitude, longitude, speed=None, timestamp=None):
+        """Queue a GPS point for a ride; returns False when it was dropped as redundant"""
+        from .models import RideLocation
+
+        self._worker.start()
+        ride_id = self._ride_key(ride_id)
+        timestamp = timestamp or timezone.now()
+        latitude, longitude = Decimal(str(latitude)), Decimal(str(longitude))
+
+        with self._lock:
+            last = self._last_kept.get(ride_id)
+            if last is not None:
+                moved_m = haversine_km(last[0], last[1], latitude, longitude) * 1000
+                elapsed = (timestamp - last[2]).total_seconds()
+                if moved_m < self.min_distance_m and elapsed < self.max_gap_seconds:
+                    return False
+
+            self._last_kept[ride_id] = (latitude, longitude, timestamp)
+            points = self._pending.setdefault(ride_id, [])
+            points.append(RideLocation(
+                ride_id=ride_id,
+                latitude=latitude,
+                longitude=longitude,
+                speed=Decimal(str(speed)) if speed is not None else None,
+                timestamp=timestamp,
+            ))
+            full = len(points) >= self.flush_size
+
+        if full:
+            self._worker.wake()
+        return True
+
+    def pending_count(self, ride_id=None):
+        if ride_id is None:
+            return sum(len(points) for points in self._pending.values())
+        return len(self._pending.get(self._ride_key(ride_id), ()))
+
+    def flush(self, ride_id=None):
+        """Insert pending points (of one ride, or all rides); returns the number of rows written"""
+        from .models import Ride, RideLocation
+
+        with self._lock:
+            if ride_id is None:
+                pending, self._pending = self._pending, {}
+                self._evict_idle()
+            else:
+                ride_id = self._ride_key(ride_id)
+                points = self._pending.pop(ride_id, None)
+                pending = {ride_id: points} if points else {}
+        if not pending:
+            return 0
+
+        # Drop points of rides that no longer exist instead of failing the whole batch
+        existing = set(
+            Ride.objects.filter(id__in=list(pending)).values_list('id', flat=True)
+        )
+        locations = [
+            location
+            for pending_ride_id, points in pending.items()
+            if pending_ride_id in existing
+            for location in points
+        ]
+        try:
+            RideLocation.objects.bulk_create(locations, batch_size=500)
+        except Exception:
+            with self._lock:
+                for pending_ride_id, points in pending.items():
+                    self._pending[pending_ride_id] = points + self._pending.get(pending_ride_id, [])
+            raise
+        return len(locations)
+
+    def _evict_idle(self):
+        """Forget the last kept point of rides idle for longer than `idle_seconds`; caller holds the lock"""
+        cutoff = timezone.now() - timedelta(seconds=self.idle_seconds)
+        for idle_ride_id in [key for key, last in self._last_kept.items() if last[2] < cutoff]:
+            del self._last_kept[idle_ride_id]
+
+    def finish_ride(self, ride_id):
+        """Flush a ride's remaining points and forget its state"""
+        written = self.flush(ride_id)
+        with self._lock:
+            self._last_kept.pop(self._ride_key(ride_id), None)
+        return written
+
+    def shutdown(self):
+        """Stop the periodic flush and write whatever is still pending"""
+        self._worker.stop(timeout=self.flush_seconds)
+        self._worker.run_once()
+
+    @staticmethod
+    def _ride_key(ride_id):
+        """Rides are keyed by UUID whether the id arrives as a string (websocket) or a UUID"""
+        return ride_id if isinstance(ride_id, uuid.UUID) else uuid.UUID(str(ride_id))
+
+
+driver_location_buffer = DriverLocationBuffer(
+    flush_seconds=getattr(settings, 'DRIVER_LOCATION_FLUSH_SECONDS', 5),
+)
+ride_location_buffer = RideLocationBuffer(
+    flush_seconds=getattr(settings, 'RIDE_LOCATION_FLUSH_SECONDS', 5),
+    flush_size=getattr(settings, 'RIDE_LOCATION_FLUSH_SIZE', 20),
+    min_distance_m=getattr(settings, 'RIDE_LOCATION_MIN_MOVE_METERS', 10),
+    max_gap_seconds=getattr(settings, 'RIDE_LOCATION_MAX_GAP_SECONDS', 30),
+    idle_seconds=getattr(settings, 'RIDE_LOCATION_IDLE_SECONDS', 600),
+)
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.geocoding import read_osm_places, write_gazetteer
+from rides.road_network import RoadNetworkError
+
+
+class Command(BaseCommand):
+    help = 'Extract named places, points of interest and streets from an OpenStreetMap XML extract into the gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help='OSM XML extract (.osm, .osm.gz or .osm.bz2), e.g. the one used for build_road_network')
+        parser.add_argument(
+            '--output', default=getattr(settings, 'GEOCODER_GAZETTEER_PATH', ''),
+            help='Gazetteer CSV to write (default: GEOCODER_GAZETTEER_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set GEOCODER_GAZETTEER_PATH or pass --output')
+
+        start = time.perf_counter()
+        try:
+            places = read_osm_places(options['osm_file'])
+        except (OSError, RoadNetworkError) as e:
+            raise CommandError(str(e))
+        if not places:
+            raise CommandError(f"No named places or streets in {options['osm_file']}")
+        write_gazetteer(places, options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(places):,} places and streets in {time.perf_counter() - start:.1f}s -> {options['output']}"
+        ))
+        self.stdout.write("Workers reload it within GEOCODER_CHECK_SECONDS")
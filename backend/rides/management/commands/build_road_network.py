@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rides.road_network import RoadNetwork, RoadNetworkError
+
+
+class Command(BaseCommand):
+    help = 'Build the routing graph from an OpenStreetMap XML extract (.osm, .osm.gz or .osm.bz2)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help='OSM XML extract, e.g. from Geofabrik (convert .pbf with osmium cat)')
+        parser.add_argument(
+            '--output', default=getattr(settings, 'ROAD_NETWORK_PATH', ''),
+            help='Directory for the graph arrays (default: ROAD_NETWORK_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set ROAD_NETWORK_PATH or pass --output')
+
+        start = time.perf_counter()
+        try:
+            network = RoadNetwork.from_osm(options['osm_file'])
+        except (OSError, RoadNetworkError) as e:
+            raise CommandError(str(e))
+        network.save(options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built road network with {network.node_count:,} nodes and {network.edge_count:,} edges "
+            f"in {time.perf_counter() - start:.1f}s -> {options['output']}"
+        ))
+        self.stdout.write('Restart the workers to load it')
@@ -0,0 +1,42 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from rides.travel_times import TravelTimeModel, collect_trips
+
+
+class Command(BaseCommand):
+    help = 'Learn average speeds per zone pair and hour of week from completed rides (run nightly, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'TRAVEL_TIME_HISTORY_DAYS', 90),
+            help='Only learn from rides completed in the last N days (default: TRAVEL_TIME_HISTORY_DAYS)'
+        )
+        parser.add_argument(
+            '--output', default=getattr(settings, 'TRAVEL_TIME_MODEL_PATH', ''),
+            help='Where to write the model (default: TRAVEL_TIME_MODEL_PATH)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('Set TRAVEL_TIME_MODEL_PATH or pass --output')
+
+        start = time.perf_counter()
+        trips = collect_trips(since=timezone.now() - timedelta(days=options['days']))
+        try:
+            model = TravelTimeModel.build(
+                trips, zone_degrees=getattr(settings, 'TRAVEL_TIME_ZONE_DEGREES', 0.02)
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        model.save(options['output'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Learned travel times from {model.meta['trips']:,} of {len(trips):,} rides "
+            f"({model.rows}x{model.cols} zones, detour factor {model.detour_factor:.2f}) "
+            f"in {time.perf_counter() - start:.1f}s -> {options['output']}"
+        ))
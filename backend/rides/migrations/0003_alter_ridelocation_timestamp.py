@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0002_ridetemplate_scheduledride_smartsuggestion_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ridelocation',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
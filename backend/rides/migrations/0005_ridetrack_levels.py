@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0004_ridetrack'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ridetrack',
+            name='levels',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
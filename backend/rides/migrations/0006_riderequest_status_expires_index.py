@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0005_ridetrack_levels'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='riderequest',
+            index=models.Index(fields=['status', 'expires_at'], name='rides_rider_status_26b763_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0006_riderequest_status_expires_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledride',
+            name='booking_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledride',
+            index=models.Index(fields=['status', 'booking_at'], name='rides_sched_status_87eed8_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0007_scheduledride_booking_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledride',
+            name='occurrences_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScheduledRideOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurrence_datetime', models.DateTimeField()),
+                ('booking_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='scheduled', max_length=20)),
+                ('reminder_sent', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ride_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scheduled_occurrences', to='rides.riderequest')),
+                ('scheduled_ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='rides.scheduledride')),
+            ],
+            options={
+                'ordering': ['occurrence_datetime'],
+                'indexes': [models.Index(fields=['status', 'occurrence_datetime'], name='rides_sched_status_a10153_idx'), models.Index(fields=['status', 'booking_at'], name='rides_sched_status_b62131_idx'), models.Index(fields=['status', 'expires_at'], name='rides_sched_status_aedf2b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scheduled_ride', 'occurrence_datetime'), name='unique_scheduled_ride_occurrence')],
+            },
+        ),
+    ]
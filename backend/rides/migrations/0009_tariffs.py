@@ -0,0 +1,105 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:01
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_default_tariffs(apps, schema_editor):
+    """Default tariffs with the rates FareCalculationService had hardcoded"""
+    Tariff = apps.get_model('rides', 'Tariff')
+    TariffTimeRule = apps.get_model('rides', 'TariffTimeRule')
+    multipliers = {
+        'standard': Decimal('1.0'),
+        'premium': Decimal('1.5'),
+        'luxury': Decimal('2.0'),
+        'shared': Decimal('0.7'),
+    }
+    Tariff.objects.bulk_create([
+        Tariff(
+            city=None,
+            ride_type=ride_type,
+            base_fare=Decimal('50.00'),
+            rate_per_km=Decimal('15.00'),
+            rate_per_minute=Decimal('2.00'),
+            ride_type_multiplier=multiplier,
+            minutes_per_km=Decimal('3'),
+        )
+        for ride_type, multiplier in multipliers.items()
+    ])
+    TariffTimeRule.objects.bulk_create([
+        TariffTimeRule(city=None, name='Morning peak', start_hour=7, end_hour=10, multiplier=Decimal('1.3')),
+        TariffTimeRule(city=None, name='Evening peak', start_hour=17, end_hour=21, multiplier=Decimal('1.3')),
+        TariffTimeRule(city=None, name='Late night', start_hour=22, end_hour=6, multiplier=Decimal('1.2')),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0008_scheduledrideoccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingCity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('min_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('max_latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('min_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('max_longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'pricing cities',
+                'ordering': ['-priority', 'code'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TariffTimeRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('start_hour', models.PositiveSmallIntegerField()),
+                ('end_hour', models.PositiveSmallIntegerField()),
+                ('multiplier', models.DecimalField(decimal_places=4, max_digits=6)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='time_rules', to='rides.pricingcity')),
+            ],
+            options={
+                'ordering': ['city__code', 'start_hour'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ride_type', models.CharField(choices=[('standard', 'Standard'), ('premium', 'Premium'), ('luxury', 'Luxury'), ('shared', 'Shared')], max_length=20)),
+                ('base_fare', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate_per_km', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('rate_per_minute', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('ride_type_multiplier', models.DecimalField(decimal_places=4, default=1, max_digits=6)),
+                ('minimum_fare', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('minutes_per_km', models.DecimalField(decimal_places=2, default=3, max_digits=5)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('city', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tariffs', to='rides.pricingcity')),
+            ],
+            options={
+                'ordering': ['city__code', 'ride_type'],
+                'constraints': [models.UniqueConstraint(fields=('city', 'ride_type'), name='unique_city_tariff'), models.UniqueConstraint(condition=models.Q(('city__isnull', True)), fields=('ride_type',), name='unique_default_tariff')],
+            },
+        ),
+        migrations.RunPython(seed_default_tariffs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0009_tariffs'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='scheduledride',
+            name='rides_sched_status_87eed8_idx',
+        ),
+        migrations.RemoveField(
+            model_name='scheduledride',
+            name='booking_at',
+        ),
+    ]
@@ -47,6 +47,9 @@ class RideRequest(models.Model):
     
     class Meta:
         ordering = ['-requested_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
     
     def __str__(self):
         return f"Ride Request {self.id} - {self.rider.username}"
@@ -113,6 +116,21 @@ class Ride(models.Model):
     def __str__(self):
         return f"Ride {self.id} - {self.rider.username} to {self.destination_address[:30]}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._loaded_status = instance.status
+        return instance
+    
+    def status_changed(self):
+        """Whether the status differs from the one last loaded or saved; always true for new rides"""
+        return getattr(self, '_loaded_status', None) != self.status
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+    
     @property
     def duration_minutes(self):
         if self.started_at and self.completed_at:
@@ -156,7 +174,7 @@ class RideLocation(models.Model):
     ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='locations')
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     speed = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)  # km/h
     
     class Meta:
@@ -165,6 +183,26 @@ class RideLocation(models.Model):
     def __str__(self):
         return f"Location for Ride {self.ride.id} at {self.timestamp}"
 
+
+class RideTrack(models.Model):
+    """Compacted GPS track of a finished ride, replacing its RideLocation rows"""
+    
+    ride = models.OneToOneField(Ride, on_delete=models.CASCADE, related_name='track')
+    data = models.BinaryField()  # see rides.track_encoding
+    point_count = models.PositiveIntegerField(default=0)
+    levels = models.JSONField(default=dict, blank=True)  # zoom -> kept point indices, see rides.track_simplify
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Track for Ride {self.ride_id} ({self.point_count} points)"
+    
+    def points(self):
+        from .track_encoding import decode_track
+        return decode_track(self.data)
+
 # Smart Ride Features Models
 
 class FavoriteLocation(models.Model):
@@ -269,6 +307,7 @@ class ScheduledRide(models.Model):
     
     # Scheduling details
     scheduled_datetime = models.DateTimeField()
+    occurrences_until = models.DateTimeField(null=True, blank=True, editable=False)  # occurrences materialized up to here
     recurring_pattern = models.CharField(max_length=20, choices=RECURRING_CHOICES, default='none')
     recurring_end_date = models.DateField(null=True, blank=True)
     
@@ -297,6 +336,34 @@ class ScheduledRide(models.Model):
     def __str__(self):
         return f"Scheduled ride for {self.user.username} at {self.scheduled_datetime}"
     
+    # Fields that define when the series occurs; changing any of them recomputes its occurrences
+    RECURRENCE_FIELDS = (
+        'scheduled_datetime', 'recurring_pattern', 'recurring_end_date',
+        'advance_booking_time', 'max_wait_time',
+    )
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if set(cls.RECURRENCE_FIELDS) <= set(field_names):
+            instance._loaded_recurrence = instance._recurrence()
+        return instance
+    
+    def _recurrence(self):
+        return tuple(getattr(self, field) for field in self.RECURRENCE_FIELDS)
+    
+    def recurrence_changed(self):
+        return getattr(self, '_loaded_recurrence', None) != self._recurrence()
+    
+    def save(self, *args, **kwargs):
+        if self.recurrence_changed():
+            self.occurrences_until = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'occurrences_until'}
+        super().save(*args, **kwargs)
+        self._loaded_recurrence = self._recurrence()
+    
     def is_due_for_booking(self):
         """Check if it's time to start looking for a driver"""
         now = timezone.now()
@@ -308,6 +375,49 @@ class ScheduledRide(models.Model):
         now = timezone.now()
         expiry_time = self.scheduled_datetime + timedelta(minutes=self.max_wait_time)
         return now > expiry_time and self.status in ['scheduled', 'confirmed']
+    
+    @property
+    def is_recurring(self):
+        return self.recurring_pattern not in ('none', 'custom')
+
+
+class ScheduledRideOccurrence(models.Model):
+    """One dated occurrence of a scheduled ride, materialized ahead of time for recurring series"""
+    
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('confirmed', 'Confirmed'),
+        ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
+    ]
+    
+    scheduled_ride = models.ForeignKey(ScheduledRide, on_delete=models.CASCADE, related_name='occurrences')
+    occurrence_datetime = models.DateTimeField()
+    booking_at = models.DateTimeField()  # occurrence_datetime - advance_booking_time
+    expires_at = models.DateTimeField()  # occurrence_datetime + max_wait_time
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    ride_request = models.ForeignKey(
+        RideRequest, on_delete=models.SET_NULL, null=True, blank=True, related_name='scheduled_occurrences'
+    )
+    reminder_sent = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['occurrence_datetime']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scheduled_ride', 'occurrence_datetime'], name='unique_scheduled_ride_occurrence'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'occurrence_datetime']),
+            models.Index(fields=['status', 'booking_at']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"Occurrence of {self.scheduled_ride_id} at {self.occurrence_datetime}"
 
 
 class SmartSuggestion(models.Model):
@@ -349,3 +459,73 @@ class SmartSuggestion(models.Model):
     
     def __str__(self):
         return f"Suggestion for {self.user.username}: {self.title}"
+
+
+class PricingCity(models.Model):
+    """Area with its own tariffs, matched on the bounding box of the pickup point"""
+    
+    code = models.SlugField(max_length=50, unique=True)
+    name = models.CharField(max_length=100)
+    min_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    max_latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    min_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    max_longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    priority = models.IntegerField(default=0)  # overlapping boxes: the highest priority wins
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-priority', 'code']
+        verbose_name_plural = 'pricing cities'
+    
+    def __str__(self):
+        return self.name
+
+
+class Tariff(models.Model):
+    """Fare rates of one ride type, in one city or (without a city) everywhere else"""
+    
+    city = models.ForeignKey(PricingCity, on_delete=models.CASCADE, null=True, blank=True, related_name='tariffs')
+    ride_type = models.CharField(max_length=20, choices=RideRequest.RIDE_TYPE_CHOICES)
+    base_fare = models.DecimalField(max_digits=10, decimal_places=2)
+    rate_per_km = models.DecimalField(max_digits=10, decimal_places=2)
+    rate_per_minute = models.DecimalField(max_digits=10, decimal_places=2)
+    ride_type_multiplier = models.DecimalField(max_digits=6, decimal_places=4, default=1)
+    minimum_fare = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    minutes_per_km = models.DecimalField(max_digits=5, decimal_places=2, default=3)  # estimated trip time
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['city__code', 'ride_type']
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'ride_type'], name='unique_city_tariff'),
+            models.UniqueConstraint(
+                fields=['ride_type'], condition=models.Q(city__isnull=True), name='unique_default_tariff'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.city or 'Default'} {self.ride_type}"
+
+
+class TariffTimeRule(models.Model):
+    """Time-of-day fare multiplier for local hours [start_hour, end_hour), wrapping past midnight"""
+    
+    city = models.ForeignKey(PricingCity, on_delete=models.CASCADE, null=True, blank=True, related_name='time_rules')
+    name = models.CharField(max_length=50)
+    start_hour = models.PositiveSmallIntegerField()  # 0-23
+    end_hour = models.PositiveSmallIntegerField()  # 1-24, below start_hour to wrap past midnight
+    multiplier = models.DecimalField(max_digits=6, decimal_places=4)
+    priority = models.IntegerField(default=0)  # overlapping rules: the highest priority wins
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['city__code', 'start_hour']
+    
+    def __str__(self):
+        return f"{self.city or 'Default'} {self.name} ({self.start_hour}:00-{self.end_hour}:00)"
@@ -0,0 +1,280 @@
+"""Who is connected right now
+
+Consumers report their connections (connect, heartbeat, disconnect) and
+REST location pings count as heartbeats too. Every connection expires
+`ttl_seconds` after its last heartbeat unless it is refreshed. A member
+(a driver or a user) is online while any of its connections is live.
+Lookups are O(1) per member.
+
+Two backends are available:
+
+* RedisPresenceBackend (default when PRESENCE_REDIS_URL is set): a sorted
+  set of member expiries per role plus one hash of connections per member,
+  shared by all workers
+* LocalPresenceBackend (default otherwise): dicts in this process, enough
+  for a single worker
+
+With PRESENCE_REQUIRED_FOR_DISPATCH and a shared backend, only online
+drivers stay in the matching index. The periodic sweep evicts drivers whose
+app stopped sending heartbeats without disconnecting. A local backend only
+sees the sockets of its own process, so it never takes drivers out of
+matching. While the backend is unreachable, dispatch ignores presence.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .background import PeriodicWorker
+
+DRIVER = 'driver'
+USER = 'user'
+ROLES = (DRIVER, USER)
+
+HTTP_CONNECTION = 'http'  # pseudo-connection for REST heartbeats
+
+
+class LocalPresenceBackend:
+    """Presence kept in this process"""
+
+    blocking = False
+    shared = False
+    name = 'local'
+    errors = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {role: {} for role in ROLES}  # role -> member -> {connection: expires at}
+
+    def touch(self, role, member, connection, expires_at, now):
+        """Refresh a connection; True if the member was offline before"""
+        with self._lock:
+            connections = self._members[role].setdefault(member, {})
+            was_online = any(expiry > now for expiry in connections.values())
+            connections[connection] = expires_at
+        return not was_online
+
+    def leave(self, role, member, connection, now):
+        """Drop a connection; True if the member is offline now"""
+        with self._lock:
+            connections = self._members[role].get(member)
+            if connections is None:
+                return True
+            connections.pop(connection, None)
+            if any(expiry > now for expiry in connections.values()):
+                return False
+            del self._members[role][member]
+            return True
+
+    def is_online(self, role, member, now):
+        connections = self._members[role].get(member)
+        return bool(connections) and any(expiry > now for expiry in list(connections.values()))
+
+    def online(self, role, members, now):
+        return {member for member in members if self.is_online(role, member, now)}
+
+    def count(self, role, now):
+        self.purge(role, now)
+        return len(self._members[role])
+
+    def purge(self, role, now):
+        """Forget expired connections and members"""
+        with self._lock:
+            members = self._members[role]
+            for member, connections in list(members.items()):
+                for connection, expiry in list(connections.items()):
+                    if expiry <= now:
+                        del connections[connection]
+                if not connections:
+                    del members[member]
+
+
+class RedisPresenceBackend:
+    """Presence shared by all workers through Redis
+
+    `{prefix}:{role}` is a sorted set of members scored by their latest
+    connection expiry, and `{prefix}:{role}:{member}` hashes connections
+    to their expiries. Hashes carry a Redis TTL, so crashed workers leave
+    nothing behind. Needs Redis 6.2 or later (ZADD GT, ZMSCORE).
+    """
+
+    blocking = True
+    shared = True
+    name = 'redis'
+
+    def __init__(self, url, prefix='presence'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.errors = (redis.RedisError,)
+
+    def _members_key(self, role):
+        return f'{self.prefix}:{role}'
+
+    def _connections_key(self, role, member):
+        return f'{self.prefix}:{role}:{member}'
+
+    def touch(self, role, member, connection, expires_at, now):
+        members_key = self._members_key(role)
+        connections_key = self._connections_key(role, member)
+        pipe = self._redis.pipeline()
+        pipe.zscore(members_key, member)
+        pipe.hset(connections_key, connection, expires_at)
+        pipe.expireat(connections_key, int(expires_at) + 1)
+        pipe.zadd(members_key, {member: expires_at}, gt=True)
+        previous = pipe.execute()[0]
+        return previous is None or previous <= now
+
+    def leave(self, role, member, connection, now):
+        members_key = self._members_key(role)
+        connections_key = self._connections_key(role, member)
+        pipe = self._redis.pipeline()
+        pipe.hdel(connections_key, connection)
+        pipe.hvals(connections_key)
+        remaining = [float(expiry) for expiry in pipe.execute()[1]]
+        live = [expiry for expiry in remaining if expiry > now]
+        if live:
+            self._redis.zadd(members_key, {member: max(live)})
+            return False
+        pipe = self._redis.pipeline()
+        pipe.zrem(members_key, member)
+        pipe.delete(connections_key)
+        pipe.execute()
+        return True
+
+    def is_online(self, role, member, now):
+        expiry = self._redis.zscore(self._members_key(role), member)
+        return expiry is not None and expiry > now
+
+    def online(self, role, members, now):
+        members = list(members)
+        if not members:
+            return set()
+        expiries = self._redis.zmscore(self._members_key(role), members)
+        return {member for member, expiry in zip(members, expiries) if expiry is not None and expiry > now}
+
+    def count(self, role, now):
+        return self._redis.zcount(self._members_key(role), f'({now}', '+inf')
+
+    def purge(self, role, now):
+        self._redis.zremrangebyscore(self._members_key(role), '-inf', now)
+
+
+class PresenceRegistry:
+    """Heartbeat-based presence of drivers and users
+
+    Heartbeats from one connection are written at most every quarter TTL,
+    so chatty sockets (location frames count as heartbeats) cost a dict
+    lookup, not a backend write.
+    """
+
+    def __init__(self, backend, ttl_seconds=60, sweep_seconds=15, require_for_dispatch=True):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        # Presence seen by one process only would hide drivers connected to the others
+        self.require_for_dispatch = require_for_dispatch and backend.shared
+        self._written = {}  # (role, member, connection) -> time of the last backend write
+        self._worker = PeriodicWorker('presence-sweep', sweep_seconds, self.sweep)
+
+    @property
+    def blocking(self):
+        """Whether calls do network I/O (async callers should run them in a thread)"""
+        return self.backend.blocking
+
+    def due(self, role, member, connection=HTTP_CONNECTION):
+        """Whether a heartbeat from this connection would be written to the backend"""
+        written = self._written.get((role, member, connection))
+        return written is None or time.time() - written >= self.ttl_seconds / 4
+
+    def touch(self, role, member, connection=HTTP_CONNECTION):
+        """Record a heartbeat; True when the member just came online"""
+        self._worker.start()
+        if not self.due(role, member, connection):
+            return False
+        now = time.time()
+        try:
+            came_online = self.backend.touch(role, member, connection, now + self.ttl_seconds, now)
+        except self.backend.errors as e:
+            print(f"Presence backend unavailable: {e}")
+            return False
+        self._written[(role, member, connection)] = now
+        return came_online
+
+    def leave(self, role, member, connection):
+        """Record a disconnect; True when the member has no live connection left"""
+        self._written.pop((role, member, connection), None)
+        try:
+            return self.backend.leave(role, member, connection, time.time())
+        except self.backend.errors as e:
+            print(f"Presence backend unavailable: {e}")
+            return False
+
+    def is_online(self, role, member):
+        """Whether the member is online, None while the backend is unreachable"""
+        try:
+            return self.backend.is_online(role, member, time.time())
+        except self.backend.errors as e:
+            print(f"Presence backend unavailable: {e}")
+            return None
+
+    def online(self, role, members):
+        """The subset of `members` that is online, None while the backend is unreachable"""
+        try:
+            return self.backend.online(role, members, time.time())
+        except self.backend.errors as e:
+            print(f"Presence backend unavailable: {e}")
+            return None
+
+    def count(self, role):
+        """Members online, None while the backend is unreachable"""
+        try:
+            return self.backend.count(role, time.time())
+        except self.backend.errors as e:
+            print(f"Presence backend unavailable: {e}")
+            return None
+
+    def dispatchable(self, driver_ids):
+        """Drivers that may be offered rides: the online ones, or all when presence is not enforced"""
+        if not self.require_for_dispatch:
+            return set(driver_ids)
+        online = self.online(DRIVER, driver_ids)
+        # Dispatch without presence while the backend is unreachable
+        return set(driver_ids) if online is None else online
+
+    def sweep(self):
+        """Expire stale connections and evict offline drivers from the matching index"""
+        now = time.time()
+        for role in ROLES:
+            self.backend.purge(role, now)
+        for key, written in list(self._written.items()):
+            if now - written > self.ttl_seconds:
+                self._written.pop(key, None)
+
+        if self.require_for_dispatch:
+            from .services import LocationService
+            LocationService.evict_offline_drivers()
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'drivers_online': self.count(DRIVER),
+            'users_online': self.count(USER),
+            'ttl_seconds': self.ttl_seconds,
+            'required_for_dispatch': self.require_for_dispatch,
+        }
+
+
+def _backend():
+    redis_url = getattr(settings, 'PRESENCE_REDIS_URL', '')
+    if getattr(settings, 'PRESENCE_BACKEND', 'redis' if redis_url else 'local') == 'local':
+        return LocalPresenceBackend()
+    return RedisPresenceBackend(redis_url or 'redis://127.0.0.1:6379/1')
+
+
+presence = PresenceRegistry(
+    _backend(),
+    ttl_seconds=getattr(settings, 'PRESENCE_TTL_SECONDS', 60),
+    sweep_seconds=getattr(settings, 'PRESENCE_SWEEP_SECONDS', 15),
+    require_for_dispatch=getattr(settings, 'PRESENCE_REQUIRED_FOR_DISPATCH', True),
+)
@@ -0,0 +1,159 @@
+import calendar
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+WEEKEND = (5, 6)  # Saturday, Sunday
+
+
+def _add_months(moment, months):
+    """Same wall-clock time `months` later, clamped to the last day of shorter months"""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def expand(scheduled_ride, after, until):
+    """Occurrence datetimes of a scheduled ride in (after, until], in order
+
+    Recurrence steps by calendar days in local time, so a series keeps its
+    wall-clock time across DST changes. `custom` has no stored rule and is
+    treated as a single occurrence, like `none`.
+    """
+    start = timezone.localtime(scheduled_ride.scheduled_datetime)
+    pattern = scheduled_ride.recurring_pattern
+    last = until
+    if scheduled_ride.recurring_end_date and pattern not in ('none', 'custom'):
+        end_of_day = datetime.combine(scheduled_ride.recurring_end_date, dt_time.max)
+        last = min(until, timezone.make_aware(end_of_day, start.tzinfo))
+
+    if pattern not in ('daily', 'weekly', 'weekdays', 'monthly'):
+        return [start] if after < start <= until else []
+
+    occurrences = []
+    step = 0
+    if pattern in ('daily', 'weekdays', 'weekly') and after > start:
+        # Jump close to `after` instead of walking the whole history of old series
+        days = (after - start).days
+        step = days // 7 if pattern == 'weekly' else days
+    while True:
+        if pattern == 'monthly':
+            moment = _add_months(start, step)
+        elif pattern == 'weekly':
+            moment = start + timedelta(weeks=step)
+        else:
+            moment = start + timedelta(days=step)
+        step += 1
+        if moment > last:
+            break
+        if moment <= after or (pattern == 'weekdays' and moment.weekday() in WEEKEND):
+            continue
+        occurrences.append(moment)
+    return occurrences
+
+
+class OccurrenceEngine:
+    """Materializes the upcoming occurrences of scheduled rides into ScheduledRideOccurrence rows
+
+    Every series is expanded `horizon_days` ahead. Series are extended
+    incrementally from where they were last expanded, and only recomputed
+    (pending occurrences dropped and regenerated) when one of their
+    recurrence fields changes. Readers then range-scan the occurrence table.
+    """
+
+    def __init__(self, horizon_days=14):
+        self.horizon_days = horizon_days
+
+    def horizon(self, now=None):
+        return (now or timezone.now()) + timedelta(days=self.horizon_days)
+
+    def series_saved(self, scheduled_ride):
+        """Sync the occurrences of a series after it was created or edited"""
+        if scheduled_ride.status == 'cancelled':
+            self._drop_pending(scheduled_ride, 'cancelled')
+            return
+        if scheduled_ride.status == 'scheduled' and scheduled_ride.occurrences_until is None:
+            self._drop_pending(scheduled_ride, None)
+            self.materialize(scheduled_ride)
+
+    def _drop_pending(self, scheduled_ride, status):
+        """Cancel (or delete, when status is None) occurrences not booked yet"""
+        from .models import ScheduledRideOccurrence
+        from .scheduling import scheduled_ride_dispatcher
+
+        pending = ScheduledRideOccurrence.objects.filter(scheduled_ride=scheduled_ride, status='scheduled')
+        occurrence_ids = list(pending.values_list('id', flat=True))
+        if not occurrence_ids:
+            return
+        pending = ScheduledRideOccurrence.objects.filter(id__in=occurrence_ids, status='scheduled')
+        if status is None:
+            pending.delete()
+        else:
+            pending.update(status=status, updated_at=timezone.now())
+        scheduled_ride_dispatcher.discard(occurrence_ids)
+
+    def materialize(self, scheduled_ride, until=None):
+        """Create the series' occurrences up to `until` that do not exist yet; returns the new rows"""
+        from .models import ScheduledRide, ScheduledRideOccurrence
+        from .scheduling import scheduled_ride_dispatcher
+
+        now = timezone.now()
+        until = until or self.horizon(now)
+        # A recomputed series restarts from now; anything earlier was already due
+        after = scheduled_ride.occurrences_until or min(now, scheduled_ride.scheduled_datetime - timedelta(seconds=1))
+        if after >= until:
+            return []
+
+        advance = timedelta(minutes=scheduled_ride.advance_booking_time)
+        wait = timedelta(minutes=scheduled_ride.max_wait_time)
+        moments = expand(scheduled_ride, after, until)
+        ScheduledRideOccurrence.objects.bulk_create(
+            [
+                ScheduledRideOccurrence(
+                    scheduled_ride=scheduled_ride,
+                    occurrence_datetime=moment,
+                    booking_at=moment - advance,
+                    expires_at=moment + wait,
+                )
+                for moment in moments
+            ],
+            ignore_conflicts=True,
+        )
+        ScheduledRide.objects.filter(id=scheduled_ride.id).update(occurrences_until=until)
+        scheduled_ride.occurrences_until = until
+
+        # ignore_conflicts leaves primary keys unset, so read the rows back
+        created = list(ScheduledRideOccurrence.objects.filter(
+            scheduled_ride=scheduled_ride, status='scheduled',
+            occurrence_datetime__gt=after, occurrence_datetime__lte=until,
+        )) if moments else []
+        scheduled_ride_dispatcher.schedule_occurrences(created)
+        return created
+
+    def extend_all(self, needed_until=None):
+        """Extend every active series whose occurrences end before `needed_until`; returns the series count"""
+        from django.db.models import Q
+        from .models import ScheduledRide
+
+        now = timezone.now()
+        needed_until = needed_until or now + timedelta(days=self.horizon_days / 2)
+        stale = ScheduledRide.objects.filter(
+            Q(occurrences_until__isnull=True) | Q(occurrences_until__lt=needed_until),
+            Q(recurring_end_date__isnull=True) | Q(recurring_end_date__gte=timezone.localdate(now)),
+            status='scheduled',
+        )
+        count = 0
+        for scheduled_ride in stale.iterator():
+            if scheduled_ride.occurrences_until is None:
+                self.series_saved(scheduled_ride)
+            else:
+                self.materialize(scheduled_ride, self.horizon(now))
+            count += 1
+        return count
+
+
+occurrence_engine = OccurrenceEngine(
+    horizon_days=getattr(settings, 'SCHEDULED_RIDE_OCCURRENCE_HORIZON_DAYS', 14),
+)
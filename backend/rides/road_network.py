@@ -0,0 +1,534 @@
+"""Offline road routing on a graph built from an OpenStreetMap extract
+
+The drivable ways of an OSM XML extract (.osm, optionally .gz/.bz2) become a
+directed graph stored as compressed sparse row (CSR) numpy arrays: per node
+an offset into flat edge arrays of targets, travel seconds and meters, plus
+a reverse CSR listing incoming edge ids for backward searches. A coarse
+lat/lng grid over the nodes snaps coordinates onto the graph.
+
+`build_road_network` writes the arrays as .npy files; workers memory-map
+them, so startup is a handful of page-ins and all processes share the
+pages. Point-to-point queries run a bidirectional A* with an
+equirectangular lower bound on travel time; many-to-one ETAs run a single
+backward Dijkstra from the destination.
+"""
+import bz2
+import gzip
+import heapq
+import json
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from django.conf import settings
+
+from .spatial_index import EARTH_RADIUS_KM, haversine_km
+
+FORMAT_VERSION = 1
+
+# Typical free-flow speeds (km/h) in Kathmandu traffic by OSM highway class.
+# A lower posted maxspeed wins; ways of other classes are not drivable.
+HIGHWAY_SPEEDS_KMH = {
+    'motorway': 70, 'motorway_link': 40,
+    'trunk': 45, 'trunk_link': 30,
+    'primary': 35, 'primary_link': 25,
+    'secondary': 30, 'secondary_link': 25,
+    'tertiary': 25, 'tertiary_link': 20,
+    'unclassified': 20, 'residential': 18,
+    'living_street': 10, 'service': 12, 'road': 18,
+}
+
+# Travel speed assumed between a coordinate and the graph node it snaps to
+SNAP_SPEED_KMH = 12
+
+GRID_DEGREES = 0.005  # ~550 m cells for snapping
+
+ARRAYS = (
+    'latitudes', 'longitudes',
+    'offsets', 'sources', 'targets', 'seconds', 'meters',
+    'reverse_offsets', 'reverse_edges',
+    'cell_keys', 'cell_starts', 'cell_nodes',
+)
+
+METERS_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_KM * 1000 / 360
+
+
+class RoadNetworkError(Exception):
+    pass
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _speed_kmh(tags):
+    """Travel speed of a way, None when cars cannot use it"""
+    speed = HIGHWAY_SPEEDS_KMH.get(tags.get('highway'))
+    if speed is None or tags.get('area') == 'yes':
+        return None
+    if tags.get('access') in ('no', 'private') or tags.get('motor_vehicle') in ('no', 'private'):
+        return None
+
+    maxspeed = tags.get('maxspeed', '').strip().lower()
+    try:
+        if maxspeed.endswith('mph'):
+            posted = float(maxspeed[:-3]) * 1.609
+        else:
+            posted = float(maxspeed.replace('km/h', '').replace('kmh', ''))
+    except ValueError:
+        posted = None  # missing or symbolic ('NP:urban')
+    return min(speed, posted) if posted else speed
+
+
+def _direction(tags):
+    """1 for one-way along the way, -1 against it, 0 for both directions"""
+    oneway = tags.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway == 'no':
+        return 0
+    if tags.get('junction') in ('roundabout', 'circular') or tags.get('highway') in ('motorway', 'motorway_link'):
+        return 1
+    return 0
+
+
+def read_osm(path):
+    """Node coordinates and drivable ways of an OSM XML extract: ({id: (lat, lng)}, [(node ids, km/h, direction)])"""
+    with _open(path) as stream:
+        try:
+            return _parse(stream)
+        except ET.ParseError as e:
+            raise RoadNetworkError(f'Invalid OSM XML in {path}: {e}')
+
+
+def _parse(stream):
+    coordinates = {}
+    ways = []
+    refs, tags = [], {}
+    for _, element in ET.iterparse(stream, events=('end',)):
+        if element.tag == 'node':
+            coordinates[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+        elif element.tag == 'nd':
+            refs.append(int(element.get('ref')))
+        elif element.tag == 'tag':
+            tags[element.get('k')] = element.get('v')
+        elif element.tag == 'way':
+            speed = _speed_kmh(tags)
+            if speed and len(refs) > 1:
+                ways.append((refs, speed, _direction(tags)))
+        else:
+            continue
+        if element.tag in ('node', 'way', 'relation'):
+            refs, tags = [], {}
+            element.clear()
+    return coordinates, ways
+
+
+class RoadNetwork:
+    """Directed road graph in CSR arrays with snapping and bidirectional A* queries"""
+
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            # Plain ndarray views of memory-mapped files skip np.memmap's per-slice overhead
+            setattr(self, name, np.asarray(arrays[name]))
+        self.meta = meta
+        self.max_speed_mps = meta['max_speed_kmh'] / 3.6
+        self.grid_degrees = meta['grid_degrees']
+        # Smallest cos(latitude) in the graph keeps the equirectangular bound below real distances
+        self.min_cos_latitude = meta['min_cos_latitude']
+
+    @property
+    def node_count(self):
+        return len(self.latitudes)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    # Building and persistence
+
+    @classmethod
+    def from_osm(cls, path):
+        coordinates, ways = read_osm(path)
+        return cls.from_ways(coordinates, ways)
+
+    @classmethod
+    def from_ways(cls, coordinates, ways, grid_degrees=GRID_DEGREES):
+        """Build the graph from node coordinates and (node ids, km/h, direction) ways"""
+        node_index = {}
+        sources, targets, speeds = [], [], []
+        for refs, speed, direction in ways:
+            refs = [ref for ref in refs if ref in coordinates]  # extracts clip ways at the border
+            indices = [node_index.setdefault(ref, len(node_index)) for ref in refs]
+            for a, b in zip(indices, indices[1:]):
+                if a == b:
+                    continue
+                if direction >= 0:
+                    sources.append(a)
+                    targets.append(b)
+                    speeds.append(speed)
+                if direction <= 0:
+                    sources.append(b)
+                    targets.append(a)
+                    speeds.append(speed)
+        if not sources:
+            raise RoadNetworkError('No drivable roads in the extract')
+
+        node_ids = sorted(node_index, key=node_index.get)
+        latitudes = np.array([coordinates[node_id][0] for node_id in node_ids], dtype=np.float64)
+        longitudes = np.array([coordinates[node_id][1] for node_id in node_ids], dtype=np.float64)
+        sources = np.array(sources, dtype=np.int32)
+        targets = np.array(targets, dtype=np.int32)
+        speeds = np.array(speeds, dtype=np.float64)
+
+        meters = haversine_km(
+            latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets]
+        ) * 1000
+        seconds = meters / (speeds / 3.6)
+
+        # Forward CSR: edges grouped by source node
+        order = np.argsort(sources, kind='stable')
+        sources, targets, meters, seconds = sources[order], targets[order], meters[order], seconds[order]
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=offsets[1:])
+
+        # Reverse CSR: ids of incoming edges grouped by target node
+        reverse_edges = np.argsort(targets, kind='stable').astype(np.int32)
+        reverse_offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=len(node_ids)), out=reverse_offsets[1:])
+
+        cell_keys, cell_starts, cell_nodes = cls._build_grid(latitudes, longitudes, grid_degrees)
+
+        arrays = {
+            'latitudes': latitudes,
+            'longitudes': longitudes,
+            'offsets': offsets,
+            'sources': sources,
+            'targets': targets,
+            'seconds': seconds.astype(np.float32),
+            'meters': meters.astype(np.float32),
+            'reverse_offsets': reverse_offsets,
+            'reverse_edges': reverse_edges,
+            'cell_keys': cell_keys,
+            'cell_starts': cell_starts,
+            'cell_nodes': cell_nodes,
+        }
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'nodes': len(node_ids),
+            'edges': len(targets),
+            'max_speed_kmh': float(speeds.max()),
+            'grid_degrees': grid_degrees,
+            'min_cos_latitude': math.cos(math.radians(float(np.abs(latitudes).max()))),
+        }
+        return cls(arrays, meta)
+
+    @staticmethod
+    def _cell_keys(rows, cols):
+        return rows.astype(np.int64) * 2 ** 32 + (cols.astype(np.int64) + 2 ** 31)
+
+    @classmethod
+    def _build_grid(cls, latitudes, longitudes, grid_degrees):
+        """Nodes sorted by grid cell, with the distinct cell keys and where each cell starts"""
+        keys = cls._cell_keys(
+            np.floor(latitudes / grid_degrees), np.floor(longitudes / grid_degrees)
+        )
+        cell_nodes = np.argsort(keys, kind='stable').astype(np.int32)
+        cell_keys, cell_starts = np.unique(keys[cell_nodes], return_index=True)
+        cell_starts = np.append(cell_starts, len(cell_nodes)).astype(np.int64)
+        return cell_keys, cell_starts, cell_nodes
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        # Written last: a directory without meta.json is an unfinished build
+        with open(os.path.join(directory, 'meta.json'), 'w') as meta_file:
+            json.dump(self.meta, meta_file, indent=2)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Open a saved graph, memory-mapped so pages are shared and loaded on demand"""
+        meta_path = os.path.join(directory, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise RoadNetworkError(f'No road network at {directory}; run manage.py build_road_network')
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise RoadNetworkError(f'Road network at {directory} is outdated; rebuild it')
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name in ARRAYS
+        }
+        return cls(arrays, meta)
+
+    # Queries
+
+    def nearest_node(self, latitude, longitude, max_meters=500):
+        """(node, meters) of the graph node closest to a coordinate, None beyond max_meters"""
+        latitude, longitude = float(latitude), float(longitude)
+        row = math.floor(latitude / self.grid_degrees)
+        col = math.floor(longitude / self.grid_degrees)
+        cell_meters = self.grid_degrees * METERS_PER_DEGREE * self.min_cos_latitude
+        reach = max(1, math.ceil(max_meters / cell_meters))
+
+        rows, cols = np.meshgrid(
+            np.arange(row - reach, row + reach + 1), np.arange(col - reach, col + reach + 1)
+        )
+        keys = self._cell_keys(rows.ravel(), cols.ravel())
+        positions = np.searchsorted(self.cell_keys, keys)
+        inside = positions < len(self.cell_keys)
+        positions, keys = positions[inside], keys[inside]
+        positions = positions[self.cell_keys[positions] == keys]
+        if not len(positions):
+            return None
+
+        candidates = np.concatenate([
+            self.cell_nodes[self.cell_starts[position]:self.cell_starts[position + 1]]
+            for position in positions
+        ])
+        distances = haversine_km(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates]) * 1000
+        best = int(np.argmin(distances))
+        if distances[best] > max_meters:
+            return None
+        return int(candidates[best]), float(distances[best])
+
+    def shortest_path(self, source, target):
+        """(seconds, edge ids in order) of the fastest path between two nodes, None if unreachable"""
+        if source == target:
+            return 0.0, []
+
+        # Scalar reads and .tolist() slices: each node has only a few edges, so
+        # per-call numpy overhead would dominate vectorized neighbour handling
+        latitudes, longitudes = self.latitudes, self.longitudes
+        source_lat, source_lng = latitudes.item(source), longitudes.item(source)
+        target_lat, target_lng = latitudes.item(target), longitudes.item(target)
+        lng_scale = self.min_cos_latitude
+        degrees_per_second = self.max_speed_mps / METERS_PER_DEGREE
+        hypot = math.hypot
+        potentials = {}
+
+        def potential(node):
+            # Average of the forward and backward lower bounds: consistent for both searches
+            value = potentials.get(node)
+            if value is None:
+                lat, lng = latitudes.item(node), longitudes.item(node)
+                to_target = hypot(lat - target_lat, (lng - target_lng) * lng_scale)
+                from_source = hypot(lat - source_lat, (lng - source_lng) * lng_scale)
+                value = potentials[node] = (to_target - from_source) / (2 * degrees_per_second)
+            return value
+
+        offsets, targets, seconds = self.offsets, self.targets, self.seconds
+        reverse_offsets, reverse_edges, sources = self.reverse_offsets, self.reverse_edges, self.sources
+        distances = ({source: 0.0}, {target: 0.0})
+        parents = ({source: -1}, {target: -1})  # node -> edge id it was reached by
+        heaps = ([(potential(source), source)], [(-potential(target), target)])
+        settled = (set(), set())
+        best, meeting = math.inf, None
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            _, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            if side == 0:
+                first, last = offsets.item(node), offsets.item(node + 1)
+                edges = range(first, last)
+                neighbours = targets[first:last].tolist()
+                weights = seconds[first:last].tolist()
+                sign = 1
+            else:
+                first, last = reverse_offsets.item(node), reverse_offsets.item(node + 1)
+                edges = reverse_edges[first:last]
+                neighbours = sources.take(edges).tolist()
+                weights = seconds.take(edges).tolist()
+                edges = edges.tolist()
+                sign = -1
+
+            here = distances[side][node]
+            own, other, parent, heap = distances[side], distances[1 - side], parents[side], heaps[side]
+            for edge, neighbour, weight in zip(edges, neighbours, weights):
+                distance = here + weight
+                if distance < own.get(neighbour, math.inf):
+                    own[neighbour] = distance
+                    parent[neighbour] = edge
+                    heapq.heappush(heap, (distance + sign * potential(neighbour), neighbour))
+                    if neighbour in other and distance + other[neighbour] < best:
+                        best, meeting = distance + other[neighbour], neighbour
+
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while parents[0][node] != -1:
+            edge = parents[0][node]
+            path.append(edge)
+            node = sources.item(edge)
+        path.reverse()
+        node = meeting
+        while parents[1][node] != -1:
+            edge = parents[1][node]
+            path.append(edge)
+            node = targets.item(edge)
+        return best, path
+
+    def travel_times_to(self, target, origins, max_seconds=math.inf):
+        """(seconds, meters) of the fastest path from each origin node to target, None if not reached
+
+        One backward Dijkstra from the target over incoming edges, stopped once
+        every origin is settled or the frontier passes max_seconds.
+        """
+        reverse_offsets, reverse_edges = self.reverse_offsets, self.reverse_edges
+        sources, seconds, meters = self.sources, self.seconds, self.meters
+        remaining = set(origins)
+        found = {}
+        times = {target: 0.0}
+        lengths = {target: 0.0}
+        heap = [(0.0, target)]
+        settled = set()
+
+        while heap and remaining:
+            time_here, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if time_here > max_seconds:
+                break
+            settled.add(node)
+            length_here = lengths[node]
+            if node in remaining:
+                remaining.discard(node)
+                found[node] = (time_here, length_here)
+
+            edges = reverse_edges[reverse_offsets.item(node):reverse_offsets.item(node + 1)]
+            for neighbour, weight, length in zip(
+                sources.take(edges).tolist(), seconds.take(edges).tolist(), meters.take(edges).tolist()
+            ):
+                time_there = time_here + weight
+                if time_there < times.get(neighbour, math.inf):
+                    times[neighbour] = time_there
+                    lengths[neighbour] = length_here + length
+                    heapq.heappush(heap, (time_there, neighbour))
+
+        return [found.get(origin) for origin in origins]
+
+    def many_to_one(self, origins, to_lat, to_lng, snap_meters=500, max_seconds=math.inf):
+        """Road {'meters', 'seconds'} from each (lat, lng) origin to one destination, None where unroutable
+
+        Costs a single backward search however many origins there are.
+        """
+        destination = self.nearest_node(to_lat, to_lng, snap_meters)
+        if destination is None:
+            return [None] * len(origins)
+        snapped = [self.nearest_node(lat, lng, snap_meters) for lat, lng in origins]
+        times = self.travel_times_to(
+            destination[0], [origin[0] for origin in snapped if origin is not None], max_seconds
+        )
+        times = iter(times)
+
+        results = []
+        for origin in snapped:
+            reached = next(times) if origin is not None else None
+            if reached is None:
+                results.append(None)
+                continue
+            snap_total = origin[1] + destination[1]
+            results.append({
+                'meters': reached[1] + snap_total,
+                'seconds': reached[0] + snap_total / (SNAP_SPEED_KMH / 3.6),
+            })
+        return results
+
+    def route(self, from_lat, from_lng, to_lat, to_lng, snap_meters=500):
+        """Fastest road route between two coordinates, None if either is off the graph or unreachable
+
+        Returns meters, seconds and the route as (lat, lng) points, including
+        the legs between the coordinates and the nodes they snap to.
+        """
+        origin = self.nearest_node(from_lat, from_lng, snap_meters)
+        destination = self.nearest_node(to_lat, to_lng, snap_meters)
+        if origin is None or destination is None:
+            return None
+        result = self.shortest_path(origin[0], destination[0])
+        if result is None:
+            return None
+
+        seconds, edges = result
+        snap_meters_total = origin[1] + destination[1]
+        nodes = [origin[0]] + self.targets[edges].tolist()
+        points = [(float(from_lat), float(from_lng))]
+        points += zip(self.latitudes[nodes].tolist(), self.longitudes[nodes].tolist())
+        points.append((float(to_lat), float(to_lng)))
+        return {
+            'meters': float(self.meters[edges].sum()) + snap_meters_total,
+            'seconds': seconds + snap_meters_total / (SNAP_SPEED_KMH / 3.6),
+            'points': points,
+        }
+
+
+class RoadNetworkStore:
+    """Lazily opens the graph at ROAD_NETWORK_PATH once per process
+
+    get() returns None when no graph is configured or it cannot be opened,
+    and callers fall back to straight-line estimates.
+    """
+
+    def __init__(self, path='', snap_meters=500):
+        self.path = path
+        self.snap_meters = snap_meters
+        self._lock = threading.Lock()
+        self._network = None
+        self._loaded = False
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._network = self._open()
+                    self._loaded = True
+        return self._network
+
+    def _open(self):
+        if not self.path:
+            return None
+        try:
+            return RoadNetwork.load(self.path)
+        except (OSError, ValueError, RoadNetworkError) as e:
+            print(f"Road network unavailable, using straight-line routes: {e}")
+            return None
+
+    def replace(self, network):
+        """Swap in a freshly built graph"""
+        with self._lock:
+            self._network = network
+            self._loaded = True
+
+    def route(self, from_lat, from_lng, to_lat, to_lng):
+        network = self.get()
+        if network is None:
+            return None
+        return network.route(from_lat, from_lng, to_lat, to_lng, self.snap_meters)
+
+    def many_to_one(self, origins, to_lat, to_lng, max_seconds=math.inf):
+        network = self.get()
+        if network is None:
+            return [None] * len(origins)
+        return network.many_to_one(origins, to_lat, to_lng, self.snap_meters, max_seconds)
+
+
+road_network = RoadNetworkStore(
+    path=getattr(settings, 'ROAD_NETWORK_PATH', ''),
+    snap_meters=getattr(settings, 'ROAD_NETWORK_SNAP_METERS', 500),
+)
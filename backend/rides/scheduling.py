@@ -0,0 +1,264 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import DeadlineQueue, PeriodicWorker
+
+
+class ScheduledRideDispatcher:
+    """Books scheduled ride occurrences when they are due and expires the ones nobody picked up
+
+    Works on ScheduledRideOccurrence rows materialized by the occurrence
+    engine. Two deadline queues are kept across all users: booking time of
+    occurrences still `scheduled`, and expiry time of occurrences that are
+    `scheduled` or `confirmed`. Only deadlines within `horizon_seconds` are
+    loaded, with indexed range scans; every `load_seconds` the window moves
+    forward and picks up the next slice. Due occurrences are turned into
+    RideRequests in batches, and riders are reminded `reminder_minutes`
+    before pickup.
+    """
+
+    def __init__(self, tick_seconds=5, load_seconds=60, horizon_seconds=3600,
+                 reminder_minutes=60, batch_size=200):
+        self.tick_seconds = tick_seconds
+        self.load_seconds = load_seconds
+        self.horizon_seconds = horizon_seconds
+        self.reminder_minutes = reminder_minutes
+        self.batch_size = batch_size
+        self._bookings = DeadlineQueue()  # occurrence id -> booking timestamp
+        self._expiries = DeadlineQueue()  # occurrence id -> expiry timestamp
+        self._loaded_until = None  # deadlines up to this timestamp are in the queues
+        self._loaded_at = None
+        self._worker = PeriodicWorker('scheduled-ride-dispatch', tick_seconds, self.tick)
+
+    def start(self):
+        self._worker.start()
+
+    def schedule_occurrences(self, occurrences):
+        """Sync the queues after occurrences were created or changed"""
+        self._worker.start()
+        for occurrence in occurrences:
+            if occurrence.status == 'scheduled' and self._within_horizon(occurrence.booking_at):
+                self._bookings.push(occurrence.id, occurrence.booking_at.timestamp())
+            else:
+                self._bookings.discard(occurrence.id)
+
+            if occurrence.status in ('scheduled', 'confirmed') and self._within_horizon(occurrence.expires_at):
+                self._expiries.push(occurrence.id, occurrence.expires_at.timestamp())
+            else:
+                self._expiries.discard(occurrence.id)
+
+    def discard(self, occurrence_ids):
+        for occurrence_id in occurrence_ids:
+            self._bookings.discard(occurrence_id)
+            self._expiries.discard(occurrence_id)
+
+    def _within_horizon(self, moment):
+        # Before the first load everything is picked up by the query instead
+        return self._loaded_until is not None and moment.timestamp() <= self._loaded_until
+
+    def tick(self):
+        """Expire overdue occurrences, book the due ones and send reminders; returns (booked, expired)"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.load_seconds:
+            self.load()
+
+        now = time.time()
+        expired = self._in_batches(self.expire, self._expiries.pop_due(now))
+        booked = self._in_batches(self.dispatch, self._bookings.pop_due(now))
+        self.send_reminders()
+        return booked, expired
+
+    def _in_batches(self, func, occurrence_ids):
+        total = 0
+        for start in range(0, len(occurrence_ids), self.batch_size):
+            total += func(occurrence_ids[start:start + self.batch_size])
+        return total
+
+    def load(self):
+        """Top up recurring series, then load every deadline up to `horizon_seconds` ahead"""
+        from .models import ScheduledRideOccurrence
+        from .recurrence import occurrence_engine
+
+        occurrence_engine.extend_all()
+
+        until = timezone.now() + timedelta(seconds=self.horizon_seconds)
+        bookings = ScheduledRideOccurrence.objects.filter(
+            status='scheduled', booking_at__lte=until
+        ).values_list('id', 'booking_at')
+        expiries = ScheduledRideOccurrence.objects.filter(
+            status__in=['scheduled', 'confirmed'], expires_at__lte=until
+        ).values_list('id', 'expires_at')
+
+        self._bookings.reset({occurrence_id: booking_at.timestamp() for occurrence_id, booking_at in bookings})
+        self._expiries.reset({occurrence_id: expires_at.timestamp() for occurrence_id, expires_at in expiries})
+        self._loaded_until = until.timestamp()
+        self._loaded_at = time.monotonic()
+
+    def dispatch(self, occurrence_ids):
+        """Create ride requests for due occurrences and mark them confirmed; returns the number booked"""
+        from django.db import transaction
+        from .models import RideRequest, ScheduledRide, ScheduledRideOccurrence
+        from .services import FareCalculationService, NotificationService
+        from .signals import ride_request_created
+        from .surge import surge_engine, zone_for
+
+        now = timezone.now()
+        with transaction.atomic():
+            occurrences = list(
+                ScheduledRideOccurrence.objects.select_for_update().select_related('scheduled_ride').filter(
+                    id__in=occurrence_ids, status='scheduled', booking_at__lte=now
+                )
+            )
+            if not occurrences:
+                return 0
+            rides = [occurrence.scheduled_ride for occurrence in occurrences]
+
+            fares = FareCalculationService.calculate_fares(
+                [ride.pickup_latitude for ride in rides],
+                [ride.pickup_longitude for ride in rides],
+                [ride.destination_latitude for ride in rides],
+                [ride.destination_longitude for ride in rides],
+                [ride.ride_type for ride in rides],
+                time_of_day=now,
+                surge_multipliers=[
+                    surge_engine.multiplier(zone_for(ride.pickup_latitude, ride.pickup_longitude))
+                    for ride in rides
+                ],
+            )
+            requests = [
+                RideRequest(
+                    rider_id=ride.user_id,
+                    pickup_address=ride.pickup_address,
+                    pickup_latitude=ride.pickup_latitude,
+                    pickup_longitude=ride.pickup_longitude,
+                    destination_address=ride.destination_address,
+                    destination_latitude=ride.destination_latitude,
+                    destination_longitude=ride.destination_longitude,
+                    ride_type=ride.ride_type,
+                    estimated_fare=fare['total_fare'],
+                    distance=fare['distance_km'],
+                    special_instructions=ride.special_instructions,
+                    # Drivers get until the occurrence expires, and at least max_wait_time
+                    expires_at=max(occurrence.expires_at, now + timedelta(minutes=ride.max_wait_time)),
+                )
+                for occurrence, ride, fare in zip(occurrences, rides, fares)
+            ]
+            RideRequest.objects.bulk_create(requests)
+
+            for occurrence, ride_request in zip(occurrences, requests):
+                occurrence.status = 'confirmed'
+                occurrence.ride_request = ride_request
+                occurrence.updated_at = now
+            ScheduledRideOccurrence.objects.bulk_update(occurrences, ['status', 'ride_request', 'updated_at'])
+            # One-time rides mirror their only occurrence; recurring series stay scheduled
+            ScheduledRide.objects.filter(
+                id__in=[ride.id for ride in rides if not ride.is_recurring], status='scheduled'
+            ).update(status='confirmed', updated_at=now)
+
+        # bulk_create and update() skip signals, so run the hooks by hand
+        self.schedule_occurrences(occurrences)
+        for ride, ride_request in zip(rides, requests):
+            ride_request_created(ride_request)
+            NotificationService.send_user_notification(
+                ride.user_id,
+                'scheduled_ride_booked',
+                {
+                    'scheduled_ride_id': str(ride.id),
+                    'ride_request_id': str(ride_request.id),
+                    'message': 'Looking for a driver for your scheduled ride'
+                }
+            )
+        return len(occurrences)
+
+    def expire(self, occurrence_ids):
+        """Mark occurrences expired once their wait time is over without an accepted request"""
+        from django.db import transaction
+        from .models import RideRequest, ScheduledRide, ScheduledRideOccurrence
+        from .services import NotificationService
+
+        now = timezone.now()
+        with transaction.atomic():
+            # Occurrences another worker is expiring or booking are skipped rather than waited for
+            occurrences = list(
+                ScheduledRideOccurrence.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('scheduled_ride').filter(
+                    id__in=occurrence_ids, status__in=['scheduled', 'confirmed'], expires_at__lte=now
+                )
+            )
+            # Locking the booked requests keeps a driver from accepting one while its occurrence expires
+            accepted = {
+                request_id for request_id, request_status in RideRequest.objects.select_for_update().filter(
+                    id__in=[o.ride_request_id for o in occurrences if o.ride_request_id]
+                ).values_list('id', 'status')
+                if request_status == 'accepted'
+            }
+            occurrences = [o for o in occurrences if o.ride_request_id not in accepted]
+            if not occurrences:
+                return 0
+
+            ScheduledRideOccurrence.objects.filter(
+                id__in=[occurrence.id for occurrence in occurrences]
+            ).update(status='expired', updated_at=now)
+            ScheduledRide.objects.filter(
+                id__in=[o.scheduled_ride_id for o in occurrences if not o.scheduled_ride.is_recurring],
+                status__in=['scheduled', 'confirmed'],
+                actual_ride__isnull=True,
+            ).update(status='expired', updated_at=now)
+
+        for occurrence in occurrences:
+            self._bookings.discard(occurrence.id)
+            NotificationService.send_user_notification(
+                occurrence.scheduled_ride.user_id,
+                'scheduled_ride_expired',
+                {
+                    'scheduled_ride_id': str(occurrence.scheduled_ride_id),
+                    'occurrence_datetime': occurrence.occurrence_datetime.isoformat(),
+                    'message': 'No driver was found for your scheduled ride'
+                }
+            )
+        return len(occurrences)
+
+    def send_reminders(self):
+        """Remind riders of occurrences starting within `reminder_minutes`; returns the number sent"""
+        from .models import ScheduledRide, ScheduledRideOccurrence
+        from .services import NotificationService
+
+        now = timezone.now()
+        due = list(
+            ScheduledRideOccurrence.objects.select_related('scheduled_ride').filter(
+                status__in=['scheduled', 'confirmed'],
+                occurrence_datetime__gt=now,
+                occurrence_datetime__lte=now + timedelta(minutes=self.reminder_minutes),
+                reminder_sent=False,
+            )[:self.batch_size]
+        )
+        if not due:
+            return 0
+
+        ScheduledRideOccurrence.objects.filter(id__in=[o.id for o in due]).update(reminder_sent=True)
+        ScheduledRide.objects.filter(
+            id__in=[o.scheduled_ride_id for o in due if not o.scheduled_ride.is_recurring]
+        ).update(reminder_sent=True)
+
+        for occurrence in due:
+            NotificationService.send_user_notification(
+                occurrence.scheduled_ride.user_id,
+                'scheduled_ride_reminder',
+                {
+                    'scheduled_ride_id': str(occurrence.scheduled_ride_id),
+                    'occurrence_datetime': occurrence.occurrence_datetime.isoformat(),
+                    'pickup_address': occurrence.scheduled_ride.pickup_address,
+                    'message': 'Your scheduled ride is coming up'
+                }
+            )
+        return len(due)
+
+
+scheduled_ride_dispatcher = ScheduledRideDispatcher(
+    tick_seconds=getattr(settings, 'SCHEDULED_RIDE_TICK_SECONDS', 5),
+    load_seconds=getattr(settings, 'SCHEDULED_RIDE_LOAD_SECONDS', 60),
+    horizon_seconds=getattr(settings, 'SCHEDULED_RIDE_HORIZON_SECONDS', 3600),
+    reminder_minutes=getattr(settings, 'SCHEDULED_RIDE_REMINDER_MINUTES', 60),
+)
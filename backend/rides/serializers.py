@@ -127,6 +127,19 @@ class FareEstimateSerializer(serializers.Serializer):
         default='standard'
     )
 
+class FareBatchEstimateSerializer(serializers.Serializer):
+    """Serializer for pricing many routes in one request"""
+    routes = serializers.ListField(
+        child=FareEstimateSerializer(),
+        min_length=1,
+        max_length=100
+    )
+    ride_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=['standard', 'premium', 'luxury', 'shared']),
+        required=False,
+        max_length=4
+    )
+
 class NearbyDriverSerializer(serializers.Serializer):
     """Serializer for nearby driver search"""
     latitude = serializers.DecimalField(max_digits=9, decimal_places=6)
@@ -177,7 +190,7 @@ class DetailedRideSerializer(serializers.ModelSerializer):
     """Enhanced ride serializer with additional details"""
     rider = UserSerializer(read_only=True)
     driver = DriverSerializer(read_only=True)
-    locations = RideLocationSerializer(many=True, read_only=True)
+    locations = serializers.SerializerMethodField()
     duration_minutes = serializers.ReadOnlyField()
     
     class Meta:
@@ -192,6 +205,11 @@ class DetailedRideSerializer(serializers.ModelSerializer):
             'rating_by_driver', 'created_at', 'updated_at',
             'locations', 'duration_minutes'
         )
+    
+    def get_locations(self, obj):
+        # Completed rides keep their points in a compact RideTrack instead of RideLocation rows
+        from .services import RideTrackService
+        return RideTrackService.serialize_points(RideTrackService.get_points(obj))
 
 # Smart Ride Features Serializers
 
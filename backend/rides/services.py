@@ -3,10 +3,19 @@ from django.utils import timezone
 from django.db.models import Q
 from decimal import Decimal
 import json
-import math
+import time
+
+import numpy as np
+
+from .polyline import decode_polyline, encode_polyline
+from .spatial_index import haversine_km
 
 class FareCalculationService:
-    """Service for calculating ride fares based on distance, time, and demand"""
+    """Service for calculating ride fares based on distance, time, and demand
+    
+    Rates come from the Tariff tables through the compiled tariff engine; the
+    constants below are the defaults for ride types and hours without a rule.
+    """
     
     BASE_FARE = Decimal('50.00')  # Base fare in NPR
     RATE_PER_KM = Decimal('15.00')  # Rate per kilometer
@@ -19,155 +28,379 @@ class FareCalculationService:
         'shared': Decimal('0.7'),
     }
     
+    MINUTES_PER_KM = Decimal('3')  # Assuming 20 km/h average speed
+    
+    _UNCACHED = object()
+    
+    # Local hours [start, end) and their multiplier: peak 7-10 AM and 5-9 PM, late night 10 PM - 6 AM
+    TIME_MULTIPLIERS = [
+        (7, 10, Decimal('1.3')),
+        (17, 21, Decimal('1.3')),
+        (22, 6, Decimal('1.2')),
+    ]
+    
     @classmethod
     def calculate_fare(cls, pickup_lat, pickup_lng, dest_lat, dest_lng, 
                       ride_type='standard', time_of_day=None, surge_multiplier=1.0):
-        """Calculate fare based on distance and other factors"""
-        
-        # Calculate distance
-        distance_km = cls.calculate_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
-        
-        # Base calculation
-        base_fare = cls.BASE_FARE
-        distance_fare = distance_km * cls.RATE_PER_KM
-        
-        # Estimated time (rough calculation)
-        estimated_minutes = distance_km * 3  # Assuming 20 km/h average speed
-        time_fare = estimated_minutes * cls.RATE_PER_MINUTE
-        
-        # Total before multipliers
-        subtotal = base_fare + distance_fare + time_fare
-        
-        # Apply ride type multiplier
-        ride_multiplier = cls.RIDE_TYPE_MULTIPLIERS.get(ride_type, Decimal('1.0'))
-        subtotal *= ride_multiplier
-        
-        # Apply surge pricing
-        if surge_multiplier > 1.0:
-            subtotal *= Decimal(str(surge_multiplier))
-          # Apply time-based pricing
-        if time_of_day:
-            time_multiplier = cls.get_time_multiplier(time_of_day)
-            subtotal *= time_multiplier
-        
-        return {
-            'base_fare': float(base_fare),
-            'distance_fare': float(distance_fare),
-            'time_fare': float(time_fare),
-            'distance_km': float(distance_km),
-            'estimated_minutes': float(estimated_minutes),
-            'ride_type_multiplier': float(ride_multiplier),
-            'surge_multiplier': surge_multiplier,
-            'total_fare': float(subtotal)
-        }
+        """Calculate fare based on distance and other factors, using the tariff of the pickup city
+        
+        With a travel time model the time fare uses the learned trip duration
+        for the hour of week instead of the tariff's fixed minutes per km.
+        """
+        from .tariffs import tariff_engine
+        from .travel_times import travel_time_model
+        
+        tariffs = tariff_engine.current()
+        distance_km = cls.calculate_trip_distance(pickup_lat, pickup_lng, dest_lat, dest_lng, now=time_of_day)
+        minutes = None
+        if travel_time_model.get() is not None:
+            route, _ = RouteOptimizationService.get_route(pickup_lat, pickup_lng, dest_lat, dest_lng, now=time_of_day)
+            minutes = route['duration_seconds'] / 60
+        return tariffs.quote(
+            distance_km,
+            ride_type,
+            city=tariffs.city_for(pickup_lat, pickup_lng),
+            hour=cls.local_hour(time_of_day),
+            surge_multiplier=surge_multiplier,
+            minutes=minutes
+        )
+    
+    @classmethod
+    def get_fare_quote(cls, pickup_lat, pickup_lng, dest_lat, dest_lng, ride_type='standard', now=None):
+        """calculate_fare for the current time and zone surge, served from the fare quote cache
+        
+        Pickup and destination are snapped to FARE_QUOTE_CELL_DEGREES cells and
+        the quote is computed between cell centers, so every request in the same
+        cells, ride type, hour of week, surge version, tariff version and travel
+        time model shares one entry.
+        Returns (fare_info, cache_hit).
+        """
+        return cls.get_fare_quotes([(pickup_lat, pickup_lng, dest_lat, dest_lng, ride_type)], now=now)[0]
+    
+    @classmethod
+    def get_fare_quotes(cls, trips, now=None):
+        """get_fare_quote for many (pickup_lat, pickup_lng, dest_lat, dest_lng, ride_type) trips
+        
+        Surge is looked up once per pickup zone and all cache misses are priced
+        by one calculate_fares call. Returns a list of (fare_info, cache_hit).
+        """
+        from .caching import fare_quote_cache
+        from .surge import surge_engine
+        from .tariffs import tariff_engine
+        from .travel_times import hour_of_week, travel_time_model
+        
+        now = now or timezone.now()
+        cell = getattr(settings, 'FARE_QUOTE_CELL_DEGREES', 0.001)
+        tariffs = tariff_engine.current()
+        model = travel_time_model.get()
+        surge_by_zone = {}
+        keys = []
+        for pickup_lat, pickup_lng, dest_lat, dest_lng, ride_type in trips:
+            zone = cls.get_area_code(pickup_lat, pickup_lng)
+            if zone not in surge_by_zone:
+                surge_by_zone[zone] = cls.get_surge_multiplier(zone, now)
+            # The hour of week decides both the time multiplier and the learned trip duration
+            keys.append((
+                (round(float(pickup_lat) / cell), round(float(pickup_lng) / cell)),
+                (round(float(dest_lat) / cell), round(float(dest_lng) / cell)),
+                ride_type, hour_of_week(now), zone,
+                surge_engine.version(zone), tariffs.version, model.version if model is not None else None
+            ))
+        
+        quotes = {key: fare_quote_cache.get(key, cls._UNCACHED) for key in set(keys)}
+        missing = [key for key, quote in quotes.items() if quote is cls._UNCACHED]
+        if missing:
+            start = time.perf_counter()
+            fares = cls.calculate_fares(
+                [round(pickup_cell[0] * cell, 6) for pickup_cell, *_ in missing],
+                [round(pickup_cell[1] * cell, 6) for pickup_cell, *_ in missing],
+                [round(dest_cell[0] * cell, 6) for _, dest_cell, *_ in missing],
+                [round(dest_cell[1] * cell, 6) for _, dest_cell, *_ in missing],
+                ride_types=[key[2] for key in missing],
+                time_of_day=now,
+                surge_multipliers=[surge_by_zone[key[4]] for key in missing]
+            )
+            for key, fare in zip(missing, fares):
+                quotes[key] = fare
+                fare_quote_cache.set(key, fare, (time.perf_counter() - start) / len(missing))
+        
+        missing = set(missing)
+        return [(quotes[key], key not in missing) for key in keys]
+    
+    @classmethod
+    def calculate_fares(cls, pickup_lats, pickup_lngs, dest_lats, dest_lngs,
+                        ride_types, time_of_day=None, surge_multipliers=None):
+        """Vectorized calculate_fare for many routes at once"""
+        from .tariffs import tariff_engine
+        from .travel_times import travel_time_model
+        
+        tariffs = tariff_engine.current()
+        distance_km = cls.calculate_trip_distances(pickup_lats, pickup_lngs, dest_lats, dest_lngs, now=time_of_day)
+        minutes = None
+        if travel_time_model.get() is not None:
+            minutes = [
+                RouteOptimizationService.get_route(*trip, now=time_of_day)[0]['duration_seconds'] / 60
+                for trip in zip(pickup_lats, pickup_lngs, dest_lats, dest_lngs)
+            ]
+        return tariffs.quote_many(
+            distance_km,
+            ride_types,
+            [tariffs.city_for(lat, lng) for lat, lng in zip(pickup_lats, pickup_lngs)],
+            hour=cls.local_hour(time_of_day),
+            surge_multipliers=surge_multipliers,
+            minutes=minutes
+        )
+    
+    @classmethod
+    def calculate_trip_distance(cls, pickup_lat, pickup_lng, dest_lat, dest_lng, now=None):
+        """Distance in km along the fastest road route, straight-line when there is no road route"""
+        route, _ = RouteOptimizationService.get_route(pickup_lat, pickup_lng, dest_lat, dest_lng, now=now)
+        if route['source'] != 'road_network':
+            return cls.calculate_distance(pickup_lat, pickup_lng, dest_lat, dest_lng)
+        return Decimal(str(route['distance_km']))
+    
+    @classmethod
+    def calculate_trip_distances(cls, pickup_lats, pickup_lngs, dest_lats, dest_lngs, now=None):
+        """calculate_trip_distance for many trips, as an array"""
+        from .road_network import road_network
+        
+        distances = cls.calculate_distances(pickup_lats, pickup_lngs, dest_lats, dest_lngs)
+        if road_network.get() is not None:
+            for i, trip in enumerate(zip(pickup_lats, pickup_lngs, dest_lats, dest_lngs)):
+                route, _ = RouteOptimizationService.get_route(*trip, now=now)
+                if route['source'] == 'road_network':
+                    distances[i] = route['distance_km']
+        return distances
     
     @classmethod
     def calculate_distance(cls, lat1, lng1, lat2, lng2):
         """Calculate distance between two points using Haversine formula"""
-        # Convert latitude and longitude from degrees to radians
-        lat1, lng1, lat2, lng2 = map(math.radians, [float(lat1), float(lng1), float(lat2), float(lng2)])
-        
-        # Haversine formula
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        # Radius of earth in kilometers
-        r = 6371
-        distance = c * r
-        
-        return Decimal(str(round(distance, 2)))
+        distance = cls.calculate_distances(lat1, lng1, lat2, lng2)
+        return Decimal(str(distance.item()))
     
     @classmethod
-    def get_time_multiplier(cls, time_of_day):
-        """Get pricing multiplier based on time of day"""
-        hour = time_of_day.hour
+    def calculate_distances(cls, lat1, lng1, lat2, lng2):
+        """Vectorized Haversine distances in km, rounded to 2 decimals
         
-        # Peak hours (7-9 AM, 5-8 PM)
-        if (7 <= hour <= 9) or (17 <= hour <= 20):
-            return Decimal('1.3')
-        # Late night (10 PM - 5 AM)
-        elif hour >= 22 or hour <= 5:
-            return Decimal('1.2')
-        # Regular hours
-        else:
-            return Decimal('1.0')
+        Arguments may be scalars or arrays that broadcast against each other,
+        e.g. one origin against arrays of candidate coordinates.
+        """
+        return np.round(haversine_km(lat1, lng1, lat2, lng2), 2)
+    
+    @classmethod
+    def get_area_code(cls, latitude, longitude):
+        """Pricing zone of a coordinate: the id of its fixed-size lat/lng grid cell"""
+        from .surge import zone_for
+        return zone_for(latitude, longitude)
+    
+    @classmethod
+    def local_hour(cls, time_of_day):
+        if not time_of_day:
+            return None
+        if timezone.is_aware(time_of_day):
+            time_of_day = timezone.localtime(time_of_day)
+        return time_of_day.hour
+    
+    @classmethod
+    def get_time_multiplier(cls, time_of_day, city=None):
+        """Get pricing multiplier based on time of day, from the time rules of the pricing city"""
+        from .tariffs import BASIS, tariff_engine
+        multiplier = tariff_engine.current().time_multiplier(city, cls.local_hour(time_of_day))
+        return Decimal(multiplier) / BASIS
     
     @classmethod
     def get_surge_multiplier(cls, area_code, current_time):
         """Calculate surge pricing based on demand in area"""
-        # This would typically connect to a real-time demand monitoring system
-        # For now, return a simple calculation
-        
-        from django.utils import timezone
-        from .models import Ride
-        
-        # Count active rides in the area in the last hour
-        one_hour_ago = current_time - timezone.timedelta(hours=1)
-        
-        active_rides_count = Ride.objects.filter(
-            status__in=['accepted', 'in_progress'],
-            requested_at__gte=one_hour_ago
-        ).count()
-        
-        # Simple surge calculation
-        if active_rides_count > 20:
-            return 2.0
-        elif active_rides_count > 10:
-            return 1.5
-        elif active_rides_count > 5:
-            return 1.2
-        else:
-            return 1.0
+        # Demand and supply are tracked per zone by the surge engine, which
+        # recomputes multipliers in the background; this is a cached lookup
+        from .surge import surge_engine
+        return surge_engine.multiplier(area_code)
 
 
 class RouteOptimizationService:
-    """Service for route optimization and ETA calculation"""
+    """Service for route optimization and ETA calculation
+    
+    Routes come from the offline road network (see rides.road_network) when a
+    graph has been built; without one, or for points off the graph, they fall
+    back to straight-line distance at an average city speed.
+    """
+    
+    _UNCACHED = object()
     
     @classmethod
-    def get_optimized_route(cls, pickup_lat, pickup_lng, dest_lat, dest_lng):
-        """Get optimized route using Google Maps API (or similar)"""
-        
-        # For demo purposes, return a simple calculation
-        # In production, this would use Google Maps Directions API
-        
-        distance = FareCalculationService.calculate_distance(
-            pickup_lat, pickup_lng, dest_lat, dest_lng
-        )
-        
-        # Estimate travel time (assuming 25 km/h average in city)
-        estimated_minutes = float(distance) * 2.4
-        
-        return {
-            'distance_km': float(distance),
-            'estimated_duration_minutes': round(estimated_minutes),
-            'route_points': [
-                {'lat': float(pickup_lat), 'lng': float(pickup_lng)},
-                {'lat': float(dest_lat), 'lng': float(dest_lng)}
-            ],
+    def get_optimized_route(cls, pickup_lat, pickup_lng, dest_lat, dest_lng, route_format='polyline'):
+        """Get the fastest road route, or a straight-line estimate
+        
+        The geometry is an encoded polyline in `route_polyline`, or a list of
+        {'lat', 'lng'} points in `route_points` when route_format is 'points'.
+        """
+        route, _ = cls.get_route(pickup_lat, pickup_lng, dest_lat, dest_lng)
+        
+        route_info = {
+            'distance_km': route['distance_km'],
+            'estimated_duration_minutes': route['duration_minutes'],
+            'route_source': route['source'],
             'instructions': [
                 f"Head towards destination",
-                f"Continue for {float(distance):.1f} km",
+                f"Continue for {route['distance_km']:.1f} km",
                 f"Arrive at destination"
             ]
         }
+        if route_format == 'points':
+            route_info['route_points'] = [
+                {'lat': lat, 'lng': lng} for lat, lng in decode_polyline(route['polyline'])
+            ]
+        else:
+            route_info['route_polyline'] = route['polyline']
+        return route_info
+    
+    @classmethod
+    def get_route(cls, from_lat, from_lng, to_lat, to_lng, now=None):
+        """Fastest route between two points, served from the route cache
+        
+        Endpoints are snapped to ROUTE_CACHE_CELL_DEGREES cells and the route is
+        computed between cell centers, so trips between the same cells in the
+        same time bucket share one entry. Returns (route, cache_hit) with
+        distance_km, duration_minutes, duration_seconds, polyline and source.
+        """
+        from .caching import route_cache
+        
+        cell = getattr(settings, 'ROUTE_CACHE_CELL_DEGREES', 0.001)
+        from_cell = (round(float(from_lat) / cell), round(float(from_lng) / cell))
+        to_cell = (round(float(to_lat) / cell), round(float(to_lng) / cell))
+        bucket = cls.time_bucket(now, getattr(settings, 'ROUTE_CACHE_BUCKET_MINUTES', 60))
+        
+        return route_cache.get_or_compute((from_cell, to_cell, bucket), lambda: cls._compute_route(
+            round(from_cell[0] * cell, 6), round(from_cell[1] * cell, 6),
+            round(to_cell[0] * cell, 6), round(to_cell[1] * cell, 6),
+            now=now
+        ))
+    
+    @classmethod
+    def _compute_route(cls, from_lat, from_lng, to_lat, to_lng, now=None):
+        """Route geometry from the road network, duration from the travel time model when one is built"""
+        from .road_network import road_network
+        from .travel_times import travel_time_model
+        
+        route = road_network.route(from_lat, from_lng, to_lat, to_lng)
+        if route is not None:
+            distance_km = route['meters'] / 1000
+            minutes = travel_time_model.minutes(from_lat, from_lng, to_lat, to_lng, distance_km, when=now)
+            seconds = float(minutes) * 60 if minutes is not None else route['seconds']
+            return {
+                'distance_km': round(distance_km, 2),
+                'duration_minutes': round(seconds / 60),
+                'duration_seconds': round(seconds),
+                'polyline': encode_polyline(route['points']),
+                'source': 'road_network'
+            }
+        
+        distance = float(FareCalculationService.calculate_distance(from_lat, from_lng, to_lat, to_lng))
+        minutes = travel_time_model.minutes(from_lat, from_lng, to_lat, to_lng, distance, when=now, road=False)
+        # Without history, estimate travel time assuming 25 km/h average in city
+        seconds = float(minutes) * 60 if minutes is not None else distance * 2.4 * 60
+        return {
+            'distance_km': distance,
+            'duration_minutes': round(seconds / 60),
+            'duration_seconds': round(seconds),
+            'polyline': encode_polyline([(from_lat, from_lng), (to_lat, to_lng)]),
+            'source': 'straight_line'
+        }
+    
+    @classmethod
+    def time_bucket(cls, now, bucket_minutes):
+        """Index of the bucket_minutes-long slot of the week that `now` (local time) falls in"""
+        now = timezone.localtime(now or timezone.now())
+        return (now.weekday() * 24 * 60 + now.hour * 60 + now.minute) // bucket_minutes
     
     @classmethod
     def calculate_eta(cls, driver_lat, driver_lng, pickup_lat, pickup_lng):
         """Calculate ETA for driver to reach pickup location"""
         
-        distance = FareCalculationService.calculate_distance(
-            driver_lat, driver_lng, pickup_lat, pickup_lng
+        etas = cls.calculate_etas(pickup_lat, pickup_lng, [driver_lat], [driver_lng])
+        distance = etas['distance_to_pickup_km'][0].item()
+        eta_minutes = etas['eta_minutes'][0].item()
+        
+        return {
+            'distance_to_pickup_km': distance,
+            'eta_minutes': eta_minutes,
+            'eta_text': f"{eta_minutes} minutes away"
+        }
+    
+    @classmethod
+    def calculate_etas(cls, pickup_lat, pickup_lng, driver_lats, driver_lngs, now=None):
+        """Calculate distance and ETA arrays from many drivers to one pickup
+        
+        With a road network this is a many-to-one ETA matrix: drivers and the
+        pickup are snapped to ETA_MATRIX_CELL_DEGREES cells, cell pairs are
+        cached per time-of-day bucket, and all uncached drivers are solved by
+        one backward search from the pickup cell. Durations come from the
+        travel time model when one is built.
+        """
+        from .caching import eta_matrix_cache
+        from .road_network import road_network
+        from .travel_times import travel_time_model
+        
+        distances = FareCalculationService.calculate_distances(
+            pickup_lat, pickup_lng, driver_lats, driver_lngs
         )
         
-        # Assume faster speed for driver going to pickup (30 km/h)
-        eta_minutes = float(distance) * 2
+        model = travel_time_model.get()
+        if model is not None:
+            eta_minutes = np.rint(model.minutes(
+                driver_lats, driver_lngs, pickup_lat, pickup_lng, distances, when=now, road=False
+            )).astype(int)
+        else:
+            # Assume faster speed for driver going to pickup (30 km/h)
+            eta_minutes = np.rint(distances * 2).astype(int)
+        
+        if road_network.get() is None or not len(distances):
+            return {
+                'distance_to_pickup_km': distances,
+                'eta_minutes': eta_minutes
+            }
+        
+        bucket = cls.time_bucket(now, getattr(settings, 'ETA_MATRIX_BUCKET_MINUTES', 60))
+        cell = getattr(settings, 'ETA_MATRIX_CELL_DEGREES', 0.002)
+        pickup_cell = (round(float(pickup_lat) / cell), round(float(pickup_lng) / cell))
+        keys = [
+            ((round(float(lat) / cell), round(float(lng) / cell)), pickup_cell, bucket)
+            for lat, lng in zip(driver_lats, driver_lngs)
+        ]
+        
+        entries = {key: eta_matrix_cache.get(key, cls._UNCACHED) for key in set(keys)}
+        missing = [key for key, entry in entries.items() if entry is cls._UNCACHED]
+        if missing:
+            start = time.perf_counter()
+            routes = road_network.many_to_one(
+                [(driver_cell[0] * cell, driver_cell[1] * cell) for driver_cell, _, _ in missing],
+                pickup_cell[0] * cell, pickup_cell[1] * cell,
+                max_seconds=getattr(settings, 'ETA_MATRIX_MAX_SECONDS', 1800)
+            )
+            if model is not None:
+                driver_cells = np.array([driver_cell for driver_cell, _, _ in missing], dtype=np.float64) * cell
+                road_km = np.array([route['meters'] / 1000 if route else 0.0 for route in routes])
+                learned = model.minutes(
+                    driver_cells[:, 0], driver_cells[:, 1], pickup_cell[0] * cell, pickup_cell[1] * cell,
+                    road_km, when=now
+                ).tolist()
+            for i, (key, route) in enumerate(zip(missing, routes)):
+                # Unroutable pairs are cached too (as None) so they are not searched again
+                if route is None:
+                    entries[key] = None
+                else:
+                    minutes = learned[i] if model is not None else route['seconds'] / 60
+                    entries[key] = (round(route['meters'] / 1000, 2), round(minutes))
+                eta_matrix_cache.set(key, entries[key], (time.perf_counter() - start) / len(missing))
+        
+        # Drivers with a road route get its distance and duration instead
+        for i, key in enumerate(keys):
+            if entries[key] is not None:
+                distances[i], eta_minutes[i] = entries[key]
         
         return {
-            'distance_to_pickup_km': float(distance),
-            'eta_minutes': round(eta_minutes),
-            'eta_text': f"{round(eta_minutes)} minutes away"
+            'distance_to_pickup_km': distances,
+            'eta_minutes': eta_minutes
         }
 
 
@@ -175,77 +408,307 @@ class LocationService:
     """Service for location-based operations"""
     
     @classmethod
-    def get_address_from_coordinates(cls, latitude, longitude):
-        """Get address from coordinates using reverse geocoding"""
-        
-        # This would use Google Maps Geocoding API or similar
-        # For demo, return a formatted address
-        
-        return {
-            'formatted_address': f"Location near {latitude:.4f}, {longitude:.4f}, Kathmandu, Nepal",
-            'locality': 'Kathmandu',
-            'area': 'Central Kathmandu',
-            'postal_code': '44600',
-            'country': 'Nepal'
-        }
+    def get_address_from_coordinates(cls, latitude, longitude, user=None):
+        """Get address from coordinates using reverse geocoding
+        
+        Gazetteer addresses are served from the reverse geocode cache, keyed by
+        the point snapped to a REVERSE_GEOCODE_CELL_DEGREES cell. A saved place
+        of the user's right at the point names it instead.
+        """
+        from .caching import reverse_geocode_cache
+        from .geocoding import geocoder, reverse_cache_center, reverse_cache_key
+        
+        latitude, longitude = float(latitude), float(longitude)
+        key = reverse_cache_key(latitude, longitude)
+        address, _ = reverse_geocode_cache.get_or_compute(key, lambda: geocoder.reverse(*reverse_cache_center(key)))
+        
+        if address is None:
+            # Nothing named nearby
+            address = {
+                'formatted_address': f"Location near {latitude:.4f}, {longitude:.4f}, Kathmandu, Nepal",
+                'locality': 'Kathmandu',
+                'area': 'Central Kathmandu',
+                'postal_code': '44600',
+                'country': 'Nepal',
+                'source': 'coordinates'
+            }
+        else:
+            address = dict(address)  # the cached dict is shared
+        
+        saved = geocoder.saved_place(latitude, longitude, user.id) if user else None
+        if saved is not None:
+            address.update(
+                formatted_address=saved['address'] or saved['name'],
+                name=saved['name'],
+                postal_code='',
+                source=saved['source']
+            )
+        return address
     
     @classmethod
-    def get_coordinates_from_address(cls, address):
-        """Get coordinates from address using geocoding"""
+    def get_coordinates_from_address(cls, address, user=None):
+        """Get coordinates from address using geocoding
         
-        # This would use Google Maps Geocoding API
-        # For demo, return default Kathmandu coordinates
+        The best match among the user's saved places and the local gazetteer;
+        Kathmandu centre with low accuracy when nothing matches.
+        """
+        from .geocoding import geocoder
+        
+        matches = geocoder.search(address, user_id=user.id if user else None, limit=1)
+        if matches:
+            return matches[0]
         
         return {
             'latitude': 27.7172,
             'longitude': 85.3240,
-            'accuracy': 'high'
+            'accuracy': 'low',
+            'source': 'default'
         }
     
+    @classmethod
+    def autocomplete_address(cls, query, user=None, limit=5):
+        """Suggestions for a partially typed address, the user's saved places first"""
+        from .geocoding import geocoder
+        
+        return geocoder.search(query, user_id=user.id if user else None, limit=limit)
+    
     @classmethod
     def find_nearby_drivers(cls, latitude, longitude, radius_km=5):
         """Find drivers within specified radius"""
         
+        from .spatial_index import driver_index
+        
+        # Served from the in-memory grid index of available drivers
+        driver_index.ensure_loaded()
+        candidates = [entry for _, entry in driver_index.within_radius(latitude, longitude, radius_km)]
+        
+        return cls._driver_results(latitude, longitude, candidates)
+    
+    @classmethod
+    def find_nearest_drivers(cls, latitude, longitude, limit=5, max_radius_km=None):
+        """Find the closest available drivers regardless of a fixed radius"""
+        
+        from .spatial_index import driver_index
+        
+        driver_index.ensure_loaded()
+        candidates = [entry for _, entry in driver_index.nearest(latitude, longitude, limit, max_radius_km)]
+        
+        return cls._driver_results(latitude, longitude, candidates)
+    
+    @classmethod
+    def _driver_results(cls, latitude, longitude, entries):
+        """Attach distance and ETA to indexed drivers, computed for all of them at once"""
+        if not entries:
+            return []
+        
+        etas = RouteOptimizationService.calculate_etas(
+            latitude, longitude,
+            [entry['latitude'] for entry in entries],
+            [entry['longitude'] for entry in entries]
+        )
+        
+        return [
+            {
+                'driver_id': entry['key'],
+                'driver_name': entry['driver_name'],
+                'vehicle_info': entry['vehicle_info'],
+                'distance_km': distance,
+                'eta_minutes': eta_minutes,
+                'rating': entry['rating'],
+                'latitude': entry['latitude'],
+                'longitude': entry['longitude']
+            }
+            for entry, distance, eta_minutes in zip(
+                entries,
+                etas['distance_to_pickup_km'].tolist(),
+                etas['eta_minutes'].tolist()
+            )
+        ]
+    
+    @classmethod
+    def find_nearby_requests(cls, latitude, longitude, radius_km=10):
+        """Pending, unexpired ride requests picking up within radius_km, nearest first, as (distance_km, request)"""
+        
+        from django.utils import timezone
+        from .expiry import request_expiry
+        from .models import RideRequest
+        from .spatial_index import pending_request_index
+        
+        request_expiry.start()
+        pending_request_index.ensure_loaded()
+        matches = pending_request_index.pending_within(latitude, longitude, radius_km)
+        if not matches:
+            return []
+        
+        # The index can lag behind other workers, so the database has the final say on status
+        requests = RideRequest.objects.filter(
+            status='pending',
+            expires_at__gt=timezone.now()
+        ).select_related('rider').in_bulk([entry['key'] for _, entry in matches])
+        
+        return [
+            (round(distance, 2), requests[entry['key']])
+            for distance, entry in matches
+            if entry['key'] in requests
+        ]
+    
+    @classmethod
+    def driver_changed(cls, driver):
+        """Keep location indexes in sync after a driver's location or availability was saved"""
+        
+        from .location_buffer import driver_location_buffer
+        from .spatial_index import driver_index
+        from .surge import surge_engine
+        
+        # The database row may lag behind the write-behind buffer
+        pending = driver_location_buffer.latest(driver.id)
+        if pending is not None:
+            driver.current_latitude, driver.current_longitude, driver.last_location_update = pending
+        
+        driver_index.update_driver(driver)
+        surge_engine.record_driver(
+            driver.id, driver.current_latitude, driver.current_longitude,
+            driver.is_available and driver.user.is_active
+        )
+    
+    @classmethod
+    def driver_moved(cls, driver_id, latitude, longitude):
+        """Update the indexed position of an available driver without touching the database"""
+        
+        from .spatial_index import driver_index
+        from .surge import surge_engine
+        
+        if driver_index.move_driver(driver_id, latitude, longitude):
+            surge_engine.record_driver(driver_id, latitude, longitude, True)
+    
+    @classmethod
+    def driver_online(cls, driver_id):
+        """Re-index a driver whose app reconnected or resumed heartbeats"""
+        
         from drivers.models import Driver
-        from django.db.models import Q
         
-        # This is a simplified version
-        # In production, you'd use spatial queries or external services
+        driver = Driver.objects.select_related('user').filter(id=driver_id).first()
+        if driver is not None:
+            cls.driver_changed(driver)
+    
+    @classmethod
+    def driver_offline(cls, driver_id):
+        """Take a driver without a live connection out of matching and surge supply"""
         
-        available_drivers = Driver.objects.filter(
-            is_available=True,
-            user__is_active=True
+        from .spatial_index import driver_index
+        from .surge import surge_engine
+        
+        driver_index.remove(driver_id)
+        surge_engine.record_driver(driver_id, None, None, False)
+    
+    @classmethod
+    def evict_offline_drivers(cls):
+        """Drop indexed drivers whose heartbeats expired; returns how many were dropped"""
+        
+        from .presence import presence
+        from .spatial_index import driver_index
+        
+        indexed = driver_index.keys()
+        online = presence.dispatchable(indexed)
+        offline = [driver_id for driver_id in indexed if driver_id not in online]
+        for driver_id in offline:
+            cls.driver_offline(driver_id)
+        return len(offline)
+
+
+class RideTrackService:
+    """Service for compacting and reading ride GPS tracks"""
+    
+    @classmethod
+    def compact(cls, ride):
+        """Fold a ride's RideLocation rows into its RideTrack blob and delete the rows; None if there were none"""
+        
+        from django.db import transaction
+        from .models import RideLocation, RideTrack
+        from .track_encoding import encode_track
+        from .track_simplify import simplify_levels
+        
+        rows = list(
+            RideLocation.objects.filter(ride=ride)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'latitude', 'longitude', 'timestamp', 'speed')
         )
+        if not rows:
+            return None
+        
+        with transaction.atomic():
+            track = RideTrack.objects.select_for_update().filter(ride=ride).first()
+            points = [row[1:] for row in rows]
+            if track is not None:
+                # Points that arrived after an earlier compaction are merged in
+                points = sorted(track.points() + points, key=lambda point: point[2])
+            
+            track, _ = RideTrack.objects.update_or_create(
+                ride=ride,
+                defaults={
+                    'data': encode_track(points),
+                    'point_count': len(points),
+                    'levels': simplify_levels(points),
+                    'started_at': points[0][2],
+                    'ended_at': points[-1][2],
+                }
+            )
+            # Rows saved while compacting have higher ids and are kept for the next pass
+            RideLocation.objects.filter(ride=ride, id__lte=max(row[0] for row in rows)).delete()
+        
+        return track
+    
+    @classmethod
+    def get_points(cls, ride, zoom=None, tolerance_m=None):
+        """Recorded points of a ride in time order, optionally simplified for a map zoom or a tolerance in meters"""
+        
+        from .models import RideLocation, RideTrack
+        from .track_encoding import TrackPoint
+        from .track_simplify import douglas_peucker, level_for_zoom, zoom_tolerance_m
+        
+        track = RideTrack.objects.filter(ride=ride).first()
+        points = track.points() if track is not None else []
+        rows = RideLocation.objects.filter(ride=ride).order_by('timestamp', 'id').values_list(
+            'latitude', 'longitude', 'timestamp', 'speed'
+        )
+        if rows:
+            points = sorted(points + [TrackPoint(*row) for row in rows], key=lambda point: point.timestamp)
+        
+        if tolerance_m is None and zoom is not None and points:
+            level = level_for_zoom(zoom)
+            if level is None:
+                return points
+            if track is not None and not rows and str(level) in track.levels:
+                return [points[i] for i in track.levels[str(level)]]
+            # Track still being recorded: simplify on the fly with the level's tolerance
+            reference_latitude = sum(float(point.latitude) for point in points) / len(points)
+            tolerance_m = zoom_tolerance_m(level, reference_latitude)
+        
+        if tolerance_m is not None:
+            indices = douglas_peucker(
+                [float(point.latitude) for point in points],
+                [float(point.longitude) for point in points],
+                tolerance_m
+            )
+            points = [points[i] for i in indices]
+        return points
+    
+    @classmethod
+    def serialize_points(cls, points):
+        """JSON-ready track points, formatted like RideLocationSerializer"""
         
-        nearby_drivers = []
-        for driver in available_drivers:
-            if driver.current_latitude and driver.current_longitude:
-                distance = FareCalculationService.calculate_distance(
-                    latitude, longitude,
-                    driver.current_latitude, driver.current_longitude
-                )
-                
-                if distance <= radius_km:
-                    eta_info = RouteOptimizationService.calculate_eta(
-                        driver.current_latitude, driver.current_longitude,
-                        latitude, longitude
-                    )
-                    
-                    nearby_drivers.append({
-                        'driver_id': driver.id,
-                        'driver_name': driver.user.get_full_name(),
-                        'vehicle_info': f"{driver.vehicle_make} {driver.vehicle_model}",
-                        'distance_km': float(distance),
-                        'eta_minutes': eta_info['eta_minutes'],
-                        'rating': float(driver.average_rating or 5.0),
-                        'latitude': float(driver.current_latitude),
-                        'longitude': float(driver.current_longitude)
-                    })
-        
-        # Sort by distance
-        nearby_drivers.sort(key=lambda x: x['distance_km'])
-        
-        return nearby_drivers
+        from rest_framework import serializers
+        format_datetime = serializers.DateTimeField().to_representation
+        
+        return [
+            {
+                'latitude': f"{point.latitude:.6f}",
+                'longitude': f"{point.longitude:.6f}",
+                'timestamp': format_datetime(point.timestamp),
+                'speed': f"{point.speed:.2f}" if point.speed is not None else None,
+            }
+            for point in points
+        ]
 
 
 class NotificationService:
@@ -270,6 +733,26 @@ class NotificationService:
         except Exception as e:
             print(f"Error sending notification: {e}")
     
+    @classmethod
+    def send_user_notification(cls, user_id, notification_type, data):
+        """Push a notification to the user's NotificationConsumer group"""
+        
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        
+        try:
+            async_to_sync(get_channel_layer().group_send)(
+                f'user_{user_id}',
+                {
+                    'type': 'notification',
+                    'notification_type': notification_type,
+                    'data': data,
+                    'timestamp': timezone.now().isoformat()
+                }
+            )
+        except Exception as e:
+            print(f"Error sending notification: {e}")
+    
     @classmethod
     def send_driver_match_notification(cls, rider, driver, ride):
         """Send notification when driver is matched"""
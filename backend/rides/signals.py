@@ -0,0 +1,119 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from drivers.models import Driver
+
+from .models import (
+    FavoriteLocation, PricingCity, Ride, RideRequest, RideTemplate, ScheduledRide, Tariff, TariffTimeRule
+)
+
+
+# Fields cached by RideConsumer / DriverConsumer connections
+RIDE_SOCKET_FIELDS = {'status', 'driver', 'started_at', 'completed_at'}
+DRIVER_SOCKET_FIELDS = {'is_available', 'is_verified'}
+
+
+@receiver(post_save, sender=RideRequest)
+def ride_request_saved(sender, instance, created, **kwargs):
+    """Feed ride requests into the realtime demand counters and the pending-request index"""
+    if created:
+        ride_request_created(instance)
+    else:
+        ride_request_changed(instance)
+
+
+@receiver(post_delete, sender=RideRequest)
+def ride_request_deleted(sender, instance, **kwargs):
+    from .spatial_index import pending_request_index
+    pending_request_index.remove(instance.id)
+
+
+def ride_request_created(ride_request):
+    """Hooks for a new ride request; also called for bulk-created requests, which skip signals"""
+    from .surge import surge_engine
+    surge_engine.record_demand(ride_request.pickup_latitude, ride_request.pickup_longitude)
+    ride_request_changed(ride_request)
+
+
+def ride_request_changed(ride_request):
+    """Hooks for a ride request whose status changed; also called after bulk updates, which skip signals"""
+    from .expiry import request_expiry
+    from .spatial_index import pending_request_index
+    pending_request_index.update_request(ride_request)
+    request_expiry.schedule(ride_request)
+
+
+@receiver(post_save, sender=Ride)
+def ride_saved(sender, instance, **kwargs):
+    """Write out the buffered GPS points of a ride once it ends, compacting completed tracks
+
+    Only the save that moves the ride into completed or cancelled does this, not later
+    saves such as ratings. Also refreshes the ride cached by its open sockets.
+    """
+    update_fields = kwargs.get('update_fields')
+    ended = instance.status in ('completed', 'cancelled') and instance.status_changed()
+    if ended and _touches(update_fields, {'status'}):
+        from .location_buffer import ride_location_buffer
+        ride_location_buffer.finish_ride(instance.id)
+        if instance.status == 'completed':
+            from .services import RideTrackService
+            RideTrackService.compact(instance)
+    if _touches(update_fields, RIDE_SOCKET_FIELDS):
+        from .consumers import ride_changed_event
+        _send_to_group_on_commit(f'ride_{instance.id}', ride_changed_event(instance))
+
+
+@receiver(post_save, sender=Driver)
+def driver_saved(sender, instance, **kwargs):
+    """Refresh the driver cached by the driver's open socket"""
+    if _touches(kwargs.get('update_fields'), DRIVER_SOCKET_FIELDS):
+        from .consumers import driver_changed_event
+        _send_to_group_on_commit(f'driver_{instance.id}', driver_changed_event(instance))
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+
+def _send_to_group_on_commit(group, event):
+    """Send a channel layer event once the surrounding transaction commits"""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from django.db import transaction
+
+    def send():
+        try:
+            async_to_sync(get_channel_layer().group_send)(group, event)
+        except Exception as e:
+            print(f"Error sending {event['type']} to {group}: {e}")
+
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=ScheduledRide)
+def scheduled_ride_saved(sender, instance, **kwargs):
+    """Materialize or recompute the occurrences of a created or edited series"""
+    from .recurrence import occurrence_engine
+    occurrence_engine.series_saved(instance)
+
+
+@receiver(post_save, sender=PricingCity)
+@receiver(post_save, sender=Tariff)
+@receiver(post_save, sender=TariffTimeRule)
+@receiver(post_delete, sender=PricingCity)
+@receiver(post_delete, sender=Tariff)
+@receiver(post_delete, sender=TariffTimeRule)
+def tariff_changed(sender, instance, **kwargs):
+    """Recompile the tariffs on the next quote; other workers notice within TARIFF_CHECK_SECONDS"""
+    from .tariffs import tariff_engine
+    tariff_engine.invalidate()
+
+
+@receiver(post_save, sender=FavoriteLocation)
+@receiver(post_save, sender=RideTemplate)
+@receiver(post_delete, sender=FavoriteLocation)
+@receiver(post_delete, sender=RideTemplate)
+def saved_place_changed(sender, instance, **kwargs):
+    """Re-index the owner's saved places for geocoding on their next lookup"""
+    from .caching import user_places_cache
+    user_places_cache.invalidate(lambda user_id: user_id == instance.user_id)
@@ -0,0 +1,373 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .background import PeriodicWorker
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_KM / 360
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometers; accepts scalars or broadcastable arrays of degrees"""
+    lat1, lng1, lat2, lng2 = (
+        np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2)
+    )
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class GridIndex:
+    """Process-local fixed lat/lng grid of points for radius and k-nearest lookups"""
+
+    def __init__(self, cell_size_deg=0.01):
+        self.cell_size_deg = cell_size_deg
+        self._lock = threading.RLock()
+        self._cells = {}  # (row, col) -> set of keys
+        self._entries = {}  # key -> entry dict
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _cell(self, latitude, longitude):
+        return (
+            math.floor(latitude / self.cell_size_deg),
+            math.floor(longitude / self.cell_size_deg),
+        )
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        return dict(entry) if entry else None
+
+    def upsert(self, key, latitude, longitude, **data):
+        """Insert an entry or move it to a new position, merging extra data"""
+        latitude, longitude = float(latitude), float(longitude)
+        cell = self._cell(latitude, longitude)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'key': key}
+                self._entries[key] = entry
+            elif entry['cell'] != cell:
+                self._discard(key, entry['cell'])
+
+            entry.update(data)
+            entry['latitude'] = latitude
+            entry['longitude'] = longitude
+            entry['cell'] = cell
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._discard(key, entry['cell'])
+            return entry is not None
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._entries = {}
+
+    def _discard(self, key, cell):
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def _cell_km(self, latitude):
+        """Smallest side of a grid cell in kilometers at the given latitude"""
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        return self.cell_size_deg * KM_PER_DEGREE * min(1.0, cos_lat)
+
+    def _collect(self, cells):
+        """Snapshot of the entries stored in the given cells"""
+        found = []
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                found.append(dict(self._entries[key]))
+        return found
+
+    def _measure(self, latitude, longitude, entries):
+        """Pair each entry with its distance in kilometers from the query point"""
+        if not entries:
+            return []
+        distances = haversine_km(
+            latitude, longitude,
+            [entry['latitude'] for entry in entries],
+            [entry['longitude'] for entry in entries],
+        )
+        return list(zip(distances.tolist(), entries))
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Entries within radius_km of the point as (distance_km, entry), nearest first"""
+        latitude, longitude, radius_km = float(latitude), float(longitude), float(radius_km)
+        cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = radius_km / (KM_PER_DEGREE * cos_lat)
+
+        min_row, min_col = self._cell(latitude - dlat, longitude - dlng)
+        max_row, max_col = self._cell(latitude + dlat, longitude + dlng)
+
+        with self._lock:
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+                # Large radius over a sparse grid: scanning occupied cells is cheaper
+                candidates = self._collect(
+                    (row, col) for row, col in list(self._cells)
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                )
+            else:
+                candidates = self._collect(
+                    (row, col)
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                )
+
+        results = [
+            (distance, entry)
+            for distance, entry in self._measure(latitude, longitude, candidates)
+            if distance <= radius_km
+        ]
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, latitude, longitude, k, max_radius_km=None):
+        """The k entries closest to the point as (distance_km, entry), nearest first"""
+        if k <= 0:
+            return []
+        latitude, longitude = float(latitude), float(longitude)
+        center_row, center_col = self._cell(latitude, longitude)
+        cell_km = self._cell_km(latitude)
+
+        results = []
+        ring = 0
+        with self._lock:
+            remaining = len(self._entries)
+            while remaining > 0:
+                if 8 * ring > len(self._cells):
+                    # Sparse grid far from the query point: scanning occupied cells is cheaper
+                    results = self._measure(latitude, longitude, self._collect(list(self._cells)))
+                    break
+                ring_entries = self._collect(self._ring(center_row, center_col, ring))
+                remaining -= len(ring_entries)
+                results.extend(self._measure(latitude, longitude, ring_entries))
+
+                # Anything outside the rings scanned so far is at least this far away
+                reach = ring * cell_km
+                if max_radius_km is not None and reach > max_radius_km:
+                    break
+                if len(results) >= k:
+                    results.sort(key=lambda item: item[0])
+                    if results[k - 1][0] <= reach:
+                        break
+                ring += 1
+
+        if max_radius_km is not None:
+            results = [item for item in results if item[0] <= max_radius_km]
+        results.sort(key=lambda item: item[0])
+        return results[:k]
+
+    @staticmethod
+    def _ring(center_row, center_col, ring):
+        """Cells at exactly `ring` steps (Chebyshev distance) from the center cell"""
+        if ring == 0:
+            return [(center_row, center_col)]
+        cells = []
+        for col in range(center_col - ring, center_col + ring + 1):
+            cells.append((center_row - ring, col))
+            cells.append((center_row + ring, col))
+        for row in range(center_row - ring + 1, center_row + ring):
+            cells.append((row, center_col - ring))
+            cells.append((row, center_col + ring))
+        return cells
+
+
+class DriverLocationIndex(GridIndex):
+    """Grid index of available drivers, loaded from the database and kept in sync by driver events
+
+    Drivers without a live connection are left out when presence is
+    required for dispatch (see presence.py).
+    """
+
+    def __init__(self, cell_size_deg=0.01, refresh_seconds=30):
+        super().__init__(cell_size_deg)
+        self.refresh_seconds = refresh_seconds
+        self._loaded_at = None
+        self._ratings = {}  # driver id -> average rider rating, refreshed by rebuild()
+        self._worker = PeriodicWorker('driver-index-refresh', refresh_seconds, self.rebuild)
+
+    def ensure_loaded(self):
+        """Load the index on first use; a background worker then picks up changes made by other workers"""
+        self._worker.start()
+        if self._loaded_at is None:
+            self.rebuild()
+
+    def rebuild(self):
+        from django.db.models import Avg, Q
+        from drivers.models import Driver
+
+        drivers = Driver.objects.filter(
+            is_available=True,
+            user__is_active=True,
+            current_latitude__isnull=False,
+            current_longitude__isnull=False,
+        ).select_related('user').prefetch_related('vehicles').annotate(
+            rating=Avg(
+                'rides_as_driver__rating_by_rider',
+                filter=Q(rides_as_driver__status='completed')
+            )
+        )
+
+        from .location_buffer import driver_location_buffer
+        from .presence import presence
+
+        drivers = list(drivers)
+        online = presence.dispatchable([driver.id for driver in drivers])
+
+        fresh = GridIndex(self.cell_size_deg)
+        for driver in drivers:
+            if driver.id not in online:
+                continue
+            # Prefer positions still waiting in the write-behind buffer over the stored row
+            latitude, longitude = driver.current_latitude, driver.current_longitude
+            pending = driver_location_buffer.latest(driver.id)
+            if pending is not None:
+                latitude, longitude = pending[0], pending[1]
+            fresh.upsert(driver.id, latitude, longitude, **self._describe(driver, driver.rating))
+
+        with self._lock:
+            self._cells = fresh._cells
+            self._entries = fresh._entries
+            self._ratings = {driver.id: driver.rating for driver in drivers}
+            self._loaded_at = time.monotonic()
+
+    def update_driver(self, driver):
+        """Sync a single driver after its location, availability or presence changed"""
+        from .presence import presence
+
+        if not (
+            driver.is_available
+            and driver.user.is_active
+            and driver.current_latitude is not None
+            and driver.current_longitude is not None
+            and presence.dispatchable([driver.id])
+        ):
+            self.remove(driver.id)
+            return
+
+        if driver.id in self:
+            self.upsert(driver.id, driver.current_latitude, driver.current_longitude)
+        else:
+            self.upsert(
+                driver.id, driver.current_latitude, driver.current_longitude,
+                **self._describe(driver, self._rating(driver.id))
+            )
+
+    def _rating(self, driver_id):
+        """Average rider rating of a driver, cached until the next rebuild"""
+        if driver_id not in self._ratings:
+            from django.db.models import Avg
+            from .models import Ride
+
+            self._ratings[driver_id] = Ride.objects.filter(
+                driver_id=driver_id, status='completed'
+            ).aggregate(rating=Avg('rating_by_rider'))['rating']
+        return self._ratings[driver_id]
+
+    def move_driver(self, driver_id, latitude, longitude):
+        """Update the position of an indexed driver; returns False if the driver is not indexed"""
+        with self._lock:
+            if driver_id not in self._entries:
+                return False
+            self.upsert(driver_id, latitude, longitude)
+            return True
+
+    @staticmethod
+    def _describe(driver, rating):
+        vehicle = next((v for v in driver.vehicles.all() if v.is_active), None)
+        return {
+            'driver_name': driver.user.get_full_name(),
+            'vehicle_info': f"{vehicle.make} {vehicle.model}" if vehicle else '',
+            'rating': float(rating or 5.0),
+        }
+
+
+class PendingRequestIndex(GridIndex):
+    """Grid index of pending, unexpired ride requests by pickup location, kept in sync by request events"""
+
+    def __init__(self, cell_size_deg=0.01, refresh_seconds=30):
+        super().__init__(cell_size_deg)
+        self.refresh_seconds = refresh_seconds
+        self._loaded_at = None
+        self._worker = PeriodicWorker('pending-request-index-refresh', refresh_seconds, self.rebuild)
+
+    def ensure_loaded(self):
+        """Load the index on first use; a background worker then picks up changes made by other workers"""
+        self._worker.start()
+        if self._loaded_at is None:
+            self.rebuild()
+
+    def rebuild(self):
+        from django.utils import timezone
+        from .models import RideRequest
+
+        requests = RideRequest.objects.filter(
+            status='pending',
+            expires_at__gt=timezone.now(),
+        ).values_list('id', 'pickup_latitude', 'pickup_longitude', 'expires_at')
+
+        fresh = GridIndex(self.cell_size_deg)
+        for request_id, latitude, longitude, expires_at in requests:
+            fresh.upsert(request_id, latitude, longitude, expires_at=expires_at)
+
+        with self._lock:
+            self._cells = fresh._cells
+            self._entries = fresh._entries
+            self._loaded_at = time.monotonic()
+
+    def update_request(self, ride_request):
+        """Sync a single request after it was created or its status changed"""
+        from django.utils import timezone
+
+        if ride_request.status == 'pending' and ride_request.expires_at > timezone.now():
+            self.upsert(
+                ride_request.id, ride_request.pickup_latitude, ride_request.pickup_longitude,
+                expires_at=ride_request.expires_at
+            )
+        else:
+            self.remove(ride_request.id)
+
+    def pending_within(self, latitude, longitude, radius_km):
+        """Unexpired requests within radius_km of the point as (distance_km, entry), nearest first"""
+        from django.utils import timezone
+
+        now = timezone.now()
+        results = []
+        for distance, entry in self.within_radius(latitude, longitude, radius_km):
+            if entry['expires_at'] > now:
+                results.append((distance, entry))
+            else:
+                self.remove(entry['key'])
+        return results
+
+
+driver_index = DriverLocationIndex(
+    cell_size_deg=getattr(settings, 'DRIVER_INDEX_CELL_DEGREES', 0.01),
+    refresh_seconds=getattr(settings, 'DRIVER_INDEX_REFRESH_SECONDS', 30),
+)
+pending_request_index = PendingRequestIndex(
+    cell_size_deg=getattr(settings, 'PENDING_REQUEST_INDEX_CELL_DEGREES', 0.01),
+    refresh_seconds=getattr(settings, 'PENDING_REQUEST_INDEX_REFRESH_SECONDS', 30),
+)
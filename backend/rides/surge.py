@@ -0,0 +1,192 @@
+import math
+import threading
+import time
+from collections import Counter, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import PeriodicWorker
+
+
+def zone_for(latitude, longitude, zone_size_deg=None):
+    """Pricing zone of a coordinate: the id of its fixed-size lat/lng grid cell"""
+    if zone_size_deg is None:
+        zone_size_deg = getattr(settings, 'SURGE_ZONE_DEGREES', 0.02)
+    row = math.floor(float(latitude) / zone_size_deg)
+    col = math.floor(float(longitude) / zone_size_deg)
+    return f"{row}:{col}"
+
+
+class SurgeEngine:
+    """Per-zone surge multipliers from sliding-window demand and live driver supply
+
+    Demand is the number of ride requests created in a zone over the last
+    `window_seconds`, kept as per-bucket counters. Supply is the number of
+    available drivers currently in the zone. Both are updated incrementally
+    from ride request and driver events; a background tick recomputes the
+    multipliers so fare quotes only read a cached value.
+    """
+
+    # (minimum demand/supply ratio, multiplier), highest first
+    SURGE_TIERS = [
+        (3.0, 2.0),
+        (2.0, 1.5),
+        (1.2, 1.2),
+    ]
+    MIN_DEMAND = 3  # Fewer requests than this in the window never surge
+
+    def __init__(self, window_seconds=600, bucket_seconds=30, tick_seconds=5, reseed_seconds=300):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.tick_seconds = tick_seconds
+        self.reseed_seconds = reseed_seconds
+
+        self._lock = threading.Lock()
+        self._demand = {}  # zone -> deque of [bucket, count]
+        self._supply = Counter()  # zone -> available drivers
+        self._driver_zones = {}  # driver id -> zone
+        self._multipliers = {}  # zone -> multiplier
+        self._versions = Counter()  # zone -> number of times its multiplier changed
+        self._ticked_at = None
+        self._seeded_at = None
+        self._worker = PeriodicWorker('surge-engine', tick_seconds, self.tick)
+
+    def _bucket(self, timestamp=None):
+        return int((time.time() if timestamp is None else timestamp) // self.bucket_seconds)
+
+    def record_demand(self, latitude, longitude, timestamp=None):
+        """Count a new ride request in the zone of its pickup"""
+        self._worker.start()
+        zone = zone_for(latitude, longitude)
+        bucket = self._bucket(timestamp)
+        with self._lock:
+            buckets = self._demand.setdefault(zone, deque())
+            if buckets and buckets[-1][0] == bucket:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([bucket, 1])
+
+    def record_driver(self, driver_id, latitude, longitude, is_available):
+        """Move a driver between zones, or out of supply when unavailable"""
+        self._worker.start()
+        zone = None
+        if is_available and latitude is not None and longitude is not None:
+            zone = zone_for(latitude, longitude)
+
+        with self._lock:
+            previous = self._driver_zones.pop(driver_id, None)
+            if previous is not None:
+                self._supply[previous] -= 1
+                if self._supply[previous] <= 0:
+                    del self._supply[previous]
+            if zone is not None:
+                self._driver_zones[driver_id] = zone
+                self._supply[zone] += 1
+
+    def multiplier(self, zone):
+        """Cached surge multiplier of a zone"""
+        self._worker.start()
+        if self._ticked_at is None or time.monotonic() - self._ticked_at > 2 * self.tick_seconds:
+            # No recent background tick (first use or worker not running): refresh inline
+            self.tick()
+        return self._multipliers.get(zone, 1.0)
+
+    def version(self, zone):
+        """Changes whenever the zone's multiplier changes; lets caches key on the current surge"""
+        return self._versions[zone]
+
+    def snapshot(self):
+        """Current demand, supply and multiplier of every active zone"""
+        with self._lock:
+            demand = {zone: sum(count for _, count in buckets) for zone, buckets in self._demand.items()}
+            supply = dict(self._supply)
+        return {
+            zone: {
+                'demand': demand.get(zone, 0),
+                'supply': supply.get(zone, 0),
+                'multiplier': self._multipliers.get(zone, 1.0),
+            }
+            for zone in set(demand) | set(supply)
+        }
+
+    def tick(self):
+        """Expire old demand buckets and recompute every zone's multiplier"""
+        if self._seeded_at is None or time.monotonic() - self._seeded_at > self.reseed_seconds:
+            self.seed()
+
+        oldest = self._bucket() - self.window_seconds // self.bucket_seconds
+        multipliers = {}
+        with self._lock:
+            for zone in list(self._demand):
+                buckets = self._demand[zone]
+                while buckets and buckets[0][0] <= oldest:
+                    buckets.popleft()
+                if not buckets:
+                    del self._demand[zone]
+                    continue
+                demand = sum(count for _, count in buckets)
+                multiplier = self._multiplier_for(demand, self._supply.get(zone, 0))
+                if multiplier > 1.0:
+                    multipliers[zone] = multiplier
+
+        for zone in set(multipliers) | set(self._multipliers):
+            if multipliers.get(zone) != self._multipliers.get(zone):
+                self._versions[zone] += 1
+        self._multipliers = multipliers
+        self._ticked_at = time.monotonic()
+
+    def _multiplier_for(self, demand, supply):
+        if demand < self.MIN_DEMAND:
+            return 1.0
+        ratio = demand / max(supply, 1)
+        for min_ratio, multiplier in self.SURGE_TIERS:
+            if ratio >= min_ratio:
+                return multiplier
+        return 1.0
+
+    def seed(self):
+        """Rebuild counters from the database; reconciles events handled by other workers"""
+        from drivers.models import Driver
+        from .models import RideRequest
+        from .presence import presence
+
+        demand = {}
+        requests = RideRequest.objects.filter(
+            requested_at__gte=timezone.now() - timedelta(seconds=self.window_seconds)
+        ).values_list('pickup_latitude', 'pickup_longitude', 'requested_at')
+        for latitude, longitude, requested_at in requests:
+            zone = zone_for(latitude, longitude)
+            bucket = self._bucket(requested_at.timestamp())
+            demand.setdefault(zone, Counter())[bucket] += 1
+
+        driver_zones = {}
+        drivers = Driver.objects.filter(
+            is_available=True,
+            user__is_active=True,
+            current_latitude__isnull=False,
+            current_longitude__isnull=False,
+        ).values_list('id', 'current_latitude', 'current_longitude')
+        drivers = list(drivers)
+        online = presence.dispatchable([driver_id for driver_id, _, _ in drivers])
+        for driver_id, latitude, longitude in drivers:
+            if driver_id in online:
+                driver_zones[driver_id] = zone_for(latitude, longitude)
+
+        with self._lock:
+            self._demand = {
+                zone: deque([bucket, count] for bucket, count in sorted(counts.items()))
+                for zone, counts in demand.items()
+            }
+            self._driver_zones = driver_zones
+            self._supply = Counter(driver_zones.values())
+            self._seeded_at = time.monotonic()
+
+
+surge_engine = SurgeEngine(
+    window_seconds=getattr(settings, 'SURGE_WINDOW_SECONDS', 600),
+    bucket_seconds=getattr(settings, 'SURGE_BUCKET_SECONDS', 30),
+    tick_seconds=getattr(settings, 'SURGE_TICK_SECONDS', 5),
+    reseed_seconds=getattr(settings, 'SURGE_RESEED_SECONDS', 300),
+)
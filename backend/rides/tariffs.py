@@ -0,0 +1,276 @@
+"""Compiled tariff tables for fare calculation
+
+Tariff, TariffTimeRule and PricingCity rows are compiled into flat lookup
+tables of integers: amounts in paisa and multipliers in basis points. A
+quote is then a couple of dict lookups and integer arithmetic, with one
+rounding (half up, to the paisa) per step. Ride types and areas without a
+row fall back to the FareCalculationService defaults.
+"""
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from django.conf import settings
+
+PAISA = 100  # paisa per rupee
+BASIS = 10000  # multipliers in basis points: 1.3 -> 13000
+
+
+def to_paisa(amount):
+    return int((Decimal(str(amount)) * PAISA).to_integral_value(ROUND_HALF_UP))
+
+
+def to_basis(multiplier):
+    return int((Decimal(str(multiplier)) * BASIS).to_integral_value(ROUND_HALF_UP))
+
+
+def _scale(value, numerator, denominator):
+    """value * numerator / denominator rounded half up, for non-negative integers or int64 arrays"""
+    return (value * numerator + denominator // 2) // denominator
+
+
+def _hour_table(rules):
+    """24 multipliers in basis points from (start hour, end hour, multiplier, priority) rules"""
+    table = [BASIS] * 24
+    # Apply in ascending priority so the highest priority rule ends up on top
+    for start, end, multiplier, _ in sorted(rules, key=lambda rule: rule[3]):
+        hour = start % 24
+        for _ in range((end - start) % 24 or 24):
+            table[hour] = multiplier
+            hour = (hour + 1) % 24
+    return tuple(table)
+
+
+class CompiledTariffs:
+    """Immutable lookup tables built by compile_tariffs()"""
+
+    def __init__(self, rates, cities, hours, version=0):
+        self.rates = rates  # (city code or None, ride type) -> (base, per km, per minute, multiplier, minimum, centiminutes per km)
+        self.cities = cities  # (code, min lat, max lat, min lng, max lng), best match first
+        self.hours = hours  # city code or None -> 24 hourly multipliers
+        self.version = version
+
+    def city_for(self, latitude, longitude):
+        """Code of the pricing city containing the point, None outside every city"""
+        latitude, longitude = float(latitude), float(longitude)
+        for code, min_lat, max_lat, min_lng, max_lng in self.cities:
+            if min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng:
+                return code
+        return None
+
+    def rate(self, city, ride_type):
+        rate = self.rates.get((city, ride_type))
+        if rate is None:
+            # Unknown ride types are priced as standard, like the old multiplier table did
+            rate = self.rates.get((city, 'standard')) or self.rates[(None, 'standard')]
+        return rate
+
+    def time_multiplier(self, city, hour):
+        """Multiplier in basis points for a local hour, BASIS when hour is None"""
+        if hour is None:
+            return BASIS
+        return self.hours.get(city, self.hours[None])[hour]
+
+    def quote(self, distance_km, ride_type, city=None, hour=None, surge_multiplier=1.0, minutes=None):
+        """Fare breakdown for one trip, amounts in rupees rounded to the paisa
+
+        `minutes` is the expected trip duration; without it the tariff's
+        minutes per km is used.
+        """
+        base, per_km, per_minute, multiplier, minimum, centiminutes_per_km = self.rate(city, ride_type)
+        distance_m = round(float(distance_km) * 1000)
+        # _scale() inlined: this runs once per quote
+        if minutes is None:
+            centiminutes = (distance_m * centiminutes_per_km + 500) // 1000
+        else:
+            centiminutes = round(float(minutes) * 100)
+        distance_fare = (distance_m * per_km + 500) // 1000
+        time_fare = (centiminutes * per_minute + 50) // 100
+
+        surge = max(round(surge_multiplier * BASIS), BASIS)
+        total = ((base + distance_fare + time_fare) * multiplier * surge + BASIS * BASIS // 2) // (BASIS * BASIS)
+        if hour is not None:
+            total = (total * self.time_multiplier(city, hour) + BASIS // 2) // BASIS
+        if total < minimum:
+            total = minimum
+
+        return {
+            'base_fare': base / PAISA,
+            'distance_fare': distance_fare / PAISA,
+            'time_fare': time_fare / PAISA,
+            'distance_km': float(distance_km),
+            'estimated_minutes': centiminutes / 100,
+            'ride_type_multiplier': multiplier / BASIS,
+            'surge_multiplier': surge_multiplier,
+            'total_fare': total / PAISA
+        }
+
+    def quote_many(self, distance_km, ride_types, cities, hour=None, surge_multipliers=None, minutes=None):
+        """Vectorized quote() over int64 arrays, one trip per element"""
+        distance_km = np.asarray(distance_km, dtype=np.float64)
+        if surge_multipliers is None:
+            surge_multipliers = [1.0] * len(distance_km)
+
+        rates = np.array(
+            [self.rate(city, ride_type) for city, ride_type in zip(cities, ride_types)], dtype=np.int64
+        ).reshape(-1, 6)
+        base, per_km, per_minute, multiplier, minimum, centiminutes_per_km = rates.T
+        hours = np.array([self.time_multiplier(city, hour) for city in cities], dtype=np.int64)
+        surge = np.maximum(np.rint(np.asarray(surge_multipliers, dtype=np.float64) * BASIS).astype(np.int64), BASIS)
+
+        distance_m = np.rint(distance_km * 1000).astype(np.int64)
+        if minutes is None:
+            centiminutes = _scale(distance_m * centiminutes_per_km, 1, 1000)
+        else:
+            centiminutes = np.rint(np.asarray(minutes, dtype=np.float64) * 100).astype(np.int64)
+        distance_fare = _scale(distance_m * per_km, 1, 1000)
+        time_fare = _scale(centiminutes * per_minute, 1, 100)
+        total = _scale((base + distance_fare + time_fare) * (multiplier * surge), 1, BASIS * BASIS)
+        total = np.maximum(_scale(total * hours, 1, BASIS), minimum)
+
+        return [
+            {
+                'base_fare': base_i / PAISA,
+                'distance_fare': distance_fare_i / PAISA,
+                'time_fare': time_fare_i / PAISA,
+                'distance_km': distance_km_i,
+                'estimated_minutes': centiminutes_i / 100,
+                'ride_type_multiplier': multiplier_i / BASIS,
+                'surge_multiplier': surge_multiplier_i,
+                'total_fare': total_i / PAISA
+            }
+            for base_i, distance_fare_i, time_fare_i, distance_km_i, centiminutes_i,
+                multiplier_i, surge_multiplier_i, total_i in zip(
+                base.tolist(), distance_fare.tolist(), time_fare.tolist(), distance_km.tolist(),
+                centiminutes.tolist(), multiplier.tolist(), list(surge_multipliers), total.tolist()
+            )
+        ]
+
+
+def compile_tariffs(cities=(), tariffs=(), time_rules=(), version=0):
+    """Build CompiledTariffs from active PricingCity, Tariff and TariffTimeRule values() dicts
+
+    City tariffs fall back per ride type to the default (city-less) tariffs,
+    which fall back to the FareCalculationService constants. A city with any
+    time rule of its own uses only its own rules.
+    """
+    from .models import RideRequest
+    from .services import FareCalculationService as defaults
+
+    codes = {city['id']: city['code'] for city in cities}
+    ride_types = {ride_type for ride_type, _ in RideRequest.RIDE_TYPE_CHOICES}
+    ride_types.update(tariff['ride_type'] for tariff in tariffs)
+
+    default_minutes = to_paisa(defaults.MINUTES_PER_KM)  # hundredths of a minute, like paisa of a rupee
+    rates = {
+        (None, ride_type): (
+            to_paisa(defaults.BASE_FARE), to_paisa(defaults.RATE_PER_KM), to_paisa(defaults.RATE_PER_MINUTE),
+            to_basis(defaults.RIDE_TYPE_MULTIPLIERS.get(ride_type, Decimal('1.0'))), 0, default_minutes,
+        )
+        for ride_type in ride_types
+    }
+    city_rates = {}
+    for tariff in tariffs:
+        if tariff['city_id'] is not None and tariff['city_id'] not in codes:
+            continue  # inactive city
+        rate = (
+            to_paisa(tariff['base_fare']), to_paisa(tariff['rate_per_km']), to_paisa(tariff['rate_per_minute']),
+            to_basis(tariff['ride_type_multiplier']), to_paisa(tariff['minimum_fare']),
+            to_paisa(tariff['minutes_per_km']),
+        )
+        if tariff['city_id'] is None:
+            rates[(None, tariff['ride_type'])] = rate
+        else:
+            city_rates[(codes[tariff['city_id']], tariff['ride_type'])] = rate
+    # Resolve the fallbacks now so a quote is a single lookup
+    for code in codes.values():
+        for ride_type in ride_types:
+            rates[(code, ride_type)] = city_rates.get((code, ride_type), rates[(None, ride_type)])
+
+    rules = {}
+    for rule in time_rules:
+        if rule['city_id'] is not None and rule['city_id'] not in codes:
+            continue
+        key = codes.get(rule['city_id'])
+        rules.setdefault(key, []).append(
+            (rule['start_hour'], rule['end_hour'], to_basis(rule['multiplier']), rule['priority'])
+        )
+    if None not in rules:
+        rules[None] = [(start, end, to_basis(multiplier), 0) for start, end, multiplier in defaults.TIME_MULTIPLIERS]
+    hours = {key: _hour_table(city_rules) for key, city_rules in rules.items()}
+
+    ordered = sorted(cities, key=lambda city: (-city['priority'], city['code']))
+    boxes = [
+        (city['code'], float(city['min_latitude']), float(city['max_latitude']),
+         float(city['min_longitude']), float(city['max_longitude']))
+        for city in ordered
+    ]
+    return CompiledTariffs(rates, boxes, hours, version)
+
+
+class TariffEngine:
+    """Holds the compiled tariffs and recompiles them when the tariff tables change
+
+    Saves in this process invalidate immediately through signals. Changes
+    made elsewhere (another worker, a shell) are noticed by comparing row
+    counts and the latest updated_at of the tariff tables at most every
+    `check_seconds`. Each recompile bumps the version and clears the fare
+    quote cache.
+    """
+
+    def __init__(self, check_seconds=5):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._signature = None
+        self._checked_at = None
+        self._version = 0
+
+    def current(self):
+        """The compiled tariffs, reloaded first if the tables changed"""
+        checked_at = self._checked_at
+        if self._compiled is None or checked_at is None or time.monotonic() - checked_at > self.check_seconds:
+            self.refresh()
+        return self._compiled
+
+    def invalidate(self):
+        """Force a reload on the next access"""
+        self._signature = None
+        self._checked_at = None
+
+    def refresh(self):
+        from .caching import fare_quote_cache
+
+        with self._lock:
+            signature = self._table_signature()
+            if self._compiled is None or signature != self._signature:
+                self._version += 1
+                self._compiled = self._load(self._version)
+                self._signature = signature
+                fare_quote_cache.invalidate()
+            self._checked_at = time.monotonic()
+
+    def _table_signature(self):
+        from django.db.models import Count, Max
+        from .models import PricingCity, Tariff, TariffTimeRule
+
+        return tuple(
+            tuple(model.objects.aggregate(count=Count('id'), updated=Max('updated_at')).values())
+            for model in (PricingCity, Tariff, TariffTimeRule)
+        )
+
+    def _load(self, version):
+        from .models import PricingCity, Tariff, TariffTimeRule
+
+        return compile_tariffs(
+            list(PricingCity.objects.filter(is_active=True).values()),
+            list(Tariff.objects.filter(is_active=True).values()),
+            list(TariffTimeRule.objects.filter(is_active=True).values()),
+            version=version,
+        )
+
+
+tariff_engine = TariffEngine(
+    check_seconds=getattr(settings, 'TARIFF_CHECK_SECONDS', 5),
+)
@@ -0,0 +1,47 @@
+"""Helpers shared by the test suites of the rideshare apps"""
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def make_user(number, user_type='rider'):
+    phone_number = f'+97798{number:08d}'
+    return get_user_model().objects.create_user(
+        username=phone_number, phone_number=phone_number, email=f'user{number}@example.com',
+        password=None, user_type=user_type
+    )
+
+
+def make_driver(number, latitude=None, longitude=None, is_available=True):
+    from drivers.models import Driver
+
+    return Driver.objects.create(
+        user=make_user(number, user_type='driver'), license_number=f'KTM-{number:04d}',
+        license_expiry=date.today() + timedelta(days=365), is_available=is_available,
+        current_latitude=None if latitude is None else Decimal(str(latitude)),
+        current_longitude=None if longitude is None else Decimal(str(longitude)),
+    )
+
+
+class NoBackgroundWorkersMixin:
+    """Keeps PeriodicWorker threads from starting; tests drive ticks and flushes themselves"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('rides.background.PeriodicWorker.start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class RideshareTestCase(NoBackgroundWorkersMixin, TestCase):
+    """Database tests with an in-memory channel layer and no background threads"""
+
+
+class RideshareSimpleTestCase(NoBackgroundWorkersMixin, SimpleTestCase):
+    """Tests without a database and without background threads"""
@@ -1,3 +1,2245 @@
-from django.test import TestCase
+import asyncio
+import heapq
+import io
+import math
+import os
+import random
+import tempfile
+import time
+import uuid
+import warnings
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from drivers.models import Driver
+from rides import presence, ws_protocol
+from rides.background import PeriodicWorker
+from rides.broadcast import RideLocationBroadcaster
+from rides.caching import TTLCache
+from rides.consumers import (
+    BinaryFramesMixin, DriverConsumer, RideConsumer, driver_changed_event, ride_changed_event
+)
+from rides.expiry import RequestExpiryScheduler
+from rides.geocoding import Geocoder, PlaceIndex, query_terms, reverse_cache_key, write_gazetteer
+from rides.location_buffer import DriverLocationBuffer, RideLocationBuffer
+from rides.models import Ride, RideLocation, RideRequest, ScheduledRide, ScheduledRideOccurrence
+from rides.polyline import decode_polyline, encode_polyline
+from rides.presence import DRIVER, USER, LocalPresenceBackend, PresenceRegistry, RedisPresenceBackend
+from rides.recurrence import expand
+from rides.road_network import RoadNetwork, RoadNetworkStore
+from rides.routing import websocket_urlpatterns
+from rides.scheduling import ScheduledRideDispatcher
+from rides.services import FareCalculationService, LocationService, RouteOptimizationService
+from rides.spatial_index import DriverLocationIndex, GridIndex, PendingRequestIndex, haversine_km
+from rides.surge import SurgeEngine, zone_for
+from rides.tariffs import compile_tariffs
+from rides.testing import RideshareSimpleTestCase, RideshareTestCase, make_driver, make_user
+from rides.track_encoding import TrackDecodeError, decode_track, encode_track
+from rides.track_simplify import ZOOM_LEVELS, douglas_peucker, level_for_zoom, simplify_levels, zoom_tolerance_m
+from rides.travel_times import HOURS_PER_WEEK, TravelTimeModel, TravelTimeModelStore, hour_of_week
+from rideshare import json_codec
+
+
+def make_ride_request(rider, expires_at, status='pending'):
+    return RideRequest(
+        rider=rider, status=status, expires_at=expires_at,
+        pickup_address='Thamel', pickup_latitude=Decimal('27.715'), pickup_longitude=Decimal('85.312'),
+        destination_address='Patan', destination_latitude=Decimal('27.673'), destination_longitude=Decimal('85.325'),
+    )
+
+
+def make_scheduled_ride(user, scheduled_datetime, **fields):
+    return ScheduledRide.objects.create(
+        user=user, scheduled_datetime=scheduled_datetime,
+        pickup_address='Thamel', pickup_latitude=Decimal('27.715'), pickup_longitude=Decimal('85.312'),
+        destination_address='Patan', destination_latitude=Decimal('27.673'), destination_longitude=Decimal('85.325'),
+        **fields
+    )
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size_deg=0.01)
+        self.index.upsert('thamel', 27.7150, 85.3123)
+        self.index.upsert('patan', 27.6727, 85.3250)
+        self.index.upsert('bhaktapur', 27.6710, 85.4298)
+        self.index.upsert('pokhara', 28.2096, 83.9856)
+
+    def keys(self, results):
+        return [entry['key'] for _, entry in results]
+
+    def test_within_radius_returns_entries_inside_radius_nearest_first(self):
+        results = self.index.within_radius(27.7172, 85.3240, 6)
+
+        self.assertEqual(self.keys(results), ['thamel', 'patan'])
+        distances = [distance for distance, _ in results]
+        self.assertEqual(distances, sorted(distances))
+        self.assertAlmostEqual(distances[0], float(haversine_km(27.7172, 85.3240, 27.7150, 85.3123)))
+
+    def test_within_radius_large_radius_scans_occupied_cells(self):
+        results = self.index.within_radius(27.7172, 85.3240, 500)
+
+        self.assertEqual(self.keys(results), ['thamel', 'patan', 'bhaktapur', 'pokhara'])
+
+    def test_within_radius_excludes_entries_outside_radius(self):
+        self.assertEqual(self.index.within_radius(27.0, 84.0, 5), [])
+
+    def test_upsert_moves_entry_and_keeps_data(self):
+        self.index.upsert('thamel', 27.7150, 85.3123, name='Thamel')
+        self.index.upsert('thamel', 28.2090, 83.9850)
+
+        self.assertEqual(self.keys(self.index.within_radius(28.2096, 83.9856, 1)), ['pokhara', 'thamel'])
+        self.assertEqual(self.index.get('thamel')['name'], 'Thamel')
+        self.assertNotIn('thamel', self.keys(self.index.within_radius(27.7150, 85.3123, 1)))
+
+    def test_remove(self):
+        self.assertTrue(self.index.remove('patan'))
+        self.assertFalse(self.index.remove('patan'))
+        self.assertNotIn('patan', self.index)
+        self.assertEqual(len(self.index), 3)
+
+    def test_nearest_returns_k_closest(self):
+        results = self.index.nearest(27.7172, 85.3240, 3)
+
+        self.assertEqual(self.keys(results), ['thamel', 'patan', 'bhaktapur'])
+
+    def test_nearest_finds_far_entries_in_sparse_grid(self):
+        self.assertEqual(self.keys(self.index.nearest(28.0, 84.0, 1)), ['pokhara'])
+
+    def test_nearest_respects_max_radius(self):
+        self.assertEqual(self.keys(self.index.nearest(27.7172, 85.3240, 4, max_radius_km=6)), ['thamel', 'patan'])
+
+    def test_nearest_with_fewer_entries_than_k(self):
+        self.assertEqual(len(self.index.nearest(27.7172, 85.3240, 10)), 4)
+
+    def test_nearest_k_zero(self):
+        self.assertEqual(self.index.nearest(27.7172, 85.3240, 0), [])
+
+
+class DriverLocationIndexTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = DriverLocationIndex()
+        self.driver = make_driver(1, '27.717', '85.324')
+        rider = make_user(2)
+        Ride.objects.bulk_create([
+            Ride(
+                rider=rider, driver=self.driver, fare=Decimal('150.00'), status='completed', rating_by_rider=rating,
+                pickup_address='Thamel', pickup_latitude=Decimal('27.715'), pickup_longitude=Decimal('85.312'),
+                destination_address='Patan', destination_latitude=Decimal('27.673'),
+                destination_longitude=Decimal('85.325'),
+            )
+            for rating in (3, 4, 5)
+        ])
+
+    def test_reindexing_a_driver_reuses_the_rating_loaded_by_rebuild(self):
+        self.index.rebuild()
+        self.driver.is_available = False
+        self.index.update_driver(self.driver)
+        self.driver.is_available = True
+
+        with mock.patch.object(Driver, 'rating_average', new_callable=mock.PropertyMock) as rating_average, \
+                self.assertNumQueries(1):  # the driver's vehicles
+            self.index.update_driver(self.driver)
+
+        rating_average.assert_not_called()
+        self.assertEqual(self.index.get(self.driver.id)['rating'], 4.0)
+
+    def test_rating_of_a_driver_missed_by_rebuild_is_queried_once(self):
+        with self.assertNumQueries(2):
+            self.index.update_driver(self.driver)
+        self.index.remove(self.driver.id)
+        with self.assertNumQueries(1):
+            self.index.update_driver(self.driver)
+
+        self.assertEqual(self.index.get(self.driver.id)['rating'], 4.0)
+
+    def test_location_updates_of_indexed_drivers_skip_the_database(self):
+        self.index.rebuild()
+
+        with self.assertNumQueries(0):
+            self.driver.current_latitude = Decimal('27.720')
+            self.index.update_driver(self.driver)
+            self.assertTrue(self.index.move_driver(self.driver.id, Decimal('27.721'), Decimal('85.324')))
+
+        self.assertEqual(self.index.get(self.driver.id)['latitude'], 27.721)
+
+
+class PendingRequestIndexTests(RideshareTestCase):
+    def test_refreshes_in_the_background_not_on_lookups(self):
+        index = PendingRequestIndex(refresh_seconds=0)
+
+        with mock.patch.object(index, 'rebuild', wraps=index.rebuild) as rebuild:
+            index.ensure_loaded()
+            index.ensure_loaded()
+
+        rebuild.assert_called_once()
+        self.assertEqual(index._worker.func, index.rebuild)
+        PeriodicWorker.start.assert_called()
+
+
+class TTLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('rides.caching.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.cache = TTLCache('test', maxsize=3, ttl_seconds=60)
+
+    def test_get_or_compute_computes_each_key_once(self):
+        compute = mock.Mock(return_value='Thamel')
+
+        self.assertEqual(self.cache.get_or_compute('a', compute), ('Thamel', False))
+        self.assertEqual(self.cache.get_or_compute('a', compute), ('Thamel', True))
+        compute.assert_called_once()
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('b', 'default'), 'default')
+
+    def test_cached_none_is_a_hit(self):
+        self.cache.set('unroutable', None)
+
+        self.assertEqual(self.cache.get_or_compute('unroutable', mock.Mock()), (None, True))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for key in 'abc':
+            self.cache.set(key, key.upper())
+        self.cache.get('a')
+        self.cache.set('d', 'D')
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual([self.cache.get(key) for key in 'acd'], ['A', 'C', 'D'])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        self.cache.set('a', 'A')
+        self.now += 30
+        self.cache.set('b', 'B')
+        self.now += 30
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 'B')
+        self.assertEqual(len(self.cache), 1)
+        self.now += 30
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['expirations'], 2)
+
+    def test_setting_a_key_again_renews_it(self):
+        self.cache.set('a', 'A')
+        self.now += 50
+        self.cache.set('a', 'A2')
+        self.now += 50
+
+        self.assertEqual(self.cache.get('a'), 'A2')
+
+    def test_invalidate(self):
+        for key in ((1, 'x'), (2, 'x'), (3, 'y')):
+            self.cache.set(key, key)
+
+        self.assertEqual(self.cache.invalidate(lambda key: key[1] == 'x'), 2)
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()['invalidations'], 3)
+
+    def test_stats(self):
+        self.cache.get_or_compute('a', lambda: 'A')
+        self.cache.get('a')
+        self.cache.get('a')
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (2, 1, 0.6667))
+        self.assertEqual((stats['size'], stats['maxsize'], stats['ttl_seconds']), (1, 3, 60))
+        self.assertIsNotNone(stats['avg_miss_ms'])
+        self.assertIsNone(TTLCache('empty').stats()['hit_rate'])
+
+
+class RideLocationBufferTests(TestCase):
+    def setUp(self):
+        self.buffer = RideLocationBuffer(flush_seconds=3600, min_distance_m=10, max_gap_seconds=30, idle_seconds=600)
+        self.addCleanup(self.buffer.shutdown)
+
+    def test_drops_points_that_barely_moved(self):
+        ride_id, now = uuid.uuid4(), timezone.now()
+
+        self.assertTrue(self.buffer.record(ride_id, 27.7, 85.3, timestamp=now))
+        self.assertFalse(self.buffer.record(ride_id, 27.70001, 85.3, timestamp=now + timedelta(seconds=5)))
+        self.assertTrue(self.buffer.record(ride_id, 27.70001, 85.3, timestamp=now + timedelta(seconds=31)))
+        self.assertTrue(self.buffer.record(ride_id, 27.701, 85.3, timestamp=now + timedelta(seconds=32)))
+        self.assertEqual(self.buffer.pending_count(ride_id), 3)
+
+    def test_flush_forgets_idle_rides(self):
+        idle, active, now = uuid.uuid4(), uuid.uuid4(), timezone.now()
+        self.buffer.record(idle, 27.7, 85.3, timestamp=now - timedelta(seconds=601))
+        self.buffer.record(active, 27.7, 85.3, timestamp=now - timedelta(seconds=60))
+
+        self.buffer.flush()
+
+        self.assertNotIn(idle, self.buffer._last_kept)
+        self.assertIn(active, self.buffer._last_kept)
+        self.assertTrue(self.buffer.record(idle, 27.7, 85.3))
+
+
+class TrackEncodingTests(SimpleTestCase):
+    def setUp(self):
+        start = datetime(2026, 3, 1, 8, 30, tzinfo=dt_timezone.utc)
+        self.points = [
+            (Decimal('27.715012'), Decimal('85.312345'), start, Decimal('0.00')),
+            (Decimal('27.715100'), Decimal('85.312301'), start + timedelta(seconds=4, milliseconds=250), None),
+            (Decimal('27.714870'), Decimal('85.313999'), start + timedelta(seconds=9), Decimal('-1.25')),
+            (Decimal('-33.868820'), Decimal('151.209296'), start + timedelta(days=1), Decimal('120.50')),
+        ]
+
+    def test_round_trip_is_lossless(self):
+        decoded = decode_track(encode_track(self.points))
+
+        self.assertEqual([tuple(point) for point in decoded], self.points)
+
+    def test_empty_track(self):
+        self.assertEqual(decode_track(encode_track([])), [])
+
+    def test_nearby_points_take_few_bytes(self):
+        data = encode_track(self.points[:3])
+
+        self.assertLess(len(data), 40)
+
+    def test_rejects_unknown_version(self):
+        data = bytearray(encode_track(self.points))
+        data[0] = 99
+
+        with self.assertRaises(TrackDecodeError):
+            decode_track(bytes(data))
+
+    def test_rejects_empty_data(self):
+        with self.assertRaises(TrackDecodeError):
+            decode_track(b'')
+
+    def test_rejects_truncated_data(self):
+        data = encode_track(self.points)
+
+        with self.assertRaises(TrackDecodeError):
+            decode_track(data[:-1] + bytes([data[-1] | 0x80]))
+        with self.assertRaises(TrackDecodeError):
+            decode_track(data[:-3])
+
+
+class TrackSimplifyTests(SimpleTestCase):
+    def setUp(self):
+        # A street heading east with one point ~50 m north of it
+        self.longitudes = [85.300 + i * 0.001 for i in range(7)]
+        self.latitudes = [27.7] * 7
+        self.latitudes[3] += 0.00045
+
+    def test_tolerance_decides_which_detours_are_kept(self):
+        self.assertEqual(douglas_peucker(self.latitudes, self.longitudes, 10), [0, 2, 3, 4, 6])
+        self.assertEqual(douglas_peucker(self.latitudes, self.longitudes, 100), [0, 6])
+
+    def test_endpoints_are_always_kept(self):
+        indices = douglas_peucker(self.latitudes, self.longitudes, 1e6)
+
+        self.assertEqual(indices, [0, len(self.latitudes) - 1])
+
+    def test_short_tracks_are_kept_whole(self):
+        self.assertEqual(douglas_peucker([], [], 10), [])
+        self.assertEqual(douglas_peucker([27.7], [85.3], 10), [0])
+        self.assertEqual(douglas_peucker([27.7, 27.8], [85.3, 85.3], 10), [0, 1])
+
+    def test_closed_loop_keeps_its_far_point(self):
+        indices = douglas_peucker([27.7, 27.71, 27.7], [85.3, 85.3, 85.3], 10)
+
+        self.assertEqual(indices, [0, 1, 2])
+
+    def test_levels_get_coarser_with_lower_zoom(self):
+        points = [(latitude, longitude) for latitude, longitude in zip(self.latitudes, self.longitudes)]
+
+        levels = simplify_levels(points)
+
+        self.assertEqual(list(levels), [str(zoom) for zoom in ZOOM_LEVELS])
+        self.assertEqual(levels['10'], [0, 6])
+        self.assertEqual(levels['16'], [0, 2, 3, 4, 6])
+        self.assertEqual(simplify_levels([(27.7, 85.3)]), {str(zoom): [0] for zoom in ZOOM_LEVELS})
+        self.assertEqual(simplify_levels([]), {})
+
+    def test_level_for_zoom(self):
+        self.assertEqual(level_for_zoom(3), 10)
+        self.assertEqual(level_for_zoom(13), 12)
+        self.assertEqual(level_for_zoom(16), 16)
+        self.assertIsNone(level_for_zoom(17))
+
+    def test_zoom_tolerance_halves_per_zoom_level(self):
+        self.assertAlmostEqual(zoom_tolerance_m(1) / zoom_tolerance_m(2), 2)
+        self.assertAlmostEqual(zoom_tolerance_m(10, 60), zoom_tolerance_m(10) / 2)
+
+
+class RideTrackTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rider = make_user(1)
+        self.ride = Ride.objects.create(
+            rider=self.rider, fare=Decimal('150.00'), status='in_progress',
+            pickup_address='Thamel', pickup_latitude=Decimal('27.7'), pickup_longitude=Decimal('85.3'),
+            destination_address='Patan', destination_latitude=Decimal('27.7'), destination_longitude=Decimal('85.306'),
+        )
+        start = timezone.now() - timedelta(minutes=10)
+        RideLocation.objects.bulk_create([
+            RideLocation(
+                ride=self.ride, latitude=Decimal('27.700450' if i == 3 else '27.700000'),
+                longitude=Decimal(f'85.30{i}'), timestamp=start + timedelta(seconds=10 * i),
+            )
+            for i in range(7)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.rider)
+
+    def url(self, ride=None):
+        return f'/api/rides/rides/{(ride or self.ride).id}/track/'
+
+    def test_completing_a_ride_compacts_its_track(self):
+        self.ride.complete_ride()
+
+        self.assertFalse(RideLocation.objects.filter(ride=self.ride).exists())
+        self.assertEqual(self.ride.track.point_count, 7)
+        self.assertEqual(self.ride.track.levels['10'], [0, 6])
+
+    def test_only_the_status_transition_finishes_the_ride(self):
+        with mock.patch('rides.services.RideTrackService.compact') as compact, \
+                mock.patch('rides.location_buffer.ride_location_buffer.finish_ride') as finish_ride:
+            self.ride.complete_ride()
+            self.ride.rating_by_rider = 5
+            self.ride.save()
+            reloaded = Ride.objects.get(id=self.ride.id)
+            reloaded.driver_notes = 'Thanks'
+            reloaded.save()
+            reloaded.save(update_fields=['status'])
+
+        compact.assert_called_once()
+        finish_ride.assert_called_once_with(self.ride.id)
+
+    def test_cancelling_flushes_without_compacting(self):
+        with mock.patch('rides.services.RideTrackService.compact') as compact, \
+                mock.patch('rides.location_buffer.ride_location_buffer.finish_ride') as finish_ride:
+            self.ride.cancel_ride('Changed plans')
+
+        compact.assert_not_called()
+        finish_ride.assert_called_once_with(self.ride.id)
+
+    def test_track_endpoint_serves_full_and_simplified_tracks(self):
+        self.ride.complete_ride()
+
+        full = self.client.get(self.url())
+        coarse = self.client.get(self.url(), {'zoom': 10})
+        fine = self.client.get(self.url(), {'tolerance': 10})
+
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(full.data['point_count'], 7)
+        self.assertEqual(full.data['points'][3]['latitude'], '27.700450')
+        self.assertEqual(coarse.data['point_count'], 2)
+        self.assertEqual(
+            [point['longitude'] for point in coarse.data['points']], ['85.300000', '85.306000']
+        )
+        self.assertEqual(fine.data['point_count'], 5)
+
+    def test_track_endpoint_simplifies_rides_in_progress(self):
+        response = self.client.get(self.url(), {'zoom': 10})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['point_count'], 2)
+
+    def test_track_endpoint_rejects_bad_parameters(self):
+        for params in ({'zoom': 'far'}, {'zoom': 23}, {'zoom': -1}, {'tolerance': 'x'}, {'tolerance': -5}):
+            self.assertEqual(self.client.get(self.url(), params).status_code, 400, params)
+
+    def test_track_endpoint_is_limited_to_the_rides_participants(self):
+        self.client.force_authenticate(make_user(2))
+
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+
+
+class RequestExpirySchedulerTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = RequestExpiryScheduler()
+        self.rider = make_user(1)
+        self.now = timezone.now()
+
+    def create(self, expires_in, status='pending'):
+        # bulk_create skips the signals that would schedule them on the shared scheduler
+        ride_request = make_ride_request(self.rider, self.now + timedelta(seconds=expires_in), status)
+        RideRequest.objects.bulk_create([ride_request])
+        return ride_request
+
+    def status(self, ride_request):
+        return RideRequest.objects.values_list('status', flat=True).get(id=ride_request.id)
+
+    def test_tick_expires_overdue_pending_requests(self):
+        overdue = self.create(-60)
+        fresh = self.create(300)
+        accepted = self.create(-60, status='accepted')
+
+        self.assertEqual(self.scheduler.tick(), 1)
+
+        self.assertEqual(self.status(overdue), 'expired')
+        self.assertEqual(self.status(fresh), 'pending')
+        self.assertEqual(self.status(accepted), 'accepted')
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_scheduled_request_expires_once_due(self):
+        self.scheduler.seed()
+        ride_request = self.create(-1)
+        self.scheduler.schedule(ride_request)
+
+        self.assertEqual(self.scheduler.tick(), 1)
+        self.assertEqual(self.status(ride_request), 'expired')
+        self.assertEqual(self.scheduler.tick(), 0)
+
+    def test_request_accepted_before_its_deadline_is_not_expired(self):
+        self.scheduler.seed()
+        ride_request = self.create(-1)
+        self.scheduler.schedule(ride_request)
+        RideRequest.objects.filter(id=ride_request.id).update(status='accepted')
+
+        self.assertEqual(self.scheduler.tick(), 0)
+        self.assertEqual(self.status(ride_request), 'accepted')
+
+    def test_only_the_worker_that_expires_a_request_notifies(self):
+        ride_request = self.create(-60)
+        other_worker = RequestExpiryScheduler()
+
+        with mock.patch('rides.services.NotificationService.send_user_notification') as notify:
+            self.assertEqual(self.scheduler.expire([ride_request.id]), 1)
+            self.assertEqual(other_worker.expire([ride_request.id]), 0)
+
+        notify.assert_called_once()
+        self.assertEqual(notify.call_args.args[:2], (self.rider.id, 'ride_request_expired'))
+
+    def test_requests_accepted_meanwhile_are_not_notified(self):
+        overdue = self.create(-60)
+        accepted = self.create(-60)
+        RideRequest.objects.filter(id=accepted.id).update(status='accepted')
+
+        with mock.patch('rides.services.NotificationService.send_user_notification') as notify:
+            self.assertEqual(self.scheduler.expire([overdue.id, accepted.id]), 1)
+
+        self.assertEqual(notify.call_count, 1)
+        self.assertEqual(notify.call_args.args[2]['ride_request_id'], str(overdue.id))
+        self.assertEqual(self.status(accepted), 'accepted')
+
+    def test_schedule_forgets_requests_no_longer_pending(self):
+        ride_request = self.create(300)
+        self.scheduler.schedule(ride_request)
+        ride_request.status = 'cancelled'
+        self.scheduler.schedule(ride_request)
+
+        self.assertEqual(len(self.scheduler), 0)
+
+
+class RecurrenceExpansionTests(SimpleTestCase):
+    def series(self, start, pattern, end_date=None):
+        return ScheduledRide(scheduled_datetime=start, recurring_pattern=pattern, recurring_end_date=end_date)
+
+    def test_daily(self):
+        start = datetime(2026, 3, 2, 8, 0, tzinfo=dt_timezone.utc)
+
+        moments = expand(self.series(start, 'daily'), start - timedelta(seconds=1), start + timedelta(days=2))
+
+        self.assertEqual(moments, [start, start + timedelta(days=1), start + timedelta(days=2)])
+
+    def test_weekdays_skip_weekends(self):
+        friday = datetime(2026, 3, 6, 8, 0, tzinfo=dt_timezone.utc)
+
+        moments = expand(self.series(friday, 'weekdays'), friday, friday + timedelta(days=4))
+
+        self.assertEqual([moment.strftime('%a') for moment in moments], ['Mon', 'Tue'])
+
+    def test_monthly_clamps_to_the_end_of_shorter_months(self):
+        start = datetime(2026, 1, 31, 9, 0, tzinfo=dt_timezone.utc)
+
+        moments = expand(self.series(start, 'monthly'), start - timedelta(seconds=1), start + timedelta(days=70))
+
+        self.assertEqual([moment.date().isoformat() for moment in moments], ['2026-01-31', '2026-02-28', '2026-03-31'])
+
+    def test_stops_at_recurring_end_date(self):
+        start = datetime(2026, 3, 2, 8, 0, tzinfo=dt_timezone.utc)
+        series = self.series(start, 'daily', end_date=(start + timedelta(days=1)).date())
+
+        self.assertEqual(len(expand(series, start - timedelta(seconds=1), start + timedelta(days=10))), 2)
+
+    def test_one_time_ride_has_a_single_occurrence(self):
+        start = datetime(2026, 3, 2, 8, 0, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(expand(self.series(start, 'none'), start - timedelta(days=1), start + timedelta(days=10)), [start])
+        self.assertEqual(expand(self.series(start, 'none'), start, start + timedelta(days=10)), [])
+
+
+class ScheduledRideOccurrenceTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rider = make_user(1)
+        self.dispatcher = ScheduledRideDispatcher()
+
+    def occurrences(self, scheduled_ride):
+        return list(ScheduledRideOccurrence.objects.filter(scheduled_ride=scheduled_ride).order_by('occurrence_datetime'))
+
+    def test_saving_a_series_materializes_its_occurrences(self):
+        start = timezone.now() + timedelta(hours=2)
+        series = make_scheduled_ride(
+            self.rider, start, recurring_pattern='daily', advance_booking_time=15, max_wait_time=5
+        )
+
+        occurrences = self.occurrences(series)
+        self.assertEqual(len(occurrences), 14)  # one a day until the 14 day horizon
+        self.assertEqual(occurrences[0].occurrence_datetime, start)
+        self.assertEqual(occurrences[0].booking_at, start - timedelta(minutes=15))
+        self.assertEqual(occurrences[0].expires_at, start + timedelta(minutes=5))
+
+    def test_recurrence_edit_regenerates_pending_occurrences(self):
+        start = timezone.now() + timedelta(hours=2)
+        series = make_scheduled_ride(self.rider, start, recurring_pattern='daily')
+
+        series.special_instructions = 'Gate 2'
+        series.save()
+        self.assertEqual(self.occurrences(series)[0].occurrence_datetime, start)
+
+        series.scheduled_datetime = start + timedelta(hours=1)
+        series.recurring_pattern = 'weekly'
+        series.save()
+        occurrences = self.occurrences(series)
+        self.assertEqual([o.occurrence_datetime for o in occurrences[:2]], [
+            start + timedelta(hours=1), start + timedelta(hours=1, weeks=1)
+        ])
+
+    def test_cancelling_a_series_cancels_pending_occurrences(self):
+        series = make_scheduled_ride(self.rider, timezone.now() + timedelta(hours=2), recurring_pattern='daily')
+
+        series.status = 'cancelled'
+        series.save()
+
+        self.assertEqual({o.status for o in self.occurrences(series)}, {'cancelled'})
+
+    def test_tick_books_due_occurrences(self):
+        start = timezone.now() + timedelta(minutes=10)
+        series = make_scheduled_ride(self.rider, start, advance_booking_time=15, max_wait_time=5)
+
+        booked, expired = self.dispatcher.tick()
+
+        self.assertEqual((booked, expired), (1, 0))
+        occurrence = self.occurrences(series)[0]
+        self.assertEqual(occurrence.status, 'confirmed')
+        self.assertEqual(occurrence.ride_request.rider, self.rider)
+        self.assertEqual(occurrence.ride_request.status, 'pending')
+        series.refresh_from_db()
+        self.assertEqual(series.status, 'confirmed')
+
+    def test_tick_leaves_occurrences_that_are_not_due(self):
+        series = make_scheduled_ride(self.rider, timezone.now() + timedelta(hours=2), advance_booking_time=15)
+
+        self.assertEqual(self.dispatcher.tick(), (0, 0))
+        self.assertEqual(self.occurrences(series)[0].status, 'scheduled')
+
+    def test_tick_expires_occurrences_nobody_picked_up(self):
+        start = timezone.now() + timedelta(minutes=10)
+        series = make_scheduled_ride(self.rider, start, max_wait_time=5)
+        ScheduledRideOccurrence.objects.filter(scheduled_ride=series).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        booked, expired = self.dispatcher.tick()
+
+        self.assertEqual(expired, 1)
+        self.assertEqual(self.occurrences(series)[0].status, 'expired')
+        series.refresh_from_db()
+        self.assertEqual(series.status, 'expired')
+
+    def overdue_booked_occurrence(self):
+        series = make_scheduled_ride(self.rider, timezone.now() + timedelta(minutes=10), advance_booking_time=15)
+        self.dispatcher.tick()
+        ScheduledRideOccurrence.objects.filter(scheduled_ride=series).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        return self.occurrences(series)[0]
+
+    def test_expiry_is_notified_once_across_workers(self):
+        occurrence = self.overdue_booked_occurrence()
+
+        with mock.patch('rides.services.NotificationService.send_user_notification') as notify:
+            self.assertEqual(self.dispatcher.expire([occurrence.id]), 1)
+            self.assertEqual(ScheduledRideDispatcher().expire([occurrence.id]), 0)
+
+        notify.assert_called_once()
+        self.assertEqual(notify.call_args.args[1], 'scheduled_ride_expired')
+
+    def test_occurrence_accepted_before_expiry_is_kept(self):
+        occurrence = self.overdue_booked_occurrence()
+        RideRequest.objects.filter(id=occurrence.ride_request_id).update(status='accepted')
+
+        with mock.patch('rides.services.NotificationService.send_user_notification') as notify:
+            self.assertEqual(self.dispatcher.expire([occurrence.id]), 0)
+
+        notify.assert_not_called()
+        occurrence.refresh_from_db()
+        self.assertEqual(occurrence.status, 'confirmed')
+
+
+class CompiledTariffTests(SimpleTestCase):
+    def setUp(self):
+        cities = [
+            {'id': 1, 'code': 'KTM', 'min_latitude': 27.60, 'max_latitude': 27.80,
+             'min_longitude': 85.20, 'max_longitude': 85.45, 'priority': 1},
+            {'id': 2, 'code': 'PTN', 'min_latitude': 27.65, 'max_latitude': 27.70,
+             'min_longitude': 85.30, 'max_longitude': 85.35, 'priority': 2},
+        ]
+        tariffs = [
+            {'city_id': 1, 'ride_type': 'standard', 'base_fare': '40', 'rate_per_km': '20', 'rate_per_minute': '1',
+             'ride_type_multiplier': '1.0', 'minimum_fare': '100', 'minutes_per_km': '2.5'},
+            {'city_id': 99, 'ride_type': 'standard', 'base_fare': '1', 'rate_per_km': '1', 'rate_per_minute': '1',
+             'ride_type_multiplier': '1.0', 'minimum_fare': '0', 'minutes_per_km': '1'},
+        ]
+        time_rules = [
+            {'city_id': 1, 'start_hour': 22, 'end_hour': 2, 'multiplier': '1.5', 'priority': 0},
+            {'city_id': 1, 'start_hour': 0, 'end_hour': 1, 'multiplier': '2.0', 'priority': 1},
+        ]
+        self.tariffs = compile_tariffs(cities, tariffs, time_rules, version=3)
+
+    def test_default_tariff(self):
+        quote = self.tariffs.quote(10, 'standard')
+
+        self.assertEqual(quote['base_fare'], 50.0)
+        self.assertEqual(quote['distance_fare'], 150.0)
+        self.assertEqual(quote['estimated_minutes'], 30.0)
+        self.assertEqual(quote['time_fare'], 60.0)
+        self.assertEqual(quote['total_fare'], 260.0)
+        self.assertEqual(self.tariffs.quote(10, 'premium')['total_fare'], 390.0)
+        self.assertEqual(self.tariffs.quote(10, 'helicopter')['total_fare'], 260.0)
+
+    def test_surge_and_given_duration(self):
+        self.assertEqual(self.tariffs.quote(10, 'standard', surge_multiplier=1.5)['total_fare'], 390.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', surge_multiplier=0.8)['total_fare'], 260.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', minutes=12.5)['total_fare'], 225.0)
+
+    def test_default_time_rules_wrap_midnight(self):
+        self.assertEqual(self.tariffs.quote(10, 'standard', hour=8)['total_fare'], 338.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', hour=23)['total_fare'], 312.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', hour=3)['total_fare'], 312.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', hour=6)['total_fare'], 260.0)
+
+    def test_city_tariff_with_fallback(self):
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='KTM')['total_fare'], 265.0)
+        self.assertEqual(self.tariffs.quote(10, 'premium', city='KTM')['total_fare'], 390.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='PTN')['total_fare'], 260.0)
+
+    def test_minimum_fare(self):
+        quote = self.tariffs.quote(2, 'standard', city='KTM')
+
+        self.assertEqual(quote['base_fare'] + quote['distance_fare'] + quote['time_fare'], 85.0)
+        self.assertEqual(quote['total_fare'], 100.0)
+
+    def test_city_time_rules_replace_defaults_by_priority(self):
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='KTM', hour=23)['total_fare'], 397.5)
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='KTM', hour=0)['total_fare'], 530.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='KTM', hour=8)['total_fare'], 265.0)
+        self.assertEqual(self.tariffs.quote(10, 'standard', city='PTN', hour=8)['total_fare'], 338.0)
+
+    def test_quote_many_matches_quote(self):
+        trips = [(10, 'standard', None, 1.0), (2.345, 'premium', 'KTM', 1.7), (7.77, 'shared', 'PTN', 1.0)]
+
+        quotes = self.tariffs.quote_many(
+            [trip[0] for trip in trips], [trip[1] for trip in trips], [trip[2] for trip in trips],
+            hour=23, surge_multipliers=[trip[3] for trip in trips]
+        )
+
+        self.assertEqual(quotes, [
+            self.tariffs.quote(distance, ride_type, city, 23, surge) for distance, ride_type, city, surge in trips
+        ])
+
+    def test_city_for_prefers_higher_priority(self):
+        self.assertEqual(self.tariffs.city_for(27.72, 85.31), 'KTM')
+        self.assertEqual(self.tariffs.city_for(27.67, 85.32), 'PTN')
+        self.assertIsNone(self.tariffs.city_for(28.2, 83.98))
+
+
+class FareQuoteTests(RideshareTestCase):
+    routes = [
+        {'pickup_latitude': '27.715341', 'pickup_longitude': '85.312187',
+         'destination_latitude': '27.673512', 'destination_longitude': '85.325049'},
+        {'pickup_latitude': '27.701720', 'pickup_longitude': '85.320431',
+         'destination_latitude': '27.671077', 'destination_longitude': '85.429816', 'ride_type': 'premium'},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.cache = TTLCache('fare_quotes', maxsize=100, ttl_seconds=60)
+        patcher = mock.patch('rides.caching.fare_quote_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user(1))
+
+    def batch(self, **data):
+        response = self.client.post('/api/rides/fare-estimate/batch/', {'routes': self.routes, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def single(self, route, ride_type):
+        response = self.client.post('/api/rides/fare-estimate/', {**route, 'ride_type': ride_type}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_batch_and_single_quotes_are_equal(self):
+        quotes = self.batch(ride_types=['standard', 'luxury'])['quotes']
+
+        self.assertEqual(len(quotes), 4)
+        for quote in quotes:
+            single = self.single(self.routes[quote['route_index']], quote['ride_type'])
+            for field in ('base_fare', 'distance_fare', 'time_fare', 'distance_km', 'surge_multiplier', 'total_fare'):
+                self.assertEqual(quote[field], single[field], (quote['route_index'], quote['ride_type'], field))
+
+    def test_batch_and_single_quotes_share_the_cache(self):
+        first = self.batch()
+        self.assertEqual(first['benchmark']['cache_hits'], 0)
+        self.assertEqual([quote['ride_type'] for quote in first['quotes']], ['standard', 'premium'])
+
+        self.single(self.routes[1], 'premium')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.batch()['benchmark']['cache_hits'], 2)
+
+    def test_trips_in_the_same_cells_are_priced_once(self):
+        nearby = dict(self.routes[0], pickup_latitude='27.715401')
+
+        with mock.patch.object(
+            FareCalculationService, 'calculate_fares', wraps=FareCalculationService.calculate_fares
+        ) as calculate_fares:
+            quotes = FareCalculationService.get_fare_quotes([
+                tuple(route[field] for field in (
+                    'pickup_latitude', 'pickup_longitude', 'destination_latitude', 'destination_longitude'
+                )) + ('standard',)
+                for route in (self.routes[0], nearby)
+            ])
+
+        self.assertEqual(len(calculate_fares.call_args.args[0]), 1)
+        self.assertEqual(quotes[0], quotes[1])
+        self.assertEqual(len(self.cache), 1)
+
+
+class SurgeEngineTests(RideshareTestCase):
+    thamel = (27.7150, 85.3123)
+    patan = (27.6727, 85.3250)
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1_800_000_000.0
+        clock = mock.patch('rides.surge.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.engine = SurgeEngine(window_seconds=600, bucket_seconds=30)
+        self.engine.seed()
+        self.zone = zone_for(*self.thamel)
+
+    def demand(self, count, location=None):
+        for _ in range(count):
+            self.engine.record_demand(*(location or self.thamel), timestamp=self.now)
+
+    def drivers(self, count, location=None):
+        for driver_id in range(count):
+            self.engine.record_driver(driver_id, *(location or self.thamel), True)
+
+    def test_zones_are_grid_cells(self):
+        self.assertEqual(zone_for(27.7150, 85.3123), zone_for(27.7199, 85.3199))
+        self.assertNotEqual(zone_for(*self.thamel), zone_for(*self.patan))
+        self.assertEqual(zone_for(-0.001, -0.001, zone_size_deg=0.02), '-1:-1')
+
+    def test_multiplier_follows_the_demand_supply_ratio(self):
+        self.demand(6)
+        for supply, expected in ((0, 2.0), (2, 2.0), (3, 1.5), (5, 1.2), (6, 1.0)):
+            self.drivers(supply)
+            self.engine.tick()
+            self.assertEqual(self.engine.multiplier(self.zone), expected, supply)
+        self.assertEqual(self.engine.multiplier(zone_for(*self.patan)), 1.0)
+
+    def test_low_demand_never_surges(self):
+        self.demand(2)
+        self.engine.tick()
+
+        self.assertEqual(self.engine.multiplier(self.zone), 1.0)
+
+    def test_demand_decays_out_of_the_window(self):
+        self.demand(4)
+        self.now += 300
+        self.demand(2)
+        self.engine.tick()
+        self.assertEqual(self.engine.snapshot()[self.zone]['demand'], 6)
+        self.assertEqual(self.engine.multiplier(self.zone), 2.0)
+
+        self.now += 330  # the first four requests leave the window
+        self.engine.tick()
+        self.assertEqual(self.engine.snapshot()[self.zone]['demand'], 2)
+        self.assertEqual(self.engine.multiplier(self.zone), 1.0)
+
+        self.now += 300
+        self.engine.tick()
+        self.assertNotIn(self.zone, self.engine.snapshot())
+
+    def test_drivers_move_between_zones_and_leave_supply(self):
+        self.engine.record_driver('a', *self.thamel, True)
+        self.engine.record_driver('b', *self.thamel, True)
+        self.engine.record_driver('a', *self.patan, True)
+        self.engine.record_driver('b', *self.thamel, False)
+
+        snapshot = self.engine.snapshot()
+        self.assertEqual(snapshot[zone_for(*self.patan)]['supply'], 1)
+        self.assertNotIn(self.zone, snapshot)
+
+    def test_version_changes_only_with_the_multiplier(self):
+        self.engine.tick()
+        before = self.engine.version(self.zone)
+        self.demand(3)
+        self.engine.tick()
+        surged = self.engine.version(self.zone)
+        self.demand(1)
+        self.engine.tick()
+
+        self.assertEqual(surged, before + 1)
+        self.assertEqual(self.engine.version(self.zone), surged)
+        self.now += 900
+        self.engine.tick()
+        self.assertEqual(self.engine.version(self.zone), surged + 1)
+
+    def test_seed_rebuilds_demand_and_supply_from_the_database(self):
+        rider = make_user(1)
+        RideRequest.objects.bulk_create([
+            make_ride_request(rider, timezone.now() + timedelta(minutes=10)) for _ in range(3)
+        ])
+        make_driver(2, *self.patan)
+        engine = SurgeEngine(window_seconds=600, bucket_seconds=30)
+        self.now = timezone.now().timestamp()
+
+        engine.tick()
+
+        pickup_zone = zone_for(Decimal('27.715'), Decimal('85.312'))
+        self.assertEqual(engine.snapshot()[pickup_zone]['demand'], 3)
+        self.assertEqual(engine.snapshot()[zone_for(*self.patan)]['supply'], 1)
+        self.assertEqual(engine.multiplier(pickup_zone), 2.0)
+
+
+class PolylineTests(SimpleTestCase):
+    GOOGLE_EXAMPLE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    GOOGLE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+    def test_matches_reference_encoding(self):
+        self.assertEqual(encode_polyline(self.GOOGLE_POINTS), self.GOOGLE_EXAMPLE)
+        self.assertEqual(decode_polyline(self.GOOGLE_EXAMPLE), self.GOOGLE_POINTS)
+
+    def test_round_trip_rounds_to_precision(self):
+        points = [(27.717245, 85.323961), (27.7172, 85.324), (27.670587, 85.320444), (-0.000004, 0.000006)]
+
+        decoded = decode_polyline(encode_polyline(points))
+
+        self.assertEqual(decoded, [(round(lat, 5), round(lng, 5)) for lat, lng in points])
+        self.assertEqual(decode_polyline(encode_polyline(points, precision=6), precision=6), points)
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([]), '')
+        self.assertEqual(decode_polyline(''), [])
+
+    def test_truncated_input(self):
+        for text in (self.GOOGLE_EXAMPLE[:-1], self.GOOGLE_EXAMPLE[:5], '_'):
+            with self.assertRaises(ValueError):
+                decode_polyline(text)
+
+
+class BinaryFrameTests(SimpleTestCase):
+    moment = datetime(2026, 3, 2, 8, 30, 15, 250000, tzinfo=dt_timezone.utc)
+
+    def test_location_round_trip(self):
+        frame = ws_protocol.encode_location(27.717245, -85.323961, 42.37, self.moment)
+
+        self.assertEqual(len(frame), 19)
+        self.assertEqual(ws_protocol.decode(frame), {
+            'type': 'location_update',
+            'latitude': 27.717245,
+            'longitude': -85.323961,
+            'speed': 42.4,
+            'timestamp_ms': ws_protocol.epoch_millis(self.moment),
+        })
+        self.assertEqual(ws_protocol.from_epoch_millis(ws_protocol.epoch_millis(self.moment)), self.moment)
+
+    def test_location_speed_is_clamped(self):
+        self.assertEqual(ws_protocol.decode(ws_protocol.encode_location(0, 0, None, self.moment))['speed'], 0)
+        self.assertEqual(ws_protocol.decode(ws_protocol.encode_location(0, 0, -5, self.moment))['speed'], 0)
+        self.assertEqual(
+            ws_protocol.decode(ws_protocol.encode_location(0, 0, 99999, self.moment))['speed'], ws_protocol.MAX_SPEED
+        )
+
+    def test_location_rejects_bad_coordinates(self):
+        for latitude, longitude in ((90.1, 0), (0, -180.5), (None, 0), ('north', 0), ('nan', 0), (0, float('inf'))):
+            with self.assertRaises(ValueError):
+                ws_protocol.encode_location(latitude, longitude, 0, self.moment)
+
+    def test_coordinates(self):
+        self.assertEqual(ws_protocol.coordinates('27.7', 85), (27.7, 85.0))
+        self.assertEqual(ws_protocol.coordinates(-90, 180), (-90.0, 180.0))
+        for latitude, longitude in ((float('nan'), 85), (27.7, '-inf'), ([27.7], 85), (27.7, '')):
+            with self.assertRaises(ValueError):
+                ws_protocol.coordinates(latitude, longitude)
+
+    def test_status_round_trip(self):
+        for status in ws_protocol.STATUSES:
+            frame = ws_protocol.encode_status(status, self.moment)
+            self.assertEqual(len(frame), 10)
+            self.assertEqual(ws_protocol.decode(frame), {
+                'type': 'status_update', 'status': status, 'timestamp_ms': ws_protocol.epoch_millis(self.moment)
+            })
+
+    def test_status_without_code(self):
+        with self.assertRaises(ValueError):
+            ws_protocol.encode_status('driver_arrived', self.moment)
+
+    def test_malformed_frames(self):
+        location = ws_protocol.encode_location(27.7, 85.3, 10, self.moment)
+        status = ws_protocol.encode_status('accepted', self.moment)
+        frames = [
+            b'',
+            b'\x09' + location[1:],
+            location[:-1],
+            location + b'\x00',
+            status[:-3],
+            bytes([ws_protocol.STATUS_FRAME, len(ws_protocol.STATUSES)]) + status[2:],
+            ws_protocol._LOCATION.pack(ws_protocol.LOCATION_FRAME, 95_000_000, 85_300_000, 0, 0),
+            ws_protocol._LOCATION.pack(ws_protocol.LOCATION_FRAME, 27_700_000, -2_000_000_000, 0, 0),
+        ]
+        for frame in frames:
+            with self.assertRaises(ValueError):
+                ws_protocol.decode(frame)
+
+    def test_consumers_drop_malformed_messages(self):
+        consumer = BinaryFramesMixin()
+
+        self.assertIsNone(consumer.parse_message(bytes_data=b'\x01\x02'))
+        self.assertIsNone(consumer.parse_message(bytes_data=b''))
+        self.assertIsNone(consumer.parse_message(text_data='{"type": '))
+        self.assertIsNone(consumer.parse_message(text_data='[1, 2]'))
+        self.assertIsNone(consumer.parse_message())
+        self.assertEqual(consumer.parse_message(text_data='{"type": "heartbeat"}'), {'type': 'heartbeat'})
+        self.assertEqual(
+            consumer.parse_message(bytes_data=ws_protocol.encode_status('completed', self.moment))['status'],
+            'completed'
+        )
+
+
+class RecordingChannelLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+
+class RideLocationBroadcasterTests(SimpleTestCase):
+    def setUp(self):
+        self.broadcaster = RideLocationBroadcaster({'accepted': 20.0, 'completed': 0}, default_rate=10.0)
+        self.layer = RecordingChannelLayer()
+        self.moment = datetime(2026, 3, 1, 8, 30, tzinfo=dt_timezone.utc)
+
+    def publish(self, status, latitude, group='ride_1'):
+        return self.broadcaster.publish(self.layer, group, status, latitude, 85.3, 12.5, self.moment)
+
+    def positions(self):
+        return [json_codec.loads(event['text'])['latitude'] for _, event in self.layer.sent]
+
+    def test_intervals_follow_the_ride_status(self):
+        self.assertEqual(self.broadcaster.interval('accepted'), 0.05)
+        self.assertEqual(self.broadcaster.interval('in_progress'), 0.1)
+        self.assertIsNone(self.broadcaster.interval('completed'))
+
+    def test_frames_within_an_interval_are_coalesced_into_the_newest(self):
+        async def scenario():
+            await self.publish('accepted', 27.70)
+            await self.publish('accepted', 27.71)
+            await self.publish('accepted', 27.72)
+            self.assertEqual(self.positions(), [27.70])
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(self.positions(), [27.70, 27.72])
+        self.assertEqual(self.broadcaster.stats()['coalesced'], 1)
+        self.assertEqual(self.broadcaster.stats()['broadcasts'], 2)
+
+    def test_rides_are_throttled_independently(self):
+        async def scenario():
+            await self.publish('accepted', 27.70, group='ride_1')
+            await self.publish('accepted', 27.80, group='ride_2')
+
+        asyncio.run(scenario())
+
+        self.assertEqual([group for group, _ in self.layer.sent], ['ride_1', 'ride_2'])
+
+    def test_statuses_without_broadcasts_drop_the_waiting_frame(self):
+        async def scenario():
+            await self.publish('accepted', 27.70)
+            await self.publish('accepted', 27.71)
+            await self.publish('completed', 27.72)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(self.positions(), [27.70])
+        self.assertEqual(self.broadcaster.stats()['suppressed'], 1)
+
+    def test_broadcast_is_encoded_once_for_both_wire_formats(self):
+        with mock.patch('rides.broadcast.encode_location', wraps=ws_protocol.encode_location) as encode:
+            asyncio.run(self.publish('accepted', 27.70))
+
+        encode.assert_called_once()
+        event = self.layer.sent[0][1]
+        self.assertEqual(ws_protocol.decode(event['bytes'])['latitude'], 27.7)
+        self.assertEqual(json_codec.loads(event['text'])['timestamp'], self.moment.isoformat())
+
+    def test_fan_out_reaches_every_subscriber(self):
+        async def scenario():
+            layer = InMemoryChannelLayer()
+            channels = [await layer.new_channel() for _ in range(3)]
+            for channel in channels:
+                await layer.group_add('ride_1', channel)
+            await self.broadcaster.publish(layer, 'ride_1', 'accepted', 27.70, 85.3, 12.5, self.moment)
+            return [await layer.receive(channel) for channel in channels]
+
+        events = asyncio.run(scenario())
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual({event['text'] for event in events}, {events[0]['text']})
+        self.assertEqual({event['type'] for event in events}, {'location_update'})
+
+    def test_slow_subscribers_skip_to_the_newest_frame(self):
+        delivered = []
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def send(event):
+                delivered.append(event['sent_at'])
+                await release.wait()
+
+            relay = self.broadcaster.relay(send)
+            for sent_at in (1.0, 2.0, 3.0, 4.0):
+                relay.offer({'sent_at': sent_at})
+                await asyncio.sleep(0)
+            relay.offer({'sent_at': 3.5})  # older than the newest waiting frame
+            release.set()
+            await asyncio.sleep(0.01)
+            relay.offer({'sent_at': 2.5})  # older than the last frame sent
+            await asyncio.sleep(0.01)
+            relay.close()
+
+        asyncio.run(scenario())
+
+        self.assertEqual(delivered, [1.0, 4.0])
+        self.assertEqual(self.broadcaster.stats()['skipped_by_subscribers'], 4)
+
+
+class PresenceBackendTestsMixin:
+    """Backend contract, run against each backend with real timestamps (Redis expires keys by wall clock)"""
+
+    def test_member_is_online_while_any_connection_is(self):
+        now = time.time()
+
+        self.assertTrue(self.backend.touch(DRIVER, '1', 'socket-a', now + 60, now))
+        self.assertFalse(self.backend.touch(DRIVER, '1', 'socket-b', now + 30, now))
+        self.assertTrue(self.backend.is_online(DRIVER, '1', now))
+        self.assertFalse(self.backend.is_online(USER, '1', now))
+
+        self.assertFalse(self.backend.leave(DRIVER, '1', 'socket-a', now))
+        self.assertTrue(self.backend.is_online(DRIVER, '1', now))
+        self.assertTrue(self.backend.leave(DRIVER, '1', 'socket-b', now))
+        self.assertFalse(self.backend.is_online(DRIVER, '1', now))
+        self.assertTrue(self.backend.leave(DRIVER, '1', 'socket-b', now))
+
+    def test_connections_expire_after_their_ttl(self):
+        now = time.time()
+        self.backend.touch(DRIVER, '1', 'socket-a', now + 10, now)
+        self.backend.touch(DRIVER, '2', 'socket-a', now + 60, now)
+
+        self.assertEqual(self.backend.online(DRIVER, ['1', '2', '3'], now + 5), {'1', '2'})
+        self.assertEqual(self.backend.online(DRIVER, ['1', '2', '3'], now + 11), {'2'})
+        self.assertEqual(self.backend.online(DRIVER, [], now), set())
+        self.assertEqual(self.backend.count(DRIVER, now + 5), 2)
+        self.assertEqual(self.backend.count(DRIVER, now + 11), 1)
+
+        # A heartbeat after the TTL brings the member back online
+        self.assertTrue(self.backend.touch(DRIVER, '1', 'socket-a', now + 71, now + 11))
+
+    def test_leave_keeps_the_latest_live_expiry(self):
+        now = time.time()
+        self.backend.touch(DRIVER, '1', 'socket-a', now + 60, now)
+        self.backend.touch(DRIVER, '1', 'socket-b', now + 20, now)
+
+        self.backend.leave(DRIVER, '1', 'socket-a', now)
+
+        self.assertTrue(self.backend.is_online(DRIVER, '1', now + 15))
+        self.assertFalse(self.backend.is_online(DRIVER, '1', now + 25))
+
+    def test_purge_forgets_expired_members(self):
+        now = time.time()
+        self.backend.touch(USER, '1', 'socket-a', now + 10, now)
+        self.backend.touch(USER, '2', 'socket-a', now + 60, now)
+
+        self.backend.purge(USER, now + 11)
+
+        self.assertEqual(self.backend.online(USER, ['1', '2'], now), {'2'})
+
+
+class LocalPresenceBackendTests(PresenceBackendTestsMixin, SimpleTestCase):
+    def setUp(self):
+        self.backend = LocalPresenceBackend()
+
+
+class RedisPresenceBackendTests(PresenceBackendTestsMixin, SimpleTestCase):
+    def setUp(self):
+        import redis
+
+        url = getattr(settings, 'PRESENCE_REDIS_URL', '') or 'redis://127.0.0.1:6379/1'
+        self.backend = RedisPresenceBackend(url, prefix=f'test-presence-{uuid.uuid4().hex}')
+        try:
+            self.backend._redis.ping()
+        except redis.RedisError:
+            self.skipTest(f'Redis unavailable at {url}')
+        self.addCleanup(self.delete_keys)
+
+    def delete_keys(self):
+        keys = list(self.backend._redis.scan_iter(f'{self.backend.prefix}:*'))
+        if keys:
+            self.backend._redis.delete(*keys)
+
+
+class SharedLocalPresenceBackend(LocalPresenceBackend):
+    shared = True
+
+
+class PresenceRegistryTests(RideshareSimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1_000_000.0
+        clock = mock.patch('rides.presence.time.time', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_heartbeats_are_throttled_to_a_quarter_ttl(self):
+        registry = PresenceRegistry(LocalPresenceBackend(), ttl_seconds=60)
+
+        with mock.patch.object(registry.backend, 'touch', wraps=registry.backend.touch) as backend_touch:
+            self.assertTrue(registry.touch(DRIVER, '1', 'socket-a'))
+            self.now += 10
+            self.assertFalse(registry.touch(DRIVER, '1', 'socket-a'))
+            self.assertTrue(registry.touch(DRIVER, '2', 'socket-a'))
+            self.now += 5
+            self.assertFalse(registry.touch(DRIVER, '1', 'socket-a'))
+
+        self.assertEqual(backend_touch.call_count, 3)
+
+    def test_member_goes_offline_after_the_ttl(self):
+        registry = PresenceRegistry(LocalPresenceBackend(), ttl_seconds=60)
+        registry.touch(DRIVER, '1', 'socket-a')
+
+        self.now += 59
+        self.assertTrue(registry.is_online(DRIVER, '1'))
+        self.now += 2
+        self.assertFalse(registry.is_online(DRIVER, '1'))
+        self.assertEqual(registry.count(DRIVER), 0)
+        self.assertTrue(registry.touch(DRIVER, '1', 'socket-a'))
+        self.assertTrue(registry.leave(DRIVER, '1', 'socket-a'))
+        self.assertFalse(registry.is_online(DRIVER, '1'))
+
+    def test_leave_resets_the_throttle(self):
+        registry = PresenceRegistry(LocalPresenceBackend(), ttl_seconds=60)
+        registry.touch(USER, '1', 'socket-a')
+        registry.leave(USER, '1', 'socket-a')
+
+        self.assertTrue(registry.touch(USER, '1', 'socket-a'))
+
+    def test_local_backend_does_not_gate_dispatch(self):
+        registry = PresenceRegistry(LocalPresenceBackend(), require_for_dispatch=True)
+        registry.touch(DRIVER, '1')
+
+        self.assertFalse(registry.require_for_dispatch)
+        self.assertEqual(registry.dispatchable(['1', '2']), {'1', '2'})
+
+    def test_shared_backend_gates_dispatch(self):
+        registry = PresenceRegistry(SharedLocalPresenceBackend(), require_for_dispatch=True)
+        registry.touch(DRIVER, '1')
+
+        self.assertTrue(registry.require_for_dispatch)
+        self.assertEqual(registry.dispatchable(['1', '2']), {'1'})
+        self.assertEqual(
+            PresenceRegistry(SharedLocalPresenceBackend(), require_for_dispatch=False).dispatchable(['1', '2']),
+            {'1', '2'}
+        )
+
+    def test_unreachable_backend_fails_open(self):
+        registry = PresenceRegistry(RedisPresenceBackend('redis://127.0.0.1:1/0'), require_for_dispatch=True)
+
+        with mock.patch('builtins.print'):
+            self.assertFalse(registry.touch(DRIVER, '1'))
+            self.assertFalse(registry.leave(DRIVER, '1', 'socket-a'))
+            self.assertIsNone(registry.count(DRIVER))
+            self.assertIsNone(registry.is_online(DRIVER, '1'))
+            self.assertIsNone(registry.online(DRIVER, ['1', '2']))
+            self.assertEqual(registry.dispatchable(['1', '2']), {'1', '2'})
+
+    def test_backend_defaults_to_local_unless_redis_is_configured(self):
+        with override_settings(PRESENCE_REDIS_URL=''):
+            del settings.PRESENCE_BACKEND
+            self.assertIsInstance(presence._backend(), LocalPresenceBackend)
+        with override_settings(PRESENCE_REDIS_URL='redis://127.0.0.1:1/0'):
+            del settings.PRESENCE_BACKEND
+            self.assertIsInstance(presence._backend(), RedisPresenceBackend)
+        with override_settings(PRESENCE_REDIS_URL='redis://127.0.0.1:1/0', PRESENCE_BACKEND='local'):
+            self.assertIsInstance(presence._backend(), LocalPresenceBackend)
+
+
+def grid_road_network():
+    """4x4 street grid with mixed speeds and one-way streets, two one-way spurs and a separate island
+
+    Returns the network and the node index of every OSM node id.
+    """
+    rng = random.Random(3)
+    coordinates = {
+        row * 4 + col + 1: (27.700 + row * 0.002, 85.300 + col * 0.002)
+        for row in range(4) for col in range(4)
+    }
+    ways = []
+    for row in range(4):
+        for col in range(4):
+            node = row * 4 + col + 1
+            for neighbour in ([node + 1] if col < 3 else []) + ([node + 4] if row < 3 else []):
+                direction = rng.choice([1, -1]) if rng.random() < 0.25 else 0
+                ways.append(([node, neighbour], rng.choice([10, 18, 25, 35]), direction))
+    coordinates.update({50: (27.694, 85.300), 51: (27.694, 85.302), 100: (27.720, 85.330), 101: (27.7202, 85.330)})
+    ways += [([1, 50], 18, 1), ([51, 2], 18, -1), ([100, 101], 25, 0)]
+
+    network = RoadNetwork.from_ways(coordinates, ways)
+    nodes = {node_id: network.nearest_node(*coordinates[node_id], max_meters=1)[0] for node_id in coordinates}
+    return network, nodes, coordinates
+
+
+def dijkstra_seconds(network, source):
+    """Plain forward Dijkstra over the CSR arrays: {node: seconds} of every node reachable from source"""
+    times = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = set()
+    while heap:
+        time_here, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        for edge in range(int(network.offsets[node]), int(network.offsets[node + 1])):
+            neighbour = int(network.targets[edge])
+            time_there = time_here + float(network.seconds[edge])
+            if time_there < times.get(neighbour, math.inf):
+                times[neighbour] = time_there
+                heapq.heappush(heap, (time_there, neighbour))
+    return times
+
+
+class RoadNetworkTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.network, cls.nodes, cls.coordinates = grid_road_network()
+
+    def assertContiguousPath(self, source, target, edges):
+        node = source
+        for edge in edges:
+            self.assertEqual(int(self.network.sources[edge]), node)
+            node = int(self.network.targets[edge])
+        self.assertEqual(node, target)
+
+    def test_csr_arrays(self):
+        network = self.network
+
+        self.assertEqual(network.node_count, 20)
+        self.assertEqual(network.offsets[-1], network.edge_count)
+        self.assertEqual(network.reverse_offsets[-1], network.edge_count)
+        for node in range(network.node_count):
+            outgoing = network.sources[network.offsets[node]:network.offsets[node + 1]]
+            incoming = network.targets[network.reverse_edges[network.reverse_offsets[node]:network.reverse_offsets[node + 1]]]
+            self.assertTrue((outgoing == node).all())
+            self.assertTrue((incoming == node).all())
+
+    def test_bidirectional_a_star_matches_dijkstra(self):
+        for source in range(self.network.node_count):
+            expected = dijkstra_seconds(self.network, source)
+            for target in range(self.network.node_count):
+                result = self.network.shortest_path(source, target)
+                if target not in expected:
+                    self.assertIsNone(result, (source, target))
+                    continue
+                seconds, edges = result
+                self.assertAlmostEqual(seconds, expected[target], places=3, msg=(source, target))
+                self.assertAlmostEqual(float(self.network.seconds[edges].sum()), seconds, places=3)
+                self.assertContiguousPath(source, target, edges)
+
+    def test_start_equal_to_goal(self):
+        node = self.nodes[6]
+
+        self.assertEqual(self.network.shortest_path(node, node), (0.0, []))
+        route = self.network.route(*self.coordinates[6], *self.coordinates[6])
+        self.assertAlmostEqual(route['meters'], 0, places=3)
+        self.assertEqual(len(route['points']), 3)
+
+    def test_unreachable_nodes(self):
+        self.assertIsNone(self.network.shortest_path(self.nodes[1], self.nodes[100]))
+        self.assertIsNone(self.network.route(*self.coordinates[16], *self.coordinates[101]))
+        self.assertIsNotNone(self.network.shortest_path(self.nodes[100], self.nodes[101]))
+
+    def test_one_way_edges(self):
+        self.assertIsNotNone(self.network.shortest_path(self.nodes[1], self.nodes[50]))
+        self.assertIsNone(self.network.shortest_path(self.nodes[50], self.nodes[1]))
+        self.assertIsNotNone(self.network.shortest_path(self.nodes[2], self.nodes[51]))
+        self.assertIsNone(self.network.shortest_path(self.nodes[51], self.nodes[2]))
+
+    def test_snapping(self):
+        self.assertEqual(self.network.nearest_node(27.7021, 85.3019)[0], self.nodes[6])
+        self.assertIsNone(self.network.nearest_node(27.80, 85.40))
+        self.assertIsNone(self.network.route(27.80, 85.40, *self.coordinates[1]))
+
+    def test_many_to_one_matches_point_to_point(self):
+        destination = (27.7041, 85.3039)
+        origins = [self.coordinates[node_id] for node_id in sorted(self.coordinates)] + [(27.80, 85.40)]
+
+        results = self.network.many_to_one(origins, *destination)
+
+        self.assertEqual(len(results), len(origins))
+        for origin, result in zip(origins, results):
+            route = self.network.route(*origin, *destination)
+            if route is None:
+                self.assertIsNone(result, origin)
+                continue
+            self.assertAlmostEqual(result['seconds'], route['seconds'], places=3, msg=origin)
+            self.assertAlmostEqual(result['meters'], route['meters'], places=1, msg=origin)
+        self.assertIsNone(results[-1])
+
+    def test_many_to_one_stops_at_max_seconds(self):
+        destination = self.coordinates[16]
+        origins = [self.coordinates[1], self.coordinates[12]]
+        near = self.network.route(*origins[1], *destination)['seconds']
+
+        results = self.network.many_to_one(origins, *destination, max_seconds=near)
+
+        self.assertIsNone(results[0])
+        self.assertAlmostEqual(results[1]['seconds'], near, places=3)
+
+
+class RoadNetworkStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.network, _, self.coordinates = grid_road_network()
+        self.network.save(self.path)
+
+    def compute_route(self, store):
+        with mock.patch('rides.road_network.road_network', store), \
+                mock.patch('rides.travel_times.travel_time_model', TravelTimeModelStore()):
+            return RouteOptimizationService._compute_route(*self.coordinates[1], *self.coordinates[16])
+
+    def test_saved_network_routes_like_the_built_one(self):
+        store = RoadNetworkStore(self.path)
+
+        self.assertEqual(
+            store.route(*self.coordinates[1], *self.coordinates[16]),
+            self.network.route(*self.coordinates[1], *self.coordinates[16])
+        )
+        self.assertEqual(self.compute_route(store)['source'], 'road_network')
+
+    def test_missing_array_falls_back_to_straight_line(self):
+        os.remove(os.path.join(self.path, 'targets.npy'))
+        store = RoadNetworkStore(self.path)
+
+        with mock.patch('builtins.print'):
+            self.assertIsNone(store.get())
+            route = self.compute_route(store)
+
+        self.assertEqual(route['source'], 'straight_line')
+        self.assertEqual(store.many_to_one([self.coordinates[1]], *self.coordinates[16]), [None])
+
+    def test_corrupt_array_falls_back_to_straight_line(self):
+        with open(os.path.join(self.path, 'offsets.npy'), 'wb') as array_file:
+            array_file.write(b'not a numpy array')
+        store = RoadNetworkStore(self.path)
+
+        with mock.patch('builtins.print'):
+            self.assertIsNone(store.get())
+            self.assertEqual(self.compute_route(store)['source'], 'straight_line')
+
+    def test_missing_network_falls_back_to_straight_line(self):
+        with mock.patch('builtins.print'):
+            self.assertIsNone(RoadNetworkStore(os.path.join(self.path, 'missing')).get())
+        self.assertIsNone(RoadNetworkStore('').route(*self.coordinates[1], *self.coordinates[16]))
+
+
+class EtaMatrixTestsMixin:
+    """calculate_etas against the hand-built grid, with a fresh ETA matrix cache and no travel time model"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.network, _, self.coordinates = grid_road_network()
+        self.network.save(directory.name)
+        self.store = RoadNetworkStore(directory.name)
+        self.cache = TTLCache('eta_matrix', maxsize=100, ttl_seconds=900)
+        for target, replacement in (
+            ('rides.road_network.road_network', self.store),
+            ('rides.travel_times.travel_time_model', TravelTimeModelStore()),
+            ('rides.caching.eta_matrix_cache', self.cache),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class EtaMatrixTests(EtaMatrixTestsMixin, SimpleTestCase):
+    now = datetime(2026, 3, 2, 10, 15, tzinfo=dt_timezone.utc)
+
+    def etas(self, driver_nodes, pickup_node=16, now=None, moved=(0.0, 0.0)):
+        drivers = [self.coordinates[node] for node in driver_nodes]
+        etas = RouteOptimizationService.calculate_etas(
+            *self.coordinates[pickup_node],
+            [latitude + moved[0] for latitude, _ in drivers],
+            [longitude + moved[1] for _, longitude in drivers],
+            now=now or self.now
+        )
+        return list(zip(etas['distance_to_pickup_km'].tolist(), etas['eta_minutes'].tolist()))
+
+    def test_road_etas_come_from_one_backward_search(self):
+        drivers = [1, 6, 11]
+
+        with mock.patch.object(self.store, 'many_to_one', wraps=self.store.many_to_one) as many_to_one:
+            etas = self.etas(drivers)
+
+        many_to_one.assert_called_once()
+        routes = self.network.many_to_one([self.coordinates[node] for node in drivers], *self.coordinates[16])
+        self.assertEqual(etas, [(round(route['meters'] / 1000, 2), round(route['seconds'] / 60)) for route in routes])
+
+    def test_cell_pairs_are_cached_per_time_bucket(self):
+        self.etas([1, 6, 11])
+        cell = settings.ETA_MATRIX_CELL_DEGREES
+        pickup_cell = tuple(round(value / cell) for value in self.coordinates[16])
+        bucket = RouteOptimizationService.time_bucket(self.now, settings.ETA_MATRIX_BUCKET_MINUTES)
+
+        self.assertEqual(self.cache.get(
+            (tuple(round(value / cell) for value in self.coordinates[6]), pickup_cell, bucket)
+        ), self.etas([6])[0])
+        with mock.patch.object(self.store, 'many_to_one') as many_to_one:
+            self.etas([11, 1], now=self.now + timedelta(minutes=30))
+        many_to_one.assert_not_called()
+
+        with mock.patch.object(self.store, 'many_to_one', wraps=self.store.many_to_one) as many_to_one:
+            self.etas([1], now=self.now + timedelta(hours=1))
+        many_to_one.assert_called_once()
+
+    def test_entries_expire_after_the_ttl(self):
+        clock = [1000.0]
+        with mock.patch('rides.caching.time.monotonic', side_effect=lambda: clock[0]):
+            self.etas([1])
+            clock[0] += 899
+            with mock.patch.object(self.store, 'many_to_one') as many_to_one:
+                self.etas([1])
+            many_to_one.assert_not_called()
+
+            clock[0] += 2
+            with mock.patch.object(self.store, 'many_to_one', wraps=self.store.many_to_one) as many_to_one:
+                self.etas([1])
+            many_to_one.assert_called_once()
+        self.assertEqual(self.cache.expirations, 1)
+
+    def test_moving_driver_is_rerouted_once_it_leaves_its_cell(self):
+        first = self.etas([6, 11])
+
+        with mock.patch.object(self.store, 'many_to_one', wraps=self.store.many_to_one) as many_to_one:
+            self.assertEqual(self.etas([6, 11], moved=(0.0004, 0.0)), first)
+        many_to_one.assert_not_called()
+
+        with mock.patch.object(self.store, 'many_to_one', wraps=self.store.many_to_one) as many_to_one:
+            moved = self.etas([6, 11], moved=(0.002, 0.0))
+        self.assertEqual(len(many_to_one.call_args.args[0]), 2)
+        self.assertEqual(moved, self.etas([10, 15]))
+
+    def test_unroutable_drivers_keep_straight_line_estimates(self):
+        etas = self.etas([100])
+        distance = round(float(haversine_km(*self.coordinates[100], *self.coordinates[16])), 2)
+
+        self.assertEqual(etas, [(distance, round(distance * 2))])
+        self.assertEqual(len(self.cache), 1)
+        self.assertIsNone(next(iter(self.cache._entries.values()))[1])
+
+    def test_without_a_road_network_etas_are_straight_line(self):
+        with mock.patch('rides.road_network.road_network', RoadNetworkStore('')):
+            etas = self.etas([1])
+
+        distance = round(float(haversine_km(*self.coordinates[1], *self.coordinates[16])), 2)
+        self.assertEqual(etas, [(distance, round(distance * 2))])
+        self.assertEqual(len(self.cache), 0)
+
+
+class RideMatchingEtaTests(EtaMatrixTestsMixin, RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('rides.spatial_index.driver_index', DriverLocationIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Node 2 is the closest in a straight line but behind one-way streets; node 9 is quicker by road
+        self.behind_one_way = make_driver(1, *self.coordinates[2])
+        self.quicker = make_driver(2, *self.coordinates[9])
+        self.client = APIClient()
+        self.client.force_authenticate(make_user(3))
+
+    def test_drivers_are_ranked_by_road_eta(self):
+        pickup, destination = self.coordinates[1], self.coordinates[16]
+
+        with mock.patch('builtins.print') as print_:
+            response = self.client.post('/api/rides/match-ride/', {
+                'pickup_latitude': pickup[0], 'pickup_longitude': pickup[1], 'pickup_address': 'Node 1',
+                'destination_latitude': destination[0], 'destination_longitude': destination[1],
+                'destination_address': 'Node 16',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['nearby_drivers_count'], 2)
+        self.assertEqual(response.data['nearest_driver_eta_minutes'], 2)
+        notified = [call.args[0].split()[2] for call in print_.call_args_list if call.args[0].startswith('Notifying')]
+        self.assertEqual(notified, [str(self.quicker.id), str(self.behind_one_way.id)])
+
+
+def synthetic_trips():
+    """Trips between two Kathmandu zones: slow on Monday 10:00, fast on Friday 04:00"""
+    rng = random.Random(5)
+    trips = []
+    for hour, speed_kmh in ((10, 20.0), (100, 40.0)):
+        for _ in range(50):
+            road_km = rng.uniform(7.5, 8.5)
+            trips.append((
+                27.700 + rng.uniform(0, 0.005), 85.300 + rng.uniform(0, 0.005),
+                27.750 + rng.uniform(0, 0.005), 85.350 + rng.uniform(0, 0.005),
+                hour, road_km, road_km / 1.25, road_km / speed_kmh * 3600,
+            ))
+    return trips
+
+
+class TravelTimeModelTests(SimpleTestCase):
+    monday_10am = datetime(2026, 3, 2, 10, 0, tzinfo=dt_timezone.utc)
+    friday_4am = datetime(2026, 3, 6, 4, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.model = TravelTimeModel.build(synthetic_trips())
+
+    def speed(self, when, origin=(27.702, 85.302), destination=(27.752, 85.352)):
+        return float(self.model.speeds_kmh(*origin, *destination, when=when))
+
+    def test_hour_of_week(self):
+        self.assertEqual(hour_of_week(self.monday_10am), 10)
+        self.assertEqual(hour_of_week(self.friday_4am), 100)
+
+    def test_learns_speeds_per_zone_pair_and_hour(self):
+        self.assertAlmostEqual(self.speed(self.monday_10am), 20, delta=1)
+        self.assertAlmostEqual(self.speed(self.friday_4am), 40, delta=2)
+        self.assertEqual(self.model.meta['trips'], 100)
+        self.assertAlmostEqual(self.model.detour_factor, 1.25, places=6)
+
+    def test_unseen_trips_fall_back_to_the_hourly_profile(self):
+        outside = (28.2096, 83.9856)  # Pokhara, outside the grid
+
+        self.assertEqual(self.speed(self.monday_10am, origin=outside), self.model.hourly_speeds[10])
+        self.assertLess(self.speed(self.monday_10am, origin=outside), self.speed(self.friday_4am, origin=outside))
+
+    def test_minutes_apply_the_detour_to_straight_lines(self):
+        road = self.model.minutes(27.702, 85.302, 27.752, 85.352, 8.0, when=self.monday_10am)
+        straight = self.model.minutes(27.702, 85.302, 27.752, 85.352, 8.0, when=self.monday_10am, road=False)
+
+        self.assertAlmostEqual(float(road), 8.0 / self.speed(self.monday_10am) * 60, places=4)
+        self.assertAlmostEqual(float(straight), float(road) * 1.25, places=4)
+
+    def test_broken_trips_are_dropped_before_computing_speeds(self):
+        trips = synthetic_trips()
+        good = trips[0]
+        broken = [
+            good[:7] + (0.0,),
+            good[:7] + (-30.0,),
+            good[:7] + (float('nan'),),
+            good[:7] + (float('inf'),),
+            good[:5] + (float('nan'),) + good[6:],
+            good[:4] + (HOURS_PER_WEEK,) + good[5:],
+            good[:5] + (0.0,) + good[6:],  # standing still
+            good[:5] + (500.0,) + good[6:],  # faster than any car
+        ]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            model = TravelTimeModel.build(trips + broken)
+
+        self.assertEqual(model.meta['trips'], 100)
+        self.assertTrue(np.isfinite(model.speeds).all())
+        np.testing.assert_allclose(model.speeds, self.model.speeds, rtol=1e-6)
+
+    def test_needs_usable_trips(self):
+        with self.assertRaises(ValueError):
+            TravelTimeModel.build([])
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            with self.assertRaises(ValueError):
+                TravelTimeModel.build([synthetic_trips()[0][:7] + (0.0,)])
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'models', 'travel_times.npz')
+            self.model.save(path)
+            loaded = TravelTimeModel.load(path)
+
+        self.assertEqual(loaded.meta, self.model.meta)
+        self.assertEqual(loaded.version, self.model.version)
+        np.testing.assert_array_equal(loaded.speeds, self.model.speeds)
+        np.testing.assert_array_equal(loaded.counts, self.model.counts)
+        self.assertEqual(self.speed(self.friday_4am), float(loaded.speeds_kmh(
+            27.702, 85.302, 27.752, 85.352, when=self.friday_4am
+        )))
+
+
+class TravelTimeModelStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'travel_times.npz')
+
+    def test_without_a_model_callers_keep_fixed_speeds(self):
+        for store in (TravelTimeModelStore(), TravelTimeModelStore(self.path)):
+            self.assertIsNone(store.get())
+            self.assertIsNone(store.minutes(27.702, 85.302, 27.752, 85.352, 8.0))
+
+    def test_corrupt_file_falls_back(self):
+        with open(self.path, 'wb') as model_file:
+            model_file.write(b'not an npz file')
+        store = TravelTimeModelStore(self.path)
+
+        with mock.patch('builtins.print') as print_:
+            self.assertIsNone(store.get())
+
+        print_.assert_called_once()
+
+    def test_loads_the_saved_model_and_reloads_it_when_rebuilt(self):
+        TravelTimeModel.build(synthetic_trips()).save(self.path)
+        store = TravelTimeModelStore(self.path, check_seconds=0)
+
+        first = store.get()
+        self.assertIsNotNone(first)
+        self.assertIs(store.get(), first)
+        self.assertIsNotNone(store.minutes(27.702, 85.302, 27.752, 85.352, 8.0))
+
+        TravelTimeModel.build(synthetic_trips()[:50]).save(self.path)
+        modified = os.path.getmtime(self.path) + 10
+        os.utime(self.path, (modified, modified))
+
+        self.assertIsNot(store.get(), first)
+        self.assertEqual(store.get().meta['trips'], 50)
+
+        os.remove(self.path)
+        self.assertIsNone(store.get())
+
+
+class VectorizedFareTests(EtaMatrixTestsMixin, RideshareTestCase):
+    """calculate_fares must price every trip exactly like calculate_fare"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('rides.caching.route_cache', TTLCache('routes', maxsize=1000, ttl_seconds=900))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rng = random.Random(7)
+        # Trips across the grid, plus some that start or end off it
+        self.trips = [
+            (
+                round(rng.uniform(27.699, 27.707), 6), round(rng.uniform(85.299, 85.307), 6),
+                round(rng.uniform(27.699, 27.707) + (0.05 if i % 5 == 0 else 0), 6),
+                round(rng.uniform(85.299, 85.307), 6),
+            )
+            for i in range(20)
+        ]
+        self.ride_types = [rng.choice(['standard', 'premium', 'luxury', 'shared']) for _ in self.trips]
+        self.surges = [rng.choice([1.0, 1.2, 1.5, 2.0]) for _ in self.trips]
+
+    def assert_parity(self, when):
+        fares = FareCalculationService.calculate_fares(
+            *zip(*self.trips), ride_types=self.ride_types, time_of_day=when, surge_multipliers=self.surges
+        )
+
+        self.assertEqual(len(fares), len(self.trips))
+        for trip, ride_type, surge, fare in zip(self.trips, self.ride_types, self.surges, fares):
+            self.assertEqual(
+                fare,
+                FareCalculationService.calculate_fare(
+                    *trip, ride_type=ride_type, time_of_day=when, surge_multiplier=surge
+                ),
+                (trip, ride_type, surge)
+            )
+
+    def test_parity_on_straight_lines(self):
+        with mock.patch('rides.road_network.road_network', RoadNetworkStore('')):
+            for hour in (3, 8, 13, 18, 23):
+                self.assert_parity(datetime(2026, 3, 2, hour, 0, tzinfo=dt_timezone.utc))
+
+    def test_parity_on_road_routes(self):
+        road = FareCalculationService.calculate_trip_distances(*zip(*self.trips))
+        straight = FareCalculationService.calculate_distances(*(np.array(axis) for axis in zip(*self.trips)))
+        self.assertTrue((road != straight).any())
+        self.assertTrue((road == straight).any())  # trips leaving the grid
+
+        for hour in (3, 8, 13, 18, 23):
+            self.assert_parity(datetime(2026, 3, 2, hour, 0, tzinfo=dt_timezone.utc))
+
+    def test_parity_with_a_travel_time_model(self):
+        model = TravelTimeModel.build(synthetic_trips())
+        with mock.patch('rides.travel_times.travel_time_model.get', return_value=model):
+            self.assert_parity(datetime(2026, 3, 2, 10, 0, tzinfo=dt_timezone.utc))
+            self.assert_parity(datetime(2026, 3, 6, 4, 0, tzinfo=dt_timezone.utc))
+
+    def test_without_a_time_prices_at_the_default_rates(self):
+        self.assert_parity(None)
+
+
+def place(name, kind, latitude, longitude, importance=0):
+    return {'name': name, 'kind': kind, 'latitude': latitude, 'longitude': longitude, 'importance': importance}
+
+
+class PlaceIndexTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = PlaceIndex([
+            place('Kathmandu', 'city', 27.7172, 85.3240, 100),
+            place('Thamel', 'suburb', 27.7154, 85.3123, 60),
+            place('Chandragiri Hills', 'attraction', 27.6720, 85.2100, 15),
+            place('Thamel Chowk', 'street', 27.7150, 85.3110, 20),
+            place('Naxal Ch', 'street', 27.7160, 85.3290, 10),
+            place('Station Road', 'street', 27.7000, 85.3100, 20),
+            place('Freak St', 'street', 27.7030, 85.3070, 10),
+            place('Ring Rd', 'primary', 27.7350, 85.3300, 30),
+        ])
+
+    def names(self, query, limit=10):
+        return [found['name'] for found, _ in self.index.search(query, limit)]
+
+    def test_abbreviations_expand_when_indexing(self):
+        self.assertEqual(self.names('chowk'), ['Thamel Chowk', 'Naxal Ch'])
+        self.assertEqual(self.names('street'), ['Freak St'])
+
+    def test_last_term_prefix_matches_as_typed(self):
+        # "ch" is also a whole "chowk", so those rank as exact matches
+        self.assertEqual(self.names('ch'), ['Thamel Chowk', 'Naxal Ch', 'Chandragiri Hills'])
+        self.assertEqual(self.names('st'), ['Freak St', 'Station Road'])
+        self.assertEqual(self.names('thamel ch'), ['Thamel Chowk'])
+
+    def test_last_term_also_matches_its_expansion(self):
+        self.assertEqual(self.names('ring rd'), ['Ring Rd'])
+        self.assertEqual(self.index.search('ring rd')[0][1], True)
+
+    def test_complete_terms_are_expanded(self):
+        self.assertEqual(self.names('ch '), ['Thamel Chowk', 'Naxal Ch'])
+        self.assertEqual(self.names('st thamel'), [])
+        self.assertEqual(self.names('st, freak'), ['Freak St'])
+
+    def test_query_terms(self):
+        self.assertEqual(query_terms('Thamel ch'), [('thamel',), ('ch', 'chowk')])
+        self.assertEqual(query_terms('Thamel ch '), [('thamel',), ('chowk',)])
+        self.assertEqual(query_terms('ch thamel'), [('chowk',), ('thamel',)])
+        self.assertEqual(query_terms('  '), [])
+
+    def test_whole_words_rank_before_prefixes(self):
+        found = self.index.search('thamel')
+
+        self.assertEqual([(result['name'], exact) for result, exact in found], [('Thamel', True), ('Thamel Chowk', True)])
+        self.assertEqual(self.index.search('tham')[0][1], False)
+
+    def test_typos_fall_back_to_similar_words(self):
+        self.assertEqual(self.names('chandragri'), ['Chandragiri Hills'])
+        self.assertEqual(self.names('qqqqqq'), [])
+
+    def test_reverse_nearest(self):
+        distance, found = self.index.nearest(27.7153, 85.3112, 0.5)
+
+        self.assertEqual(found['name'], 'Thamel Chowk')
+        self.assertLess(distance, 0.05)
+        self.assertIsNone(self.index.nearest(28.2, 83.98, 0.5))
+        self.assertEqual(self.index.describe(found), 'Thamel Chowk, Thamel, Kathmandu')
+
+
+class ReverseGeocodeCacheTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'gazetteer.csv')
+        write_gazetteer([
+            place('Kathmandu', 'city', 27.7172, 85.3240, 100),
+            place('Thamel', 'suburb', 27.7154, 85.3123, 60),
+            place('Thamel Chowk', 'street', 27.7150, 85.3110, 20),
+        ], self.path)
+        self.geocoder = Geocoder(self.path)
+        self.cache = TTLCache('reverse_geocode', maxsize=100, ttl_seconds=60)
+        for target, value in (
+            ('rides.geocoding.geocoder', self.geocoder), ('rides.caching.reverse_geocode_cache', self.cache)
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_points_in_one_cell_share_a_cached_address(self):
+        first = LocationService.get_address_from_coordinates(27.71501, 85.31101)
+        first['name'] = 'changed by the caller'
+        second = LocationService.get_address_from_coordinates(27.71502, 85.31102)
+
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+        self.assertEqual(second['name'], 'Thamel Chowk')
+        self.assertEqual(second['formatted_address'], 'Thamel Chowk, Thamel, Kathmandu, Nepal')
+        self.assertEqual(second['source'], 'gazetteer')
+
+        LocationService.get_address_from_coordinates(27.7172, 85.3240)
+        self.assertEqual((self.cache.misses, self.cache.hits), (2, 1))
+
+    def test_points_with_nothing_named_nearby_are_cached_too(self):
+        for _ in range(2):
+            address = LocationService.get_address_from_coordinates(28.2096, 83.9856)
+
+        self.assertEqual(address['source'], 'coordinates')
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+
+    def test_gazetteer_reload_clears_the_cache(self):
+        LocationService.get_address_from_coordinates(27.7150, 85.3110)
+        modified = os.path.getmtime(self.path) + 10
+        os.utime(self.path, (modified, modified))
+
+        self.geocoder.refresh()
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lookups_never_warm_the_cache(self):
+        with mock.patch('rides.geocoding.warm_reverse_cache') as warm_reverse_cache:
+            LocationService.get_address_from_coordinates(27.7150, 85.3110)
+
+        warm_reverse_cache.assert_not_called()
+
+    @override_settings(REVERSE_GEOCODE_WARMUP_RIDES=100, REVERSE_GEOCODE_WARMUP_MIN_RIDERS=3)
+    def test_warm_caches_recent_ride_endpoints(self):
+        pickup = (Decimal('27.715000'), Decimal('85.311000'))
+        Ride.objects.bulk_create([
+            Ride(
+                rider=make_user(number), fare=Decimal('150.00'),
+                pickup_address='Thamel Chowk Gate' if number < 4 else f'My flat {number}',
+                pickup_latitude=pickup[0], pickup_longitude=pickup[1],
+                destination_address='Somewhere', destination_latitude=Decimal('28.2096'),
+                destination_longitude=Decimal('83.9856'),
+            )
+            for number in range(1, 6)
+        ])
+
+        self.geocoder.warm()
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get(reverse_cache_key(*pickup))['formatted_address'], 'Thamel Chowk Gate')
+        address = LocationService.get_address_from_coordinates(*pickup)
+        self.assertEqual(address['source'], 'ride_history')
+        self.assertEqual(self.cache.misses, 0)
+
+    @override_settings(REVERSE_GEOCODE_WARMUP_RIDES=100)
+    def test_warm_runs_once_per_loaded_gazetteer(self):
+        with mock.patch('rides.geocoding.warm_reverse_cache') as warm_reverse_cache:
+            Geocoder('').warm()
+            warm_reverse_cache.assert_not_called()
+
+            self.geocoder.warm()
+            self.geocoder.warm()
+            self.assertEqual(warm_reverse_cache.call_count, 1)
+
+            modified = os.path.getmtime(self.path) + 10
+            os.utime(self.path, (modified, modified))
+            self.geocoder.refresh()
+            self.geocoder.warm()
+            self.assertEqual(warm_reverse_cache.call_count, 2)
+
+
+def websocket_exchange(path, messages, subprotocols=None):
+    """Connect to a consumer, send each message (dicts as JSON, bytes as binary frames) and collect the replies
+
+    Returns (accepted, replies, still open after the last message).
+    """
+    async def run():
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path, subprotocols=subprotocols)
+        accepted, _ = await communicator.connect()
+        replies = []
+        if accepted:
+            for message in messages:
+                if isinstance(message, bytes):
+                    await communicator.send_to(bytes_data=message)
+                else:
+                    await communicator.send_json_to(message)
+                while not await communicator.receive_nothing(0.05):
+                    replies.append(await communicator.receive_output())
+        still_open = accepted and all(reply['type'] == 'websocket.send' for reply in replies)
+        await communicator.disconnect()
+        return accepted, replies, still_open
+
+    return async_to_sync(run)()
+
+
+class DriverConsumerTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver(1, '27.7172', '85.3240')
+        self.buffer = DriverLocationBuffer(flush_seconds=3600)
+        self.addCleanup(self.buffer.shutdown)
+        patcher = mock.patch('rides.consumers.driver_location_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = f'/ws/driver/{self.driver.id}/'
+
+    def test_location_updates_are_buffered(self):
+        accepted, replies, still_open = websocket_exchange(
+            self.path, [{'type': 'location_update', 'latitude': 27.72, 'longitude': 85.33}]
+        )
+
+        self.assertTrue(accepted and still_open)
+        self.assertEqual(replies, [])
+        self.assertEqual(self.buffer.latest(self.driver.id)[:2], (Decimal('27.72'), Decimal('85.33')))
+
+    def test_malformed_location_gets_an_error_and_keeps_the_socket(self):
+        accepted, replies, still_open = websocket_exchange(self.path, [
+            {'type': 'location_update', 'latitude': 'north', 'longitude': 85.33},
+            {'type': 'location_update', 'latitude': 27.72, 'longitude': [85.33]},
+            {'type': 'location_update', 'latitude': 27.72, 'longitude': 85.33},
+        ])
+
+        self.assertTrue(accepted and still_open)
+        self.assertEqual(len(replies), 2)
+        for reply in replies:
+            self.assertEqual(json_codec.loads(reply['text'])['type'], 'error')
+        self.assertEqual(self.buffer.latest(self.driver.id)[:2], (Decimal('27.72'), Decimal('85.33')))
+
+    def test_non_finite_and_out_of_range_locations_are_rejected(self):
+        out_of_range = ws_protocol._LOCATION.pack(ws_protocol.LOCATION_FRAME, 95_000_000, 85_300_000, 0, 0)
+
+        accepted, replies, still_open = websocket_exchange(self.path, [
+            {'type': 'location_update', 'latitude': 'NaN', 'longitude': 85.33},
+            {'type': 'location_update', 'latitude': 27.72, 'longitude': 'Infinity'},
+            {'type': 'location_update', 'latitude': 91, 'longitude': 85.33},
+            out_of_range,
+        ])
+
+        self.assertTrue(accepted and still_open)
+        self.assertEqual(len(replies), 3)  # the binary frame is dropped silently like any malformed frame
+        self.assertIsNone(self.buffer.latest(self.driver.id))
+
+    def test_binary_location_frames_are_buffered(self):
+        frame = ws_protocol.encode_location(27.72, 85.33, 0, timezone.now())
+
+        accepted, _, still_open = websocket_exchange(self.path, [frame], [ws_protocol.BINARY_SUBPROTOCOL])
+
+        self.assertTrue(accepted and still_open)
+        self.assertEqual(self.buffer.latest(self.driver.id)[:2], (Decimal('27.72'), Decimal('85.33')))
+
+
+class RideConsumerTests(RideshareTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ride = Ride.objects.create(
+            rider=make_user(1), fare=Decimal('150.00'),
+            pickup_address='Thamel', pickup_latitude=Decimal('27.715'), pickup_longitude=Decimal('85.312'),
+            destination_address='Patan', destination_latitude=Decimal('27.673'), destination_longitude=Decimal('85.325'),
+        )
+        self.buffer = RideLocationBuffer(flush_seconds=3600)
+        self.addCleanup(self.buffer.shutdown)
+        patcher = mock.patch('rides.consumers.ride_location_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_invalid_locations_are_neither_saved_nor_broadcast(self):
+        accepted, replies, still_open = websocket_exchange(f'/ws/ride/{self.ride.id}/', [
+            {'type': 'location_update', 'latitude': 'NaN', 'longitude': 85.33},
+            {'type': 'location_update', 'latitude': 27.72, 'longitude': 185},
+        ])
+
+        self.assertTrue(accepted and still_open)
+        self.assertEqual([json_codec.loads(reply['text'])['type'] for reply in replies], ['error', 'error'])
+        self.assertEqual(self.buffer.pending_count(self.ride.id), 0)
+
+    def test_ride_changed_refreshes_the_cached_ride(self):
+        patcher = mock.patch('rides.consumers.ride_location_broadcaster', RideLocationBroadcaster({'completed': 0}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        location = {'type': 'location_update', 'latitude': 27.72, 'longitude': 85.33}
+
+        def complete_ride():
+            with self.captureOnCommitCallbacks(execute=True):
+                Ride.objects.get(id=self.ride.id).complete_ride()
+
+        async def run():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/ride/{self.ride.id}/')
+            await communicator.connect()
+            await communicator.send_json_to(location)
+            before = await communicator.receive_json_from()
+            await database_sync_to_async(complete_ride)()
+            await communicator.send_json_to(location)
+            after = await communicator.receive_nothing(0.1)
+            await communicator.disconnect()
+            return before, after
+
+        before, nothing_after = async_to_sync(run)()
+
+        # Completed rides are not broadcast, which the socket only knows from the ride_changed event
+        self.assertEqual(before['type'], 'location_update')
+        self.assertTrue(nothing_after)
+
+
+class SocketCacheEventTests(RideshareTestCase):
+    """Saves of rides and drivers refresh the copies cached by their open sockets"""
+
+    def setUp(self):
+        super().setUp()
+        self.driver = make_driver(1, '27.7172', '85.3240')
+        self.ride = Ride.objects.create(
+            rider=make_user(2), fare=Decimal('150.00'),
+            pickup_address='Thamel', pickup_latitude=Decimal('27.715'), pickup_longitude=Decimal('85.312'),
+            destination_address='Patan', destination_latitude=Decimal('27.673'), destination_longitude=Decimal('85.325'),
+        )
+
+    def group_events(self, group, save):
+        """Events the group receives while `save` runs and its transaction commits"""
+        def save_and_commit():
+            with self.captureOnCommitCallbacks(execute=True):
+                save()
+
+        async def run():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add(group, channel)
+            await database_sync_to_async(save_and_commit)()
+            events = []
+            while True:
+                try:
+                    events.append(await asyncio.wait_for(layer.receive(channel), 0.05))
+                except asyncio.TimeoutError:
+                    return events
+
+        return async_to_sync(run)()
+
+    def test_ride_status_changes_are_sent_to_the_ride_group(self):
+        events = self.group_events(f'ride_{self.ride.id}', lambda: self.ride.accept_ride(self.driver))
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['type'], 'ride_changed')
+        self.assertEqual((events[0]['status'], events[0]['driver_id']), ('accepted', self.driver.id))
+
+    def test_saves_of_uncached_ride_fields_send_nothing(self):
+        def save():
+            self.ride.rider_notes = 'Blue gate'
+            self.ride.save(update_fields=['rider_notes'])
+
+        self.assertEqual(self.group_events(f'ride_{self.ride.id}', save), [])
+
+    def test_driver_availability_changes_are_sent_to_the_driver_group(self):
+        def save():
+            self.driver.is_available = False
+            self.driver.save(update_fields=['is_available', 'updated_at'])
+
+        events = self.group_events(f'driver_{self.driver.id}', save)
+
+        self.assertEqual(events, [{'type': 'driver_changed', 'is_available': False, 'is_verified': False}])
+
+    def test_saves_of_uncached_driver_fields_send_nothing(self):
+        def save():
+            self.driver.current_latitude = Decimal('27.72')
+            self.driver.save(update_fields=['current_latitude'])
+
+        self.assertEqual(self.group_events(f'driver_{self.driver.id}', save), [])
+
+    def test_consumers_apply_the_events_to_their_cached_copies(self):
+        ride_consumer = RideConsumer()
+        ride_consumer.ride = Ride.objects.get(id=self.ride.id)
+        ride_consumer.ride_group_name = f'ride_{self.ride.id}'
+        self.ride.accept_ride(self.driver)
+        self.ride.start_ride()
+        driver_consumer = DriverConsumer()
+        driver_consumer.driver = Driver.objects.get(id=self.driver.id)
+
+        async_to_sync(ride_consumer.ride_changed)(ride_changed_event(self.ride))
+        self.driver.is_verified = True
+        async_to_sync(driver_consumer.driver_changed)(driver_changed_event(self.driver))
+
+        self.assertEqual(ride_consumer.ride.status, 'in_progress')
+        self.assertEqual(ride_consumer.ride.driver_id, self.driver.id)
+        self.assertEqual(ride_consumer.ride.started_at, self.ride.started_at)
+        self.assertIsNone(ride_consumer.ride.completed_at)
+        self.assertTrue(driver_consumer.driver.is_verified)
+
+
+class JsonCodecTests(SimpleTestCase):
+    """The fast codec writes and reads the same JSON as DRF's JSONRenderer and JSONParser"""
+
+    payload = {
+        'requested_at': datetime(2026, 1, 2, 3, 4, 5, 678912, tzinfo=dt_timezone.utc),
+        'scheduled_for': datetime(2026, 1, 2, 8, 49, 5, tzinfo=dt_timezone(timedelta(hours=5, minutes=45))),
+        'fare': Decimal('150.50'),
+        'ride_id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'pickup_address': 'ठमेल\u2028',
+        'u64': 2 ** 64 - 1,
+        'wide': 2 ** 64,
+        'negative_wide': -2 ** 70,
+    }
+
+    def render(self, renderer_class, data):
+        return renderer_class().render(data, 'application/json', {})
+
+    def parse(self, parser_class, body):
+        return parser_class().parse(io.BytesIO(body), 'application/json', {})
+
+    def test_renders_like_drf(self):
+        body = self.render(json_codec.FastJSONRenderer, self.payload)
+
+        self.assertEqual(body, self.render(JSONRenderer, self.payload))
+        self.assertIn(b'"requested_at":"2026-01-02T03:04:05.678912Z"', body)
+        self.assertIn(b'"scheduled_for":"2026-01-02T08:49:05+05:45"', body)
+        self.assertIn(b'"fare":150.5', body)
+        self.assertIn(b'"ride_id":"12345678-1234-5678-1234-567812345678"', body)
+
+    def test_parses_like_drf(self):
+        body = self.render(JSONRenderer, self.payload)
+
+        parsed = self.parse(json_codec.FastJSONParser, body)
+
+        self.assertEqual(parsed, self.parse(JSONParser, body))
+        self.assertEqual(parsed['wide'], 2 ** 64)
+        self.assertIsInstance(parsed['negative_wide'], int)
+
+    def test_integers_wider_than_64_bits_use_the_standard_library(self):
+        if json_codec.orjson is None:
+            self.skipTest('orjson is not installed')
+
+        with self.assertRaises(TypeError):
+            json_codec.orjson.dumps(2 ** 64)
+
+        self.assertEqual(json_codec.dumps({'wide': 2 ** 64}), b'{"wide":18446744073709551616}')
+        self.assertEqual(json_codec.loads('{"wide":18446744073709551616}'), {'wide': 2 ** 64})
+
+    def test_unserializable_values_still_raise_type_error(self):
+        with self.assertRaises(TypeError):
+            json_codec.dumps({'value': object()})
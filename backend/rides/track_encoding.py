@@ -0,0 +1,127 @@
+"""Compact binary encoding of ride GPS tracks
+
+A track is stored as a version byte followed by unsigned LEB128 varints:
+
+    point count
+    timestamp of the first point (zigzag, milliseconds since the epoch)
+    per point:
+        latitude delta   (zigzag, micro-degrees)
+        longitude delta  (zigzag, micro-degrees)
+        time delta       (zigzag, milliseconds)
+        speed            (0 when unknown, otherwise zigzag(centi-km/h) + 1)
+
+Coordinates use the same 6 decimal places as RideLocation, so decoding is
+lossless. Consecutive GPS points are close together, which keeps most
+deltas to one or two bytes.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+FORMAT_VERSION = 1
+COORDINATE_SCALE = 10 ** 6
+SPEED_SCALE = 100
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+TrackPoint = namedtuple('TrackPoint', ['latitude', 'longitude', 'timestamp', 'speed'])
+
+
+class TrackDecodeError(ValueError):
+    pass
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _scaled(value, scale):
+    return int((Decimal(str(value)) * scale).to_integral_value())
+
+
+def _epoch_ms(timestamp):
+    delta = timestamp - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def encode_track(points):
+    """Encode (latitude, longitude, timestamp, speed) points, ordered by time, into bytes"""
+    points = list(points)
+    out = bytearray([FORMAT_VERSION])
+    _write_varint(out, len(points))
+    if not points:
+        return bytes(out)
+
+    previous_time = _epoch_ms(points[0][2])
+    _write_varint(out, _zigzag(previous_time))
+    previous_lat = previous_lng = 0
+
+    for latitude, longitude, timestamp, speed in points:
+        lat = _scaled(latitude, COORDINATE_SCALE)
+        lng = _scaled(longitude, COORDINATE_SCALE)
+        time_ms = _epoch_ms(timestamp)
+
+        _write_varint(out, _zigzag(lat - previous_lat))
+        _write_varint(out, _zigzag(lng - previous_lng))
+        _write_varint(out, _zigzag(time_ms - previous_time))
+        _write_varint(out, 0 if speed is None else _zigzag(_scaled(speed, SPEED_SCALE)) + 1)
+
+        previous_lat, previous_lng, previous_time = lat, lng, time_ms
+
+    return bytes(out)
+
+
+def _read_varints(data):
+    """All varints of a payload as a list of unsigned ints"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise TrackDecodeError("Truncated track data")
+    return values
+
+
+def decode_track(data):
+    """Decode bytes produced by encode_track into a list of TrackPoint"""
+    data = bytes(data)
+    if not data or data[0] != FORMAT_VERSION:
+        raise TrackDecodeError("Unsupported track format")
+
+    values = _read_varints(data[1:])
+    count = values[0] if values else 0
+    if not count:
+        return []
+    if len(values) != 2 + 4 * count:
+        raise TrackDecodeError("Track data does not match its point count")
+
+    time_ms = _unzigzag(values[1])
+    lat = lng = 0
+    points = []
+    for i in range(2, len(values), 4):
+        lat += _unzigzag(values[i])
+        lng += _unzigzag(values[i + 1])
+        time_ms += _unzigzag(values[i + 2])
+        speed = values[i + 3]
+        points.append(TrackPoint(
+            Decimal(lat).scaleb(-6),
+            Decimal(lng).scaleb(-6),
+            EPOCH + timedelta(milliseconds=time_ms),
+            Decimal(_unzigzag(speed - 1)).scaleb(-2) if speed else None,
+        ))
+    return points
@@ -0,0 +1,92 @@
+"""Douglas-Peucker simplification of ride tracks for map display
+
+Tracks are simplified in a local equirectangular projection (meters), which
+is accurate at ride scale. Each zoom level uses a tolerance of one map pixel,
+so the simplified line is indistinguishable from the full track at that zoom.
+"""
+import math
+
+import numpy as np
+
+from .spatial_index import EARTH_RADIUS_KM
+
+# Zoom levels precomputed for completed tracks; deeper zooms get the full track
+ZOOM_LEVELS = (10, 12, 14, 16)
+MAX_ZOOM = 22
+
+# Ground resolution of a 256px web-mercator tile pixel at zoom 0 on the equator
+METERS_PER_PIXEL_ZOOM_0 = 156543.03
+
+
+def zoom_tolerance_m(zoom, latitude=0.0):
+    """Size of one map pixel in meters at the given zoom level and latitude"""
+    return METERS_PER_PIXEL_ZOOM_0 * math.cos(math.radians(float(latitude))) / (2 ** zoom)
+
+
+def _project(latitudes, longitudes):
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    meters = EARTH_RADIUS_KM * 1000
+    x = longitudes * math.cos(float(latitudes.mean())) * meters
+    y = latitudes * meters
+    return x, y
+
+
+def _segment_distances(x, y, x1, y1, x2, y2):
+    """Distances from points to the segment (x1, y1)-(x2, y2)"""
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        # Closed loop (e.g. a return trip): measure from the shared endpoint
+        return np.hypot(x - x1, y - y1)
+    t = np.clip(((x - x1) * dx + (y - y1) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def douglas_peucker(latitudes, longitudes, tolerance_m):
+    """Indices of the points kept by Douglas-Peucker at the given tolerance in meters"""
+    count = len(latitudes)
+    if count < 3:
+        return list(range(count))
+
+    x, y = _project(latitudes, longitudes)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(
+            x[first + 1:last], y[first + 1:last], x[first], y[first], x[last], y[last]
+        )
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return np.flatnonzero(keep).tolist()
+
+
+def simplify_levels(points):
+    """Kept point indices per precomputed zoom level, keyed by the zoom as a string (JSON-friendly)"""
+    if not points:
+        return {}
+    latitudes = [float(point[0]) for point in points]
+    longitudes = [float(point[1]) for point in points]
+    reference_latitude = sum(latitudes) / len(latitudes)
+    return {
+        str(zoom): douglas_peucker(latitudes, longitudes, zoom_tolerance_m(zoom, reference_latitude))
+        for zoom in ZOOM_LEVELS
+    }
+
+
+def level_for_zoom(zoom):
+    """Precomputed level serving a zoom: the deepest level not finer than it, None for the full track"""
+    if zoom > ZOOM_LEVELS[-1]:
+        return None
+    candidates = [level for level in ZOOM_LEVELS if level <= zoom]
+    return candidates[-1] if candidates else ZOOM_LEVELS[0]
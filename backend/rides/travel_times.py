@@ -0,0 +1,259 @@
+"""Historical travel-time model learned from completed rides
+
+Completed rides are aggregated into average road speeds per (pickup zone,
+destination zone, hour of week). Zones are a lat/lng grid over the area
+the rides cover. The table is a dense float32 array, so a lookup is one
+index computation. Cells with few rides are shrunk towards their zone
+pair's all-week speed scaled by the city-wide hourly profile, and empty
+cells get the prior outright.
+
+`manage.py build_travel_time_model` rebuilds the table (run it nightly)
+and workers reload the saved .npz when it changes.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .spatial_index import haversine_km
+
+HOURS_PER_WEEK = 168
+
+# Trips outside these bounds are GPS glitches or rides left running
+MIN_TRIP_SECONDS = 60
+MAX_TRIP_SECONDS = 4 * 3600
+MIN_SPEED_KMH = 1.0
+MAX_SPEED_KMH = 100.0
+
+MAX_ZONES_PER_AXIS = 8  # zones are widened to keep the table small: at most 81^2 pairs * 168 hours * 4 bytes = 4.4 MB
+
+
+def hour_of_week(moment):
+    """0-167 for Monday 00:00 - Sunday 23:59 local time"""
+    moment = timezone.localtime(moment)
+    return moment.weekday() * 24 + moment.hour
+
+
+def _shrink(total, count, prior, weight):
+    """Mean of `count` observations summing to `total`, pulled towards `prior` as if seen `weight` times"""
+    return (total + weight * prior) / (count + weight)
+
+
+class TravelTimeModel:
+    """Average road speed lookup by zone pair and hour of week"""
+
+    def __init__(self, speeds, counts, meta):
+        self.speeds = speeds  # (zones, zones, 168) km/h
+        self.counts = counts  # (zones, zones, 168) rides behind each cell, capped at 65535
+        self.meta = meta
+        self.min_latitude = meta['min_latitude']
+        self.min_longitude = meta['min_longitude']
+        self.zone_degrees = meta['zone_degrees']
+        self.rows = meta['rows']
+        self.cols = meta['cols']
+        self.hourly_speeds = np.asarray(meta['hourly_speeds'], dtype=np.float64)  # outside the grid
+        self.detour_factor = meta['detour_factor']  # road km per straight-line km
+        self.version = meta['built_at']
+
+    def zones(self, latitudes, longitudes):
+        """Zone index per coordinate, -1 outside the grid"""
+        rows = np.floor((np.asarray(latitudes, dtype=np.float64) - self.min_latitude) / self.zone_degrees)
+        cols = np.floor((np.asarray(longitudes, dtype=np.float64) - self.min_longitude) / self.zone_degrees)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        return np.where(inside, rows * self.cols + cols, -1).astype(np.int64)
+
+    def speeds_kmh(self, from_lats, from_lngs, to_lats, to_lngs, when=None):
+        """Expected road speeds for trips starting at `when`; arguments broadcast like haversine_km"""
+        hour = hour_of_week(when or timezone.now())
+        origins, destinations = np.broadcast_arrays(
+            self.zones(from_lats, from_lngs), self.zones(to_lats, to_lngs)
+        )
+        inside = (origins >= 0) & (destinations >= 0)
+        speeds = np.full(origins.shape, self.hourly_speeds[hour])
+        speeds[inside] = self.speeds[origins[inside], destinations[inside], hour]
+        return speeds
+
+    def minutes(self, from_lats, from_lngs, to_lats, to_lngs, distance_km, when=None, road=True):
+        """Expected trip minutes over `distance_km`; straight-line distances (road=False) get the detour factor"""
+        distance_km = np.asarray(distance_km, dtype=np.float64)
+        if not road:
+            distance_km = distance_km * self.detour_factor
+        return distance_km / self.speeds_kmh(from_lats, from_lngs, to_lats, to_lngs, when) * 60
+
+    # Building and persistence
+
+    @classmethod
+    def build(cls, trips, zone_degrees=0.02, prior_weight=5):
+        """Fit the table from (from lat, from lng, to lat, to lng, hour of week, road km, straight km, seconds) tuples"""
+        trips = np.array(trips, dtype=np.float64).reshape(-1, 8)
+        hours, seconds = trips[:, 4], trips[:, 7]
+        # Drop broken rows before dividing, so zero or missing durations never reach the speeds
+        trips = trips[
+            np.isfinite(trips).all(axis=1)
+            & (hours >= 0) & (hours < HOURS_PER_WEEK)
+            & (seconds >= MIN_TRIP_SECONDS) & (seconds <= MAX_TRIP_SECONDS)
+        ]
+        from_lat, from_lng, to_lat, to_lng, hours, road_km, straight_km, seconds = trips.T
+        speeds = road_km / (seconds / 3600)
+        valid = (speeds >= MIN_SPEED_KMH) & (speeds <= MAX_SPEED_KMH)
+        if not valid.any():
+            raise ValueError('No usable completed rides to learn travel times from')
+        from_lat, from_lng, to_lat, to_lng = from_lat[valid], from_lng[valid], to_lat[valid], to_lng[valid]
+        hours, speeds = hours[valid].astype(np.int64), speeds[valid]
+        road_km, straight_km = road_km[valid], straight_km[valid]
+
+        # City-wide speed per hour of week: the prior for every zone pair
+        overall = float(speeds.mean())
+        hourly_total = np.bincount(hours, weights=speeds, minlength=HOURS_PER_WEEK)
+        hourly_count = np.bincount(hours, minlength=HOURS_PER_WEEK)
+        hourly = _shrink(hourly_total, hourly_count, overall, prior_weight)
+
+        # Grid over the bulk of the rides; outliers (intercity trips) only feed the hourly profile
+        latitudes = np.concatenate([from_lat, to_lat])
+        longitudes = np.concatenate([from_lng, to_lng])
+        min_latitude, max_latitude = np.percentile(latitudes, [1, 99])
+        min_longitude, max_longitude = np.percentile(longitudes, [1, 99])
+        span = max(max_latitude - min_latitude, max_longitude - min_longitude)
+        zone_degrees = max(zone_degrees, span / MAX_ZONES_PER_AXIS)
+        rows = int((max_latitude - min_latitude) // zone_degrees) + 1
+        cols = int((max_longitude - min_longitude) // zone_degrees) + 1
+        meta = {
+            'min_latitude': float(min_latitude),
+            'min_longitude': float(min_longitude),
+            'zone_degrees': float(zone_degrees),
+            'rows': rows,
+            'cols': cols,
+            'hourly_speeds': hourly.tolist(),
+            'detour_factor': 1.3,
+            'trips': int(valid.sum()),
+            'built_at': timezone.now().isoformat(),
+        }
+        model = cls(None, None, meta)
+        zones = rows * cols
+
+        origins, destinations = model.zones(from_lat, from_lng), model.zones(to_lat, to_lng)
+        inside = (origins >= 0) & (destinations >= 0)
+        pairs = origins[inside] * zones + destinations[inside]
+        pair_speeds, pair_hours = speeds[inside], hours[inside]
+
+        pair_total = np.bincount(pairs, weights=pair_speeds, minlength=zones * zones)
+        pair_count = np.bincount(pairs, minlength=zones * zones)
+        pair_speed = _shrink(pair_total, pair_count, overall, prior_weight)
+
+        cells = pairs * HOURS_PER_WEEK + pair_hours
+        cell_total = np.bincount(cells, weights=pair_speeds, minlength=zones * zones * HOURS_PER_WEEK)
+        cell_count = np.bincount(cells, minlength=zones * zones * HOURS_PER_WEEK)
+        prior = pair_speed[:, None] * (hourly / overall)[None, :]
+        cell_speed = _shrink(
+            cell_total.reshape(-1, HOURS_PER_WEEK), cell_count.reshape(-1, HOURS_PER_WEEK), prior, prior_weight
+        )
+
+        longer = straight_km > 0.5  # detours on very short hops are mostly GPS noise
+        if longer.any():
+            meta['detour_factor'] = float(np.clip(np.median(road_km[longer] / straight_km[longer]), 1.0, 2.5))
+
+        model.speeds = cell_speed.reshape(zones, zones, HOURS_PER_WEEK).astype(np.float32)
+        model.counts = np.minimum(cell_count, 65535).reshape(zones, zones, HOURS_PER_WEEK).astype(np.uint16)
+        model.detour_factor = meta['detour_factor']
+        return model
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f'{path}.tmp.npz'
+        np.savez_compressed(
+            temporary, speeds=self.speeds, counts=self.counts, meta=np.array(json.dumps(self.meta))
+        )
+        os.replace(temporary, path)  # readers never see a half-written file
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['speeds'], data['counts'], json.loads(str(data['meta'])))
+
+
+def collect_trips(since=None):
+    """Trip tuples for TravelTimeModel.build from completed rides, using GPS tracks for road distance"""
+    from .models import Ride
+
+    rides = Ride.objects.filter(
+        status='completed', started_at__isnull=False, completed_at__isnull=False
+    ).select_related('track').order_by()
+    if since is not None:
+        rides = rides.filter(completed_at__gte=since)
+
+    trips = []
+    for ride in rides.iterator(chunk_size=500):
+        pickup = (float(ride.pickup_latitude), float(ride.pickup_longitude))
+        destination = (float(ride.destination_latitude), float(ride.destination_longitude))
+        straight_km = float(haversine_km(*pickup, *destination))
+        road_km = float(ride.distance) if ride.distance else None
+
+        track = getattr(ride, 'track', None)
+        if track is not None and track.point_count > 1:
+            points = np.array([(point[0], point[1]) for point in track.points()], dtype=np.float64)
+            traced_km = float(haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1]).sum())
+            if traced_km > 0.3:
+                road_km = traced_km
+        if not road_km:
+            continue
+
+        seconds = (ride.completed_at - ride.started_at).total_seconds()
+        trips.append((*pickup, *destination, hour_of_week(ride.started_at), road_km, straight_km, seconds))
+    return trips
+
+
+class TravelTimeModelStore:
+    """Loads the saved model once per process and reloads it when the file changes
+
+    get() returns None until a model has been built; callers then keep
+    their fixed-speed estimates.
+    """
+
+    def __init__(self, path='', check_seconds=300):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._model = None
+        self._mtime = None
+        self._checked_at = None
+
+    def get(self):
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at > self.check_seconds:
+            self.refresh()
+        return self._model
+
+    def refresh(self):
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path) if self.path else None
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                self._model = TravelTimeModel.load(self.path) if mtime is not None else None
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Travel time model unavailable: {e}")
+                self._model = None
+
+    def minutes(self, from_lats, from_lngs, to_lats, to_lngs, distance_km, when=None, road=True):
+        """TravelTimeModel.minutes, None without a model"""
+        model = self.get()
+        if model is None:
+            return None
+        return model.minutes(from_lats, from_lngs, to_lats, to_lngs, distance_km, when, road)
+
+
+travel_time_model = TravelTimeModelStore(
+    path=getattr(settings, 'TRAVEL_TIME_MODEL_PATH', ''),
+    check_seconds=getattr(settings, 'TRAVEL_TIME_MODEL_CHECK_SECONDS', 300),
+)
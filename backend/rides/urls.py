@@ -20,6 +20,7 @@ urlpatterns = [
 
     # Enhanced API endpoints
     path('fare-estimate/', api_views.FareEstimateView.as_view(), name='fare-estimate'),
+    path('fare-estimate/batch/', api_views.FareBatchEstimateView.as_view(), name='fare-estimate-batch'),
     path('nearby-drivers/', api_views.NearbyDriversView.as_view(), name='nearby-drivers'),
     path('match-ride/', api_views.RideMatchingView.as_view(), name='match-ride'),
     path('geocode/', api_views.GeocodeView.as_view(), name='geocode'),
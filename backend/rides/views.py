@@ -7,7 +7,8 @@ from django.utils import timezone
 from datetime import timedelta
 import json
 
-from .models import Ride, RideRequest, FavoriteLocation, RideTemplate, ScheduledRide, SmartSuggestion
+from .models import Ride, RideRequest, FavoriteLocation, RideTemplate, ScheduledRide, ScheduledRideOccurrence, SmartSuggestion
+from .services import LocationService
 from .serializers import (
     RideSerializer, RideRequestSerializer, RideUpdateSerializer,
     RideRatingSerializer, RideLocationUpdateSerializer,
@@ -85,6 +86,7 @@ class RideRequestViewSet(viewsets.ModelViewSet):
             # Set driver as unavailable
             driver.is_available = False
             driver.save()
+            LocationService.driver_changed(driver)
             
             return Response(RideSerializer(ride).data, status=status.HTTP_201_CREATED)
             
@@ -152,6 +154,7 @@ class RideViewSet(viewsets.ModelViewSet):
         # Make driver available again
         ride.driver.is_available = True
         ride.driver.save()
+        LocationService.driver_changed(ride.driver)
         
         return Response(RideSerializer(ride).data)
     
@@ -190,6 +193,7 @@ class RideViewSet(viewsets.ModelViewSet):
             if ride.driver:
                 ride.driver.is_available = True
                 ride.driver.save()
+                LocationService.driver_changed(ride.driver)
             
             return Response(RideSerializer(ride).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -221,19 +225,48 @@ class RideViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create location record
-        from .models import RideLocation
-        location = RideLocation.objects.create(
-            ride=ride,
-            latitude=latitude,
-            longitude=longitude,
-            speed=speed
-        )
+        # Queue location record; points are persisted in batches
+        from .location_buffer import ride_location_buffer
+        ride_location_buffer.record(ride.id, latitude, longitude, speed)
           # Send real-time update to riders (would use WebSocket in production)
         print(f"Location update for ride {ride.id}: {latitude}, {longitude}")
         
         return Response({'status': 'Location updated successfully'})
 
+    @action(detail=True, methods=['get'])
+    def track(self, request, pk=None):
+        """Recorded GPS track of the ride, optionally simplified with ?zoom= (map zoom) or ?tolerance= (meters)"""
+        ride = self.get_object()
+        
+        from .services import RideTrackService
+        from .track_simplify import MAX_ZOOM
+        
+        try:
+            zoom = request.query_params.get('zoom')
+            zoom = int(zoom) if zoom not in (None, '') else None
+            tolerance = request.query_params.get('tolerance')
+            tolerance = float(tolerance) if tolerance not in (None, '') else None
+        except ValueError:
+            return Response(
+                {'error': 'zoom must be an integer and tolerance a number of meters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (zoom is not None and not 0 <= zoom <= MAX_ZOOM) or (tolerance is not None and not 0 <= tolerance < 1e6):
+            return Response(
+                {'error': f'zoom must be between 0 and {MAX_ZOOM} and tolerance between 0 and 1000000 meters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        points = RideTrackService.get_points(ride, zoom=zoom, tolerance_m=tolerance)
+        
+        return Response({
+            'ride_id': str(ride.id),
+            'zoom': zoom,
+            'tolerance_m': tolerance,
+            'point_count': len(points),
+            'points': RideTrackService.serialize_points(points),
+        })
+
     @action(detail=True, methods=['post'])
     def rate(self, request, pk=None):
         """Rate the ride (rider or driver)"""
@@ -459,26 +492,48 @@ class ScheduledRideViewSet(viewsets.ModelViewSet):
             user=self.request.user
         ).order_by('scheduled_datetime')
     
+    def _occurrence_feed(self, occurrences):
+        """Serialized series, one entry per occurrence, with the occurrence's own time and status"""
+        from rest_framework import serializers
+        
+        format_datetime = serializers.DateTimeField().to_representation
+        results = []
+        for occurrence in occurrences:
+            data = ScheduledRideSerializer(occurrence.scheduled_ride).data
+            data['occurrence_id'] = occurrence.id
+            data['occurrence_datetime'] = format_datetime(occurrence.occurrence_datetime)
+            data['occurrence_status'] = occurrence.status
+            results.append(data)
+        return results
+    
+    def _user_occurrences(self):
+        from .recurrence import occurrence_engine
+        
+        # Series that were never expanded (e.g. created before occurrences existed) are expanded first
+        for scheduled_ride in self.get_queryset().filter(status='scheduled', occurrences_until__isnull=True):
+            occurrence_engine.series_saved(scheduled_ride)
+        
+        return ScheduledRideOccurrence.objects.filter(
+            scheduled_ride__user=self.request.user
+        ).select_related('scheduled_ride__ride_template').order_by('occurrence_datetime')
+    
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
-        """Get upcoming scheduled rides"""
-        upcoming_rides = self.get_queryset().filter(
-            scheduled_datetime__gt=timezone.now(),
+        """Get upcoming scheduled ride occurrences"""
+        upcoming_occurrences = self._user_occurrences().filter(
+            occurrence_datetime__gt=timezone.now(),
             status__in=['scheduled', 'confirmed']
         )
-        serializer = ScheduledRideSerializer(upcoming_rides, many=True)
-        return Response(serializer.data)
+        return Response(self._occurrence_feed(upcoming_occurrences))
     
     @action(detail=False, methods=['get'])
     def due_for_booking(self, request):
-        """Get rides that are due for booking now"""
-        due_rides = []
-        for ride in self.get_queryset().filter(status='scheduled'):
-            if ride.is_due_for_booking():
-                due_rides.append(ride)
-        
-        serializer = ScheduledRideSerializer(due_rides, many=True)
-        return Response(serializer.data)
+        """Get ride occurrences that are due for booking now"""
+        due_occurrences = self._user_occurrences().filter(
+            status='scheduled',
+            booking_at__lte=timezone.now()
+        )
+        return Response(self._occurrence_feed(due_occurrences))
     
     @action(detail=True, methods=['post'])
     def book_now(self, request, pk=None):
@@ -507,9 +562,19 @@ class ScheduledRideViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             ride_request = serializer.save()
             
+            # Book the next pending occurrence; recurring series keep their schedule
+            occurrence = scheduled_ride.occurrences.filter(status='scheduled').first()
+            if occurrence is not None:
+                from .scheduling import scheduled_ride_dispatcher
+                occurrence.status = 'confirmed'
+                occurrence.ride_request = ride_request
+                occurrence.save(update_fields=['status', 'ride_request', 'updated_at'])
+                scheduled_ride_dispatcher.schedule_occurrences([occurrence])
+            
             # Update scheduled ride status
-            scheduled_ride.status = 'confirmed'
-            scheduled_ride.save()
+            if not scheduled_ride.is_recurring:
+                scheduled_ride.status = 'confirmed'
+                scheduled_ride.save()
             
             return Response(RideRequestSerializer(ride_request).data, status=status.HTTP_201_CREATED)
         
@@ -0,0 +1,98 @@
+"""Compact binary WebSocket frames
+
+Clients opt in by offering the `rideshare.binary.v1` subprotocol when they
+connect. location_update and status_update messages are then exchanged as
+binary frames with a fixed little-endian layout. Every other message, and
+every message on connections without the subprotocol, stays a JSON text
+frame.
+
+    location_update  <B i i H q>  19 bytes
+        type 1, latitude and longitude in micro-degrees, speed in 0.1 km/h,
+        timestamp in epoch milliseconds
+    status_update    <B B q>  10 bytes
+        type 2, status code (index into STATUSES), timestamp in epoch milliseconds
+
+Client frames may carry a zero timestamp; the server stamps frames itself.
+"""
+import math
+import struct
+from datetime import datetime, timezone as dt_timezone
+
+BINARY_SUBPROTOCOL = 'rideshare.binary.v1'
+
+LOCATION_FRAME = 1
+STATUS_FRAME = 2
+
+_LOCATION = struct.Struct('<BiiHq')
+_STATUS = struct.Struct('<BBq')
+
+# Append only: the position of a status is its code on the wire
+STATUSES = ('pending', 'accepted', 'in_progress', 'completed', 'cancelled')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+MAX_SPEED = 6553.5  # largest speed the 0.1 km/h field holds
+
+
+def epoch_millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def from_epoch_millis(millis):
+    return datetime.fromtimestamp(millis / 1000, tz=dt_timezone.utc)
+
+
+def coordinates(latitude, longitude):
+    """(latitude, longitude) as floats; raises ValueError for non-numeric, non-finite or out-of-range values"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except TypeError:
+        raise ValueError('Coordinates must be numbers')
+    # NaN fails every comparison, so it is rejected with the out-of-range values
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates out of range')
+    return latitude, longitude
+
+
+def encode_location(latitude, longitude, speed, timestamp):
+    """Binary location_update frame; raises ValueError for non-numeric or out-of-range coordinates"""
+    latitude, longitude = coordinates(latitude, longitude)
+    try:
+        speed = float(speed or 0)
+    except TypeError:
+        raise ValueError('Speed must be a number')
+    speed = 0.0 if math.isnan(speed) else min(max(speed, 0.0), MAX_SPEED)
+    return _LOCATION.pack(
+        LOCATION_FRAME, round(latitude * 1e6), round(longitude * 1e6), round(speed * 10), epoch_millis(timestamp)
+    )
+
+
+def encode_status(status, timestamp):
+    """Binary status_update frame; raises ValueError for statuses without a code"""
+    try:
+        code = STATUS_CODES[status]
+    except KeyError:
+        raise ValueError(f'No binary code for status {status!r}')
+    return _STATUS.pack(STATUS_FRAME, code, epoch_millis(timestamp))
+
+
+def decode(data):
+    """Message dict for a binary frame, shaped like the JSON message; raises ValueError for malformed frames"""
+    if not data:
+        raise ValueError('Empty frame')
+    try:
+        if data[0] == LOCATION_FRAME:
+            _, latitude, longitude, speed, millis = _LOCATION.unpack(data)
+            latitude, longitude = coordinates(latitude / 1e6, longitude / 1e6)
+            return {
+                'type': 'location_update',
+                'latitude': latitude,
+                'longitude': longitude,
+                'speed': speed / 10,
+                'timestamp_ms': millis,
+            }
+        if data[0] == STATUS_FRAME:
+            _, code, millis = _STATUS.unpack(data)
+            return {'type': 'status_update', 'status': STATUSES[code], 'timestamp_ms': millis}
+    except (struct.error, IndexError) as e:
+        raise ValueError(f'Malformed frame: {e}')
+    raise ValueError(f'Unknown frame type {data[0]}')
@@ -13,6 +13,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 import rides.routing
+from rides.background import start_background_workers
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
 
@@ -26,3 +27,5 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+start_background_workers()
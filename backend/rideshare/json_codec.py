@@ -0,0 +1,110 @@
+"""JSON encoding for API responses, request bodies and WebSocket messages
+
+Uses orjson (a declared dependency) and falls back to the standard
+library, logging a warning, when it is missing. Both backends write the
+same JSON as DRF's encoder: Decimal as a number, UUID as a string,
+datetimes in ISO 8601 with `Z` for UTC, plus lazy strings, timedeltas,
+querysets and numpy values. orjson handles UUIDs, datetimes and numpy arrays natively. Every other
+type falls back to DRF's encoder. Integers wider than 64 bits, which
+orjson refuses to write and reads back as floats, go through the
+standard library in both directions.
+
+FastJSONRenderer and FastJSONParser are drop-in replacements for DRF's
+JSONRenderer and JSONParser, configured in REST_FRAMEWORK.
+"""
+import codecs
+import json
+import logging
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    logger.warning("orjson is not installed, encoding JSON with the standard library (pip install -r requirements.txt)")
+    orjson = None
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    # Digits to b'0', everything else to b' ': finds runs of 20 digits (an integer maybe past 2**64)
+    # with a substring search, several times faster than a regex
+    _DIGITS = bytes(0x30 if 0x30 <= b <= 0x39 else 0x20 for b in range(256))
+    _WIDE_INTEGER = b'0' * 20
+
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        try:
+            return orjson.dumps(obj, default=_encoder.default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers wider than 64 bits; unserializable types raise TypeError here too
+            return _encoder.encode(obj).encode()
+
+    def loads(data):
+        """Parse JSON from str or UTF-8 bytes; raises ValueError"""
+        if isinstance(data, str):
+            data = data.encode()
+        if isinstance(data, bytes) and _WIDE_INTEGER in data.translate(_DIGITS):
+            return json.loads(data)
+        return orjson.loads(data)
+else:
+    BACKEND = 'json'
+
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        return _encoder.encode(obj).encode()
+
+    def loads(data):
+        """Parse JSON from str or UTF-8 bytes; raises ValueError"""
+        return json.loads(data)
+
+
+def dumps_text(obj):
+    """Compact JSON str, e.g. for WebSocket text frames"""
+    return dumps(obj).decode()
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer that writes compact responses with the fast codec
+
+    Indented and ASCII-only output still goes through DRF's encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps(data)
+        # Same escaping as DRF: keep the output a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """JSONParser that reads UTF-8 request bodies with the fast codec"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
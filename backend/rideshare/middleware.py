@@ -17,6 +17,7 @@ class RateLimitMiddleware:
         # Rate limits per endpoint (requests per minute)
         self.rate_limits = {
             '/api/rides/fare-estimate/': 30,
+            '/api/rides/fare-estimate/batch/': 10,
             '/api/rides/nearby-drivers/': 20,
             '/api/rides/match-ride/': 5,
             '/api/rides/geocode/': 50,
@@ -115,10 +115,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'rideshare.json_codec.FastJSONRenderer',  # orjson when installed, DRF's encoder otherwise
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'rideshare.json_codec.FastJSONParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
@@ -175,6 +175,78 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Location services
+DRIVER_INDEX_CELL_DEGREES = config('DRIVER_INDEX_CELL_DEGREES', default=0.01, cast=float)  # ~1.1 km grid cells
+DRIVER_INDEX_REFRESH_SECONDS = config('DRIVER_INDEX_REFRESH_SECONDS', default=30, cast=int)  # background reload to pick up changes made by other workers
+PENDING_REQUEST_INDEX_CELL_DEGREES = config('PENDING_REQUEST_INDEX_CELL_DEGREES', default=0.01, cast=float)
+PENDING_REQUEST_INDEX_REFRESH_SECONDS = config('PENDING_REQUEST_INDEX_REFRESH_SECONDS', default=30, cast=int)
+RIDE_REQUEST_EXPIRY_TICK_SECONDS = config('RIDE_REQUEST_EXPIRY_TICK_SECONDS', default=1, cast=int)
+RIDE_REQUEST_EXPIRY_RESEED_SECONDS = config('RIDE_REQUEST_EXPIRY_RESEED_SECONDS', default=60, cast=int)
+SCHEDULED_RIDE_TICK_SECONDS = config('SCHEDULED_RIDE_TICK_SECONDS', default=5, cast=int)
+SCHEDULED_RIDE_LOAD_SECONDS = config('SCHEDULED_RIDE_LOAD_SECONDS', default=60, cast=int)
+SCHEDULED_RIDE_HORIZON_SECONDS = config('SCHEDULED_RIDE_HORIZON_SECONDS', default=3600, cast=int)  # deadlines held in memory
+SCHEDULED_RIDE_REMINDER_MINUTES = config('SCHEDULED_RIDE_REMINDER_MINUTES', default=60, cast=int)
+SCHEDULED_RIDE_OCCURRENCE_HORIZON_DAYS = config('SCHEDULED_RIDE_OCCURRENCE_HORIZON_DAYS', default=14, cast=int)  # recurring rides expanded this far ahead
+DRIVER_LOCATION_FLUSH_SECONDS = config('DRIVER_LOCATION_FLUSH_SECONDS', default=5, cast=int)  # max staleness of Driver rows
+RIDE_LOCATION_FLUSH_SECONDS = config('RIDE_LOCATION_FLUSH_SECONDS', default=5, cast=int)
+RIDE_LOCATION_FLUSH_SIZE = config('RIDE_LOCATION_FLUSH_SIZE', default=20, cast=int)  # points per ride before an early flush
+RIDE_LOCATION_MIN_MOVE_METERS = config('RIDE_LOCATION_MIN_MOVE_METERS', default=10, cast=float)
+RIDE_LOCATION_MAX_GAP_SECONDS = config('RIDE_LOCATION_MAX_GAP_SECONDS', default=30, cast=int)  # keep a point at least this often
+RIDE_LOCATION_IDLE_SECONDS = config('RIDE_LOCATION_IDLE_SECONDS', default=600, cast=int)  # forget rides with no point for this long
+RIDE_LOCATION_BROADCAST_RATES = {  # max location broadcasts per second per ride, by ride status; 0 stops them
+    'accepted': config('RIDE_LOCATION_BROADCAST_RATE_ACCEPTED', default=2.0, cast=float),  # rider watching the car approach
+    'in_progress': config('RIDE_LOCATION_BROADCAST_RATE_IN_PROGRESS', default=1.0, cast=float),
+    'completed': 0,
+    'cancelled': 0,
+}
+RIDE_LOCATION_BROADCAST_DEFAULT_RATE = config('RIDE_LOCATION_BROADCAST_DEFAULT_RATE', default=1.0, cast=float)  # other statuses
+PRESENCE_REDIS_URL = config('PRESENCE_REDIS_URL', default='')  # e.g. redis://127.0.0.1:6379/1; shares presence between workers
+PRESENCE_BACKEND = config('PRESENCE_BACKEND', default='redis' if PRESENCE_REDIS_URL else 'local')  # 'local' for a single process; dispatch then ignores presence
+PRESENCE_TTL_SECONDS = config('PRESENCE_TTL_SECONDS', default=60, cast=int)  # connections expire this long after their last heartbeat
+PRESENCE_SWEEP_SECONDS = config('PRESENCE_SWEEP_SECONDS', default=15, cast=int)
+PRESENCE_REQUIRED_FOR_DISPATCH = config('PRESENCE_REQUIRED_FOR_DISPATCH', default=True, cast=bool)  # only match drivers whose app is connected
+
+# Routing
+ROAD_NETWORK_PATH = config('ROAD_NETWORK_PATH', default=str(BASE_DIR / 'data' / 'road_network'))  # built by manage.py build_road_network
+ROAD_NETWORK_SNAP_METERS = config('ROAD_NETWORK_SNAP_METERS', default=500, cast=float)  # farther from any road falls back to straight lines
+ROUTE_CACHE_CELL_DEGREES = config('ROUTE_CACHE_CELL_DEGREES', default=0.001, cast=float)  # ~110 m; keep equal to FARE_QUOTE_CELL_DEGREES so fare quotes reuse routes
+ROUTE_CACHE_BUCKET_MINUTES = config('ROUTE_CACHE_BUCKET_MINUTES', default=60, cast=int)
+ROUTE_CACHE_SIZE = config('ROUTE_CACHE_SIZE', default=20000, cast=int)  # routes are stored as encoded polylines
+ROUTE_CACHE_TTL_SECONDS = config('ROUTE_CACHE_TTL_SECONDS', default=3600, cast=int)
+ETA_MATRIX_CELL_DEGREES = config('ETA_MATRIX_CELL_DEGREES', default=0.002, cast=float)  # ~220 m; ETAs are shared per driver/pickup cell pair
+ETA_MATRIX_BUCKET_MINUTES = config('ETA_MATRIX_BUCKET_MINUTES', default=60, cast=int)  # time-of-day bucket in the cache key
+ETA_MATRIX_MAX_SECONDS = config('ETA_MATRIX_MAX_SECONDS', default=1800, cast=int)  # search radius in travel time
+ETA_MATRIX_CACHE_SIZE = config('ETA_MATRIX_CACHE_SIZE', default=50000, cast=int)
+ETA_MATRIX_CACHE_TTL_SECONDS = config('ETA_MATRIX_CACHE_TTL_SECONDS', default=900, cast=int)
+TRAVEL_TIME_MODEL_PATH = config('TRAVEL_TIME_MODEL_PATH', default=str(BASE_DIR / 'data' / 'travel_time_model.npz'))  # built nightly by manage.py build_travel_time_model
+TRAVEL_TIME_MODEL_CHECK_SECONDS = config('TRAVEL_TIME_MODEL_CHECK_SECONDS', default=300, cast=int)  # how often workers look for a rebuilt model
+TRAVEL_TIME_ZONE_DEGREES = config('TRAVEL_TIME_ZONE_DEGREES', default=0.02, cast=float)  # ~2.2 km zones, widened for large areas
+TRAVEL_TIME_HISTORY_DAYS = config('TRAVEL_TIME_HISTORY_DAYS', default=90, cast=int)
+
+# Geocoding
+GEOCODER_GAZETTEER_PATH = config('GEOCODER_GAZETTEER_PATH', default=str(BASE_DIR / 'data' / 'gazetteer.csv'))  # built by manage.py build_gazetteer
+GEOCODER_CHECK_SECONDS = config('GEOCODER_CHECK_SECONDS', default=300, cast=int)  # how often workers look for a changed gazetteer
+GEOCODER_REVERSE_MAX_KM = config('GEOCODER_REVERSE_MAX_KM', default=0.5, cast=float)  # nothing named closer than this: no address
+GEOCODER_FAVORITE_RADIUS_METERS = config('GEOCODER_FAVORITE_RADIUS_METERS', default=50, cast=float)  # a saved place this close names the point
+GEOCODER_USER_CACHE_SIZE = config('GEOCODER_USER_CACHE_SIZE', default=5000, cast=int)  # users whose saved places are indexed
+GEOCODER_USER_CACHE_TTL_SECONDS = config('GEOCODER_USER_CACHE_TTL_SECONDS', default=600, cast=int)
+REVERSE_GEOCODE_CELL_DEGREES = config('REVERSE_GEOCODE_CELL_DEGREES', default=0.0002, cast=float)  # ~22 m; points in one cell share an address
+REVERSE_GEOCODE_CACHE_SIZE = config('REVERSE_GEOCODE_CACHE_SIZE', default=50000, cast=int)
+REVERSE_GEOCODE_CACHE_TTL_SECONDS = config('REVERSE_GEOCODE_CACHE_TTL_SECONDS', default=86400, cast=int)  # also cleared when the gazetteer reloads
+REVERSE_GEOCODE_WARMUP_RIDES = config('REVERSE_GEOCODE_WARMUP_RIDES', default=2000, cast=int)  # recent rides whose endpoints are cached up front; 0 disables
+REVERSE_GEOCODE_WARMUP_MIN_RIDERS = config('REVERSE_GEOCODE_WARMUP_MIN_RIDERS', default=3, cast=int)  # riders sharing a recorded address before it names a cell
+
+# Pricing
+SURGE_ZONE_DEGREES = config('SURGE_ZONE_DEGREES', default=0.02, cast=float)  # ~2.2 km pricing zones
+SURGE_WINDOW_SECONDS = config('SURGE_WINDOW_SECONDS', default=600, cast=int)  # demand look-back window
+SURGE_BUCKET_SECONDS = config('SURGE_BUCKET_SECONDS', default=30, cast=int)
+SURGE_TICK_SECONDS = config('SURGE_TICK_SECONDS', default=5, cast=int)
+SURGE_RESEED_SECONDS = config('SURGE_RESEED_SECONDS', default=300, cast=int)  # resync counters from the DB
+FARE_QUOTE_CELL_DEGREES = config('FARE_QUOTE_CELL_DEGREES', default=0.001, cast=float)  # ~110 m; quotes are shared per O/D cell pair
+FARE_QUOTE_CACHE_SIZE = config('FARE_QUOTE_CACHE_SIZE', default=10000, cast=int)
+FARE_QUOTE_CACHE_TTL_SECONDS = config('FARE_QUOTE_CACHE_TTL_SECONDS', default=60, cast=int)
+TARIFF_CHECK_SECONDS = config('TARIFF_CHECK_SECONDS', default=5, cast=int)  # how soon other workers pick up tariff edits
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -10,7 +10,10 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from rides.background import start_background_workers
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rideshare.settings')
 
 application = get_wsgi_application()
+
+start_background_workers()